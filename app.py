@@ -2,20 +2,25 @@
 # - Assign Counts: added "Paste LOT Numbers (optional)" (CustomerLotReference) and LOT-based assignment
 # - Preserves all rules: 20-min lock, Central time CC_TZ, per-pallet only for bulk, TUN=racks, sound/vibration ON, bilingual, post-submit UX, dashboard downloads, Issue Type + Actual Pallet/LOT
 # - 'Assign to (name)' is a fixed dropdown (ASSIGN_NAME_OPTIONS) — includes Eric (corrected) and Aldo
-import os, time, uuid, re, json
-from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
+import os, time, uuid, re
 import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
+from cc_core import (TZ_NAME, LOCK_MINUTES, PATHS, ASSIGN_COLS, SUBMIT_COLS, SITES, DEFAULT_SITE, set_site,
+                     to_str_frame, qty_str, READ_REPORTS, load_cached_inventory, refresh_inventory,
+                     read_csv_fallback, safe_append_csv,
+                     stamp_pair, day_bounds, mk_id, load_assignments, load_submissions, migrate_timestamps,
+                     lock_active, lot_normalize, ISSUE_TYPES, claim_assignment, submit_count,
+                     scan_claim, COVERAGE_ZONES, is_bulk_location, coverage_since, coverage_summary, coverage_by_day,
+                     coverage_pallets, uncounted_locations, recount_rules, save_recount_rules, generate_recounts, FEED_FORMATS, feed_watermark, feed_delta, feed_bytes, feed_commit,
+                     start_lease_sweeper, start_writeback, writeback_status, start_warmup, warm_ready, warm_wait, warm_status, inventory_locations,
+                     save_inventory_mapping, load_inventory_mapping, normalize_inventory_df, ingest_inventory, excel_sheet_names)
+import cc_perf
+from cc_perf import timed
 # ===== Constants / Options =====
 ASSIGN_NAME_OPTIONS = ["Alex","Carlos","Clayton","Cody","Enrique","Eric","James","Jake","Johntai","Karen","Kevin","Luis","Nyahok","Stephanie","Tyteanna","Aldo"]
 APP_NAME = "Cycle Counting"
 VERSION = "v1.6.3 (Bulk: per-pallet only; TUN=racks; LOT paste assign)"
-TZ_NAME = os.getenv("CC_TZ", "America/Chicago")
-LOCK_MINUTES_DEFAULT = 20
-LOCK_MINUTES = int(os.getenv("CC_LOCK_MINUTES", LOCK_MINUTES_DEFAULT))
-TS_FMT = "%m/%d/%Y %I:%M:%S %p"
 DEFAULT_MAPPING = {
     "location":"LocationName",
     "sku":"WarehouseSku",
@@ -49,7 +54,7 @@ I18N = {
   "assignment_id":"Assignment ID","assignee":"Assignee","scan_location":"Scan Location","scan_pallet":"Scan Pallet ID (optional)",
   "sku":"SKU (optional)","lot":"LOT Number (optional)","expected_qty":"Expected QTY (from Assignment/Inventory)","counted_qty":"Counted QTY",
   "note":"Note (optional)","submit_count":"Submit Count","warn_need_fields":"Assignee and Location are required.",
-  "warn_count_invalid":"Enter a valid non-negative integer for Counted QTY.","submitted_ok":"Submitted",
+  "warn_count_invalid":"Enter a valid non-negative integer for Counted QTY.","warn_expected_invalid":"Expected QTY must be a non-negative integer (got {value}).","submitted_ok":"Submitted",
   "dash_title":"Dashboard (Live)","auto_refresh_sec":"Auto-refresh every (seconds)","subs_file":"Submissions file",
   "counts_today":"Counts Today","over":"Over","short":"Short","match":"Match","latest_subs":"Latest Submissions",
   "disc_title":"Discrepancies","exceptions":"Exceptions","export_ex":"Export Exceptions CSV",
@@ -58,7 +63,37 @@ I18N = {
   "active_paths":"Active paths:","inv_upload_title":"Inventory Excel — Upload & Map","inv_cache_loaded":"Inventory cache loaded: {n} rows",
   "preview_first10":"Preview (first 10 rows):","column_mapping":"Column Mapping","map_loc":"Location","map_sku":"SKU","map_lot":"LOT Number",
   "map_pal":"Pallet ID","map_qty":"Expected QTY","save_map":"Save Mapping & Cache Inventory","excel_err":"Excel load/mapping error: {err}",
-  "no_data":"No data","download_subs":"Download Submissions Log"
+  "no_data":"No data","download_subs":"Download Submissions Log",
+  "diag_title":"Diagnostics","perf_enable":"Enable performance instrumentation","perf_log":"Perf log",
+  "perf_all":"Per operation (recent, this server process)","perf_run":"This rerun","perf_none":"No timings recorded yet. Enable instrumentation and use the app.",
+  "perf_clear":"Clear timings","bad_lines":"Skipped {n} malformed line(s): {sample}",
+  "read_issues":"Files with skipped lines or undecodable bytes","site":"Site / Warehouse",
+  "scan_first":"Scan pallet ID or location","scan_ready":"{msg} — {loc} / {pallet}",
+  "scan_no_match":"No open assignment for {code}.","scan_ambiguous":"{n} open assignments at {code} — scan the pallet ID.",
+  "err_need_name":"Enter your name in My Assignments first.",
+  "feed_title":"Change feed export (WMS)","feed_consumer":"Consumer","feed_format":"Format",
+  "feed_prepare":"Prepare changes since last export","feed_counts":"{subs} new submission(s), {changes} assignment status change(s).",
+  "feed_dl_subs":"Download submissions delta","feed_dl_assign":"Download assignment changes",
+  "feed_commit":"Mark as exported","feed_committed":"Watermark saved for {consumer}.",
+  "feed_wm":"Last export: {id} · {ts}","feed_never":"No exports yet for this consumer (first export is the full history).",
+  "feed_bad_consumer":"Consumer may only use letters, digits, '.', '_' or '-'.",
+  "inv_refresh":"Inventory refreshed in {ms} ms: +{added} added, −{removed} removed, {moved} moved, {qty} qty changed, {attr} SKU/LOT changed ({rows:,} rows).",
+  "inv_refresh_assign":"Updated {qty} open assignment(s) with new expected QTY; {moved} followed a moved pallet.",
+  "inv_refresh_none":"No inventory changes ({rows:,} rows); nothing rewritten.","inv_changes":"Inventory changes",
+  "inv_all_sheets":"Ingest every sheet of every file (same column mapping)",
+  "rc_title":"Automatic recounts","rc_enabled":"Create recounts for new Over/Short submissions",
+  "rc_min_abs":"Min |variance| (units)","rc_min_pct":"Min |variance| % of expected",
+  "rc_issue":"Always recount these issue types","rc_repeat_days":"Repeat window (days)","rc_repeat_count":"Recount at N exceptions per location (0 = off)",
+  "rc_recounts":"Also recount recounts","rc_save":"Save recount rules","rc_saved":"Recount rules saved.",
+  "rc_run":"Check new submissions now","rc_result":"{scanned} new submission(s), {exceptions} Over/Short, {created} recount(s) created.",
+  "rc_open":"Open recounts",
+  "cov_title":"Count coverage","cov_period":"Counted within","cov_7":"Last 7 days","cov_30":"Last 30 days",
+  "cov_by":"Group by","cov_zone":"Zone","cov_aisle":"Aisle","cov_locs":"Locations counted","cov_pallets":"Pallets counted",
+  "cov_by_day":"Locations counted per day (% of inventory locations)","cov_uncounted":"Uncounted locations","cov_all_zones":"All zones",
+  "cov_dl":"Download uncounted locations","cov_none":"Upload inventory in Settings to see coverage.",
+  "inv_ingested":"Ingested {parts} part(s) with {workers} worker process(es) in {ms} ms: {rows_in:,} rows → {rows:,} after removing {dup:,} duplicate(s).",
+  "warming":"Loading inventory and assignments…","warm_title":"Warm start (per site, this server process)","warm_again":"Re-warm now",
+  "wb_title":"Write-back buffer (local → shared log dir)"
  },
  "es":{
   "tab_assign":"Asignar Conteos","tab_my":"Mis Asignaciones","tab_perform":"Realizar Conteo",
@@ -84,7 +119,7 @@ I18N = {
   "assignment_id":"ID de Asignación","assignee":"Asignado a","scan_location":"Escanear Ubicación","scan_pallet":"Escanear ID de Tarima (opcional)",
   "sku":"SKU (opcional)","lot":"Número de Lote (opcional)","expected_qty":"Cantidad Esperada (de Asignación/Inventario)","counted_qty":"Cantidad Contada",
   "note":"Nota (opcional)","submit_count":"Enviar Conteo","warn_need_fields":"Se requieren Asignado a y Ubicación.",
-  "warn_count_invalid":"Ingresa un entero válido (no negativo) para Cantidad Contada.","submitted_ok":"Enviado",
+  "warn_count_invalid":"Ingresa un entero válido (no negativo) para Cantidad Contada.","warn_expected_invalid":"Cantidad Esperada debe ser un entero no negativo (recibido {value}).","submitted_ok":"Enviado",
   "dash_title":"Tablero (En Vivo)","auto_refresh_sec":"Auto-actualizar cada (segundos)","subs_file":"Archivo de Envíos",
   "counts_today":"Conteos Hoy","over":"Sobrante","short":"Faltante","match":"Igual","latest_subs":"Envíos Recientes",
   "disc_title":"Discrepancias","exceptions":"Excepciones","export_ex":"Exportar CSV de Excepciones",
@@ -93,10 +128,43 @@ I18N = {
   "active_paths":"Rutas activas:","inv_upload_title":"Inventario Excel — Cargar y Mapear","inv_cache_loaded":"Inventario cargado: {n} filas",
   "preview_first10":"Vista previa (primeras 10 filas):","column_mapping":"Mapeo de Columnas","map_loc":"Ubicación","map_sku":"SKU",
   "map_lot":"Número de Lote","map_pal":"ID de Tarima","map_qty":"Cantidad Esperada","save_map":"Guardar Mapeo y Cachear Inventario",
-  "excel_err":"Error al cargar/mapear Excel: {err}","no_data":"Sin datos","download_subs":"Descargar Registro de Envíos"
+  "excel_err":"Error al cargar/mapear Excel: {err}","no_data":"Sin datos","download_subs":"Descargar Registro de Envíos",
+  "diag_title":"Diagnóstico","perf_enable":"Activar medición de rendimiento","perf_log":"Registro de rendimiento",
+  "perf_all":"Por operación (reciente, este proceso del servidor)","perf_run":"Esta ejecución","perf_none":"Aún no hay tiempos. Active la medición y use la app.",
+  "perf_clear":"Borrar tiempos","bad_lines":"Se omitieron {n} línea(s) mal formadas: {sample}",
+  "read_issues":"Archivos con líneas omitidas o bytes no legibles","site":"Sitio / Almacén",
+  "scan_first":"Escanee ID de tarima o ubicación","scan_ready":"{msg} — {loc} / {pallet}",
+  "scan_no_match":"No hay asignación abierta para {code}.","scan_ambiguous":"{n} asignaciones abiertas en {code} — escanee el ID de tarima.",
+  "err_need_name":"Primero ingrese su nombre en Mis Asignaciones.",
+  "feed_title":"Exportación de cambios (WMS)","feed_consumer":"Consumidor","feed_format":"Formato",
+  "feed_prepare":"Preparar cambios desde la última exportación","feed_counts":"{subs} envío(s) nuevo(s), {changes} cambio(s) de estado de asignación.",
+  "feed_dl_subs":"Descargar envíos nuevos","feed_dl_assign":"Descargar cambios de asignaciones",
+  "feed_commit":"Marcar como exportado","feed_committed":"Marca de agua guardada para {consumer}.",
+  "feed_wm":"Última exportación: {id} · {ts}","feed_never":"Aún no hay exportaciones para este consumidor (la primera incluye todo el historial).",
+  "feed_bad_consumer":"El consumidor solo puede usar letras, dígitos, '.', '_' o '-'.",
+  "inv_refresh":"Inventario actualizado en {ms} ms: +{added} nuevas, −{removed} eliminadas, {moved} movidas, {qty} con cantidad cambiada, {attr} con SKU/Lote cambiado ({rows:,} filas).",
+  "inv_refresh_assign":"Se actualizaron {qty} asignación(es) abiertas con nueva cantidad esperada; {moved} siguieron a una tarima movida.",
+  "inv_refresh_none":"Sin cambios de inventario ({rows:,} filas); no se reescribió nada.","inv_changes":"Cambios de inventario",
+  "inv_all_sheets":"Ingerir todas las hojas de todos los archivos (mismo mapeo de columnas)",
+  "rc_title":"Reconteos automáticos","rc_enabled":"Crear reconteos para envíos nuevos con Sobrante/Faltante",
+  "rc_min_abs":"Varianza mínima (unidades)","rc_min_pct":"Varianza mínima % de lo esperado",
+  "rc_issue":"Siempre reconteo para estos tipos de problema","rc_repeat_days":"Ventana de repetición (días)","rc_repeat_count":"Reconteo con N excepciones por ubicación (0 = no)",
+  "rc_recounts":"También recontar reconteos","rc_save":"Guardar reglas de reconteo","rc_saved":"Reglas de reconteo guardadas.",
+  "rc_run":"Revisar envíos nuevos ahora","rc_result":"{scanned} envío(s) nuevo(s), {exceptions} con Sobrante/Faltante, {created} reconteo(s) creado(s).",
+  "rc_open":"Reconteos abiertos",
+  "cov_title":"Cobertura de conteo","cov_period":"Contado en","cov_7":"Últimos 7 días","cov_30":"Últimos 30 días",
+  "cov_by":"Agrupar por","cov_zone":"Zona","cov_aisle":"Pasillo","cov_locs":"Ubicaciones contadas","cov_pallets":"Tarimas contadas",
+  "cov_by_day":"Ubicaciones contadas por día (% de ubicaciones del inventario)","cov_uncounted":"Ubicaciones sin contar","cov_all_zones":"Todas las zonas",
+  "cov_dl":"Descargar ubicaciones sin contar","cov_none":"Cargue el inventario en Configuración para ver la cobertura.",
+  "inv_ingested":"Se ingirieron {parts} parte(s) con {workers} proceso(s) en {ms} ms: {rows_in:,} filas → {rows:,} tras quitar {dup:,} duplicado(s).",
+  "warming":"Cargando inventario y asignaciones…","warm_title":"Precarga (por sitio, este proceso del servidor)","warm_again":"Precargar de nuevo",
+  "wb_title":"Búfer de escritura (local → carpeta compartida)"
  },
 }
 
+def _site_default():
+    qp = st.query_params.get("site", "")
+    return qp if qp in SITES else DEFAULT_SITE
 def _lang_default():
     env = (os.getenv("CC_LANG","") or "").strip().lower()
     return "es" if env=="es" else "en"
@@ -109,6 +177,13 @@ def t(key, **fmt):
         try: return s.format(**fmt)
         except Exception: return s
     return s
+# Map cc_core workflow result codes to localized messages
+_CORE_MSG_KEYS={"missing":"err_missing","belongs_to":"err_belongs_to","already_submitted":"err_already_submitted",
+                "locked_other":"err_locked_other","need_fields":"warn_need_fields","count_invalid":"warn_count_invalid","expected_invalid":"warn_expected_invalid",
+                "scan_no_match":"scan_no_match","scan_ambiguous":"scan_ambiguous"}
+def _core_msg(code, info:dict)->str:
+    k=_CORE_MSG_KEYS.get(code)
+    return t(k, **info) if k else str(info.get("msg",""))
 
 # Optional AgGrid
 try:
@@ -118,183 +193,12 @@ except Exception:
     _AGGRID_IMPORTED = False
 AGGRID_ENABLED = (os.getenv("AGGRID_ENABLED","1")=="1") and _AGGRID_IMPORTED
 
-# Paths
-def ensure_dirs(paths): [os.makedirs(p, exist_ok=True) for p in paths]
-def get_paths():
-    base = os.getenv("CYCLE_COUNT_LOG_DIR") or os.getenv("BIN_HELPER_LOG_DIR") or os.path.join(os.getcwd(),"logs")
-    cloud = "/mount/src/bin-helper/logs"
-    active = cloud if os.path.isdir(cloud) else base
-    ensure_dirs([active])
-    return {
-        "root":active,
-        "assign":os.path.join(active,"counts_assignments.csv"),
-        "assign_deleted":os.path.join(active,"counts_assignments_deleted.csv"),
-        "subs":os.path.join(active,"cyclecount_submissions.csv"),
-        "inv_csv":os.path.join(active,"inventory_lookup.csv"),
-        "inv_map":os.path.join(active,"inventory_mapping.json"),
-    }
-PATHS = get_paths()
-
-ASSIGN_COLS = ["assignment_id","assigned_by","assignee","location","sku","lot_number","pallet_id",
-               "expected_qty","priority","status","created_ts","due_date","notes",
-               "lock_owner","lock_start_ts","lock_expires_ts"]
-SUBMIT_COLS = ["submission_id","assignment_id","assignee","location","sku","lot_number","pallet_id",
-               "counted_qty","expected_qty","variance","variance_flag","timestamp","device_id","note",
-               "issue_type","actual_pallet_id","actual_lot_number"]
-
-_ENCODINGS = ["utf-8","cp1252","latin-1"]
-def read_csv_fallback(fp, dtype=str):
-    last=None
-    for enc in _ENCODINGS:
-        try: return pd.read_csv(fp, dtype=dtype, encoding=enc).fillna("")
-        except Exception as e: last=e
-    try:
-        return pd.read_csv(fp, dtype=dtype, encoding="latin-1", on_bad_lines="skip").fillna("")
-    except Exception as e2:
-        raise last or e2
-
-def dataframe_to_csv_utf8(df, out_path): df.to_csv(out_path, index=False, encoding="utf-8")
-def safe_append_csv(path, row:dict, columns:list):
-    exists=os.path.exists(path)
-    df=pd.DataFrame([row], columns=columns)
-    tmp=path+".tmp"
-    if exists:
-        with open(tmp,"a",encoding="utf-8") as f: df.to_csv(f, header=False, index=False)
-        with open(tmp,"rb") as fin, open(path,"ab") as fout: fout.write(fin.read())
-        os.remove(tmp)
-    else:
-        df.to_csv(path, index=False, encoding="utf-8")
-
-def read_csv_locked(path, columns=None):
-    if not os.path.exists(path): return pd.DataFrame(columns=columns or [])
-    for _ in range(5):
-        try: return read_csv_fallback(path, dtype=str)
-        except Exception: time.sleep(0.1)
-    return pd.DataFrame(columns=columns or [])
-
-# Time helpers
-def now_local(): return datetime.now(ZoneInfo(TZ_NAME))
-def now_str(): return now_local().strftime(TS_FMT)
-def mk_id(prefix): return f"{prefix}-{now_local().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6].upper()}"
-def parse_ts(s:str):
-    try:
-        dt=datetime.strptime(s, TS_FMT)
-        return dt.replace(tzinfo=ZoneInfo(TZ_NAME))
-    except Exception:
-        return None
-
-# Inventory helpers
-def lot_normalize(x:str)->str:
-    if x is None or (isinstance(x,float) and pd.isna(x)): return ""
-    s = re.sub(r"\D","", str(x))
-    s = re.sub(r"^0+","", s)
-    return s or ""
-
-def load_assignments():
-    df = read_csv_locked(PATHS["assign"], ASSIGN_COLS)
-    for c in ["lock_owner","lock_start_ts","lock_expires_ts"]:
-        if c not in df.columns: df[c]=""
-    return df
-def save_assignments(df:pd.DataFrame):
-    for c in ASSIGN_COLS:
-        if c not in df.columns: df[c]=""
-    dataframe_to_csv_utf8(df[ASSIGN_COLS], PATHS["assign"])
-
-def load_submissions(): return read_csv_locked(PATHS["subs"], SUBMIT_COLS)
-
-def load_cached_inventory()->pd.DataFrame:
-    if "inv_df" in st.session_state: return st.session_state["inv_df"]
-    if os.path.exists(PATHS["inv_csv"]):
-        try:
-            inv = read_csv_fallback(PATHS["inv_csv"], dtype=str).fillna("")
-            st.session_state["inv_df"]=inv; return inv
-        except Exception: pass
-    return pd.DataFrame(columns=["location","sku","lot_number","pallet_id","expected_qty"])
-
-def save_inventory_cache(df:pd.DataFrame):
-    dataframe_to_csv_utf8(df, PATHS["inv_csv"])
-    st.session_state["inv_df"]=df
-
-def save_inventory_mapping(mapping:dict):
-    with open(PATHS["inv_map"],"w",encoding="utf-8") as f: json.dump(mapping,f,indent=2)
-def load_inventory_mapping()->dict:
-    if os.path.exists(PATHS["inv_map"]):
-        try: return json.load(open(PATHS["inv_map"],"r",encoding="utf-8"))
-        except Exception: return {}
-    return {}
-
-def normalize_inventory_df(df:pd.DataFrame, mapping:dict)->pd.DataFrame:
-    out=pd.DataFrame()
-    out["location"]=df[mapping.get("location","")].astype(str) if mapping.get("location","") in df.columns else ""
-    out["sku"]=df[mapping.get("sku","")].astype(str) if mapping.get("sku","") in df.columns else ""
-    lot_col=mapping.get("lot_number","")
-    out["lot_number"]=df[lot_col].astype(str).map(lot_normalize) if lot_col in df.columns else ""
-    out["pallet_id"]=df[mapping.get("pallet_id","")].astype(str) if mapping.get("pallet_id","") in df.columns else ""
-    qty_col=mapping.get("expected_qty","")
-    if qty_col in df.columns:
-        q=pd.to_numeric(df[qty_col], errors="coerce").fillna("").astype(str)
-        out["expected_qty"]=q
-    else:
-        out["expected_qty"]=""
-    for c in ["location","sku","pallet_id"]:
-        out[c]=out[c].astype(str).str.strip()
-    return out.fillna("")
-
-def inv_lookup_expected(location:str, sku:str="", lot:str="", pallet_id:str=""):
-    inv=load_cached_inventory()
-    if inv.empty or "expected_qty" not in inv.columns: return None
-    loc=(location or "").strip(); sku=(sku or "").strip(); pal=(pallet_id or "").strip(); lotN=lot_normalize(lot)
-    if loc=="" and pal=="" and sku=="" and lotN=="": return None
-    candidates = [
-        ({"location":loc,"pallet_id":pal,"lot_number":lotN,"sku":sku}, True),
-        ({"location":loc,"pallet_id":pal,"lot_number":lotN}, True),
-        ({"location":loc,"pallet_id":pal,"sku":sku}, True),
-        ({"location":loc,"pallet_id":pal}, True),
-        ({"location":loc,"lot_number":lotN,"sku":sku}, True),
-        ({"location":loc,"lot_number":lotN}, True),
-        ({"location":loc,"sku":sku}, True),
-        ({"location":loc}, True),
-    ]
-    df=inv
-    for cond,_ in candidates:
-        tmp=df.copy()
-        for k,v in cond.items():
-            if v!="":
-                tmp = tmp[tmp[k].astype(str).str.strip().str.lower()==str(v).strip().lower()]
-        if not tmp.empty:
-            for val in tmp["expected_qty"].tolist():
-                try: return int(float(val))
-                except Exception: continue
-    return None
-
-# Locks
-def lock_active(row:pd.Series)->bool:
-    exp=parse_ts(row.get("lock_expires_ts","")); return bool(exp and exp>now_local())
-def lock_owned_by(row:pd.Series, user:str)->bool:
-    return (row.get("lock_owner","").strip().lower()==(user or "").strip().lower())
-
-def start_or_renew_lock(assignment_id:str, user:str):
-    if not assignment_id or not user: return False, "Missing assignment or user"
-    df=load_assignments()
-    ix=df.index[df["assignment_id"]==assignment_id]
-    if len(ix)==0: return False, "Assignment not found"
-    i=ix[0]; now=now_local(); exp=now+timedelta(minutes=LOCK_MINUTES)
-    df.loc[i,"status"]="In Progress"
-    df.loc[i,"lock_owner"]=user.strip()
-    df.loc[i,"lock_start_ts"]=now.strftime(TS_FMT)
-    df.loc[i,"lock_expires_ts"]=exp.strftime(TS_FMT)
-    save_assignments(df)
-    return True, f"Locked by {user} until {exp.strftime('%I:%M %p')}"
-
-def validate_lock_for_submit(assignment_id:str, user:str)->(bool,str):
-    if not assignment_id: return True, "Ad-hoc submission"
-    df=load_assignments()
-    row=df[df["assignment_id"]==assignment_id]
-    if row.empty: return True, "Assignment not found; proceeding"
-    r=row.iloc[0]
-    if not lock_active(r): return True, "Lock expired or not set; proceeding"
-    if lock_owned_by(r,user): return True, "Lock valid for user"
-    return False, f"Locked by {r.get('lock_owner','?')} until {r.get('lock_expires_ts','?')}"
+# Background sweeper reverts expired In Progress locks on every site (started once per server process)
+start_lease_sweeper()
+# With CC_WRITEBACK_DIR, writes land on local disk and a background flusher pushes them to the shared log dir
+start_writeback()
+# Parse inventory / locations / assignments / indexes in the background at server start (default site first, up to the cache cap)
+start_warmup()
 
 # Focus & feedback
 def focus_by_label(label_text:str):
@@ -309,18 +213,14 @@ setTimeout(function(){{
 </script>
 """, height=0)
 
-def switch_to_tab(tab_label:str):
-    safe=(tab_label or "").lower()
-    components.html(f"""
-<script>
-setTimeout(function(){{
-  const L="{safe}";
-  const tabs=[...parent.document.querySelectorAll('button[role="tab"]'), ...parent.document.querySelectorAll('[data-baseweb="tab"]')];
-  const target=tabs.find(el => (el.innerText||"").trim().toLowerCase().includes(L));
-  if(target) target.click();
-}},150);
-</script>
-""", height=0)
+def switch_to_tab(tab_label:str, flash:str=""):
+    # Only the active view runs, so switching is a rerun with the new view selected (flash: message shown there)
+    L=(tab_label or "").strip().lower()
+    idx=next((i for i,lab in enumerate(TAB_LABELS) if L and L in lab.lower()), None)
+    if idx is None: return
+    st.session_state["_goto_tab"]=idx
+    if flash: st.session_state["_nav_flash"]=flash
+    st.rerun()
 
 def queue_feedback(kind:str): st.session_state["_feedback_kind"]=kind
 def emit_feedback():
@@ -350,6 +250,7 @@ def emit_feedback():
 def show_table(df, height=300, key=None, selectable=False, selection_mode="single", numeric_cols=None):
     if df is None or (hasattr(df,"empty") and df.empty):
         st.info(t("no_data")); return {"selected_rows":[]}
+    df = to_str_frame(df)
     if AGGRID_ENABLED:
         try:
             gob=GridOptionsBuilder.from_dataframe(df); gob.configure_default_column(resizable=True, filter=True, sortable=True)
@@ -357,21 +258,29 @@ def show_table(df, height=300, key=None, selectable=False, selection_mode="singl
             if numeric_cols:
                 for col in numeric_cols:
                     if col in df.columns: gob.configure_column(col, type=["numericColumn"])
-            return AgGrid(df, gridOptions=gob.build(),
-                          update_mode=(GridUpdateMode.SELECTION_CHANGED if selectable else GridUpdateMode.NO_UPDATE),
-                          height=height, key=key)
+            with timed("grid.render", key=key or "") as rec:
+                if rec: rec["rows"]=len(df)
+                return AgGrid(df, gridOptions=gob.build(),
+                              update_mode=(GridUpdateMode.SELECTION_CHANGED if selectable else GridUpdateMode.NO_UPDATE),
+                              height=height, key=key)
         except Exception as e:
             st.warning(f"AgGrid unavailable, falling back to simple table: {e}")
     st.dataframe(df, use_container_width=True, height=height); return {"selected_rows":[]}
 
 # ===== Page config & defaults =====
 st.set_page_config(page_title=f"{t('app_name')} {VERSION}", layout="wide")
+cc_perf.begin_run()
 _ensure_default("lang", _lang_default())
 _ensure_default("mobile_mode", True)
 _ensure_default("fb_sound", True)
 _ensure_default("fb_vibe", True)
 _ensure_default("auto_focus", True)
 _ensure_default("auto_advance", True)
+_ensure_default("site", _site_default())
+set_site(st.session_state["site"])   # every PATHS lookup below resolves to this session's site
+if not warm_ready():
+    with st.spinner(t("warming")): warm_wait()
+migrate_timestamps()                 # UTC timestamp backfill, once per site per server process
 
 # Header
 left,right = st.columns([0.7,0.3])
@@ -382,555 +291,694 @@ with right:
                        format_func=lambda x: x[1], key="lang_select")
     if sel[0] != st.session_state.get("lang","en"):
         st.session_state["lang"]=sel[0]; st.rerun()
+    if len(SITES)>1:
+        site_names = list(SITES)
+        site_sel = st.selectbox(t("site"), site_names, index=site_names.index(st.session_state["site"]), key="site_select")
+        if site_sel != st.session_state["site"]:
+            st.session_state["site"]=site_sel
+            for k in ["current_assignment","pending_assignment","_perform_loaded_from","_feed","_rc"]: st.session_state.pop(k, None)
+            st.rerun()
 st.caption(t("tip_submit_once"))
-st.caption(f"{t('active_dir')}: {PATHS['root']} · {t('tz')}: {TZ_NAME} · {t('lock')}: {LOCK_MINUTES} {t('minutes')}")
+site_txt = f"{t('site')}: {st.session_state['site']} · " if len(SITES)>1 else ""
+wb_txt = f" → {PATHS['shared']}" if PATHS['shared']!=PATHS['root'] else ""
+st.caption(f"{site_txt}{t('active_dir')}: {PATHS['root']}{wb_txt} · {t('tz')}: {TZ_NAME} · {t('lock')}: {LOCK_MINUTES} {t('minutes')}")
 
 TAB_LABELS=[t("tab_assign"), t("tab_my"), t("tab_perform"), t("tab_dash"), t("tab_disc"), t("tab_settings")]
-tabs = st.tabs(TAB_LABELS)
+TAB_ASSIGN, TAB_MY, TAB_PERFORM, TAB_DASH, TAB_DISC, TAB_SETTINGS = range(len(TAB_LABELS))
+# Navigation is a session-state selector rather than st.tabs: st.tabs runs every tab's code on each rerun,
+# here only the active view loads data and renders. The index survives language switches.
+# Streamlit drops a widget's state when it isn't rendered; re-store the inputs other views rely on
+# (counter name, toggles, half-filled forms) so they survive switching away and back.
+VIEW_STATE_KEYS=["me_name","auto_focus","auto_advance",
+                 "assign_assigned_by","assign_locations_multiselect","assign_locations_paste","assign_lots_paste","bulk_pallets_filter","assign_notes",
+                 "perform_counted_str","perform_note","perform_issue_type","perform_actual_pallet_id","perform_actual_lot_number",
+                 "cov_period","cov_by","cov_zone","feed_format"]
+for k in VIEW_STATE_KEYS:
+    if k in st.session_state: st.session_state[k]=st.session_state[k]
+if "_goto_tab" in st.session_state: st.session_state["nav_tab"]=st.session_state.pop("_goto_tab")
+_ensure_default("nav_tab", TAB_ASSIGN)
+ACTIVE_TAB = st.radio("nav", list(range(len(TAB_LABELS))), format_func=lambda i: TAB_LABELS[i], horizontal=True,
+                      key="nav_tab", label_visibility="collapsed")
+nav_flash = st.session_state.pop("_nav_flash", "")
+if nav_flash: st.success(nav_flash)
 
 # ===== Assign Counts =====
-with tabs[0]:
-    st.subheader(t("assign_title"))
-    c_top1, c_top2 = st.columns(2)
-    with c_top1:
-        assigned_by = st.text_input(t("assigned_by"), key="assign_assigned_by")
-    with c_top2:
-        prev = st.session_state.get("assignee", ASSIGN_NAME_OPTIONS[0])
-        try: idx = ASSIGN_NAME_OPTIONS.index(prev)
-        except ValueError: idx = 0
-        assignee = st.selectbox(t("assign_to"), ASSIGN_NAME_OPTIONS, index=idx, key="assign_assignee_sel")
-        st.session_state["assignee"]=assignee
-
-    inv_df = load_cached_inventory()
-    loc_options=[]
-    if inv_df is not None and hasattr(inv_df,"empty") and not inv_df.empty and "location" in inv_df.columns:
-        loc_options = sorted(inv_df["location"].astype(str).str.strip().replace("nan","").dropna().unique().tolist())
-
-    st.caption(t("hint_assign"))
-    colL, _ = st.columns([1.2,1])
-    with colL:
-        selected_locs = st.multiselect(t("locations"), options=loc_options, default=[], key="assign_locations_multiselect")
-        pasted_locs = st.text_area(t("paste_locs"), height=100, key="assign_locations_paste", placeholder="e.g.\nG001\nTUN01001\n11400804")
-        lots_paste = st.text_area(t("paste_lots"), height=80, key="assign_lots_paste", placeholder="e.g.\n9062716\n9063615")
-
-    # parse lists
-    pasted_loc_list = [ln.strip() for ln in pasted_locs.splitlines() if ln.strip()] if pasted_locs else []
-    seen=set(); loc_merge=[]
-    for s in selected_locs + pasted_loc_list:
-        if s not in seen:
-            loc_merge.append(s); seen.add(s)
-
-    # LOT list normalize
-    lots_raw=[]
-    if lots_paste:
-        for chunk in re.split(r"[\s,;]+", lots_paste):
-            c=chunk.strip()
-            if c: lots_raw.append(c)
-    lots_norm = [lot_normalize(x) for x in lots_raw if lot_normalize(x)!=""]
-    lots_set = set(lots_norm)
-
-    # If LOTs pasted, union in all locations from inventory where LOT matches
-    if lots_set and inv_df is not None and not inv_df.empty and "lot_number" in inv_df.columns:
-        hits = inv_df[inv_df["lot_number"].astype(str).map(lot_normalize).isin(lots_set)]
-        for loc in sorted(hits["location"].astype(str).str.strip().tolist()):
-            if loc not in seen:
-                loc_merge.append(loc); seen.add(loc)
-
-    with st.expander("Bulk options"):
-        st.caption("Rule: Bulk = not 8-digit and not starting with 'TUN' (TUN are racks). Per-pallet only.")
-        pal_filter_txt = st.text_area("Pallet IDs filter (optional: comma/space/newline separated; blank = all in location)", key="bulk_pallets_filter", height=80)
-    notes = st.text_area(t("notes"), height=80, key="assign_notes")
-
-    disabled = (not assigned_by) or (not assignee) or (len(loc_merge)==0)
-    def parse_pallet_filter(txt:str):
-        if not txt: return set()
-        parts = re.split(r"[\s,;]+", str(txt))
-        return set([p.strip() for p in parts if p.strip()])
-    pal_filter = parse_pallet_filter(st.session_state.get("bulk_pallets_filter",""))
-
-    if st.button(t("create_assign"), type="primary", disabled=disabled, key="assign_create_btn", use_container_width=True):
-        dfA = load_assignments()
-        created=0; dup_conflicts=[]; locked_conflicts=[]; not_in_cache=[]; bulk_summary=[]
-        def is_bulk_location(loc:str)->bool:
-            s=(loc or "").strip().upper()
-            return not (bool(re.fullmatch(r"\d{8}", s)) or s.startswith("TUN"))
-        def _any_lock_active_for(loc, pallet_id=None):
-            if dfA is None or dfA.empty: return False
-            try:
-                same = dfA[dfA["location"].astype(str).str.strip().str.lower()==str(loc).strip().lower()]
-                if pallet_id is not None and "pallet_id" in same.columns:
-                    same = same[same["pallet_id"].astype(str).str.strip().str.lower()==str(pallet_id).strip().lower()]
-            except Exception:
+if ACTIVE_TAB==TAB_ASSIGN:
+    with timed("tab.assign"):
+        st.subheader(t("assign_title"))
+        c_top1, c_top2 = st.columns(2)
+        with c_top1:
+            assigned_by = st.text_input(t("assigned_by"), key="assign_assigned_by")
+        with c_top2:
+            prev = st.session_state.get("assignee", ASSIGN_NAME_OPTIONS[0])
+            try: idx = ASSIGN_NAME_OPTIONS.index(prev)
+            except ValueError: idx = 0
+            assignee = st.selectbox(t("assign_to"), ASSIGN_NAME_OPTIONS, index=idx, key="assign_assignee_sel")
+            st.session_state["assignee"]=assignee
+
+        inv_df = load_cached_inventory()
+        loc_options = inventory_locations()
+
+        st.caption(t("hint_assign"))
+        colL, _ = st.columns([1.2,1])
+        with colL:
+            selected_locs = st.multiselect(t("locations"), options=loc_options, key="assign_locations_multiselect")
+            pasted_locs = st.text_area(t("paste_locs"), height=100, key="assign_locations_paste", placeholder="e.g.\nG001\nTUN01001\n11400804")
+            lots_paste = st.text_area(t("paste_lots"), height=80, key="assign_lots_paste", placeholder="e.g.\n9062716\n9063615")
+
+        # parse lists
+        pasted_loc_list = [ln.strip() for ln in pasted_locs.splitlines() if ln.strip()] if pasted_locs else []
+        seen=set(); loc_merge=[]
+        for s in selected_locs + pasted_loc_list:
+            if s not in seen:
+                loc_merge.append(s); seen.add(s)
+
+        # LOT list normalize
+        lots_raw=[]
+        if lots_paste:
+            for chunk in re.split(r"[\s,;]+", lots_paste):
+                c=chunk.strip()
+                if c: lots_raw.append(c)
+        lots_norm = [lot_normalize(x) for x in lots_raw if lot_normalize(x)!=""]
+        lots_set = set(lots_norm)
+
+        # If LOTs pasted, union in all locations from inventory where LOT matches
+        if lots_set and inv_df is not None and not inv_df.empty and "lot_number" in inv_df.columns:
+            hits = inv_df[inv_df["lot_number"].astype(str).map(lot_normalize).isin(lots_set)]
+            for loc in sorted(hits["location"].astype(str).str.strip().tolist()):
+                if loc not in seen:
+                    loc_merge.append(loc); seen.add(loc)
+
+        with st.expander("Bulk options"):
+            st.caption("Rule: Bulk = not 8-digit and not starting with 'TUN' (TUN are racks). Per-pallet only.")
+            pal_filter_txt = st.text_area("Pallet IDs filter (optional: comma/space/newline separated; blank = all in location)", key="bulk_pallets_filter", height=80)
+        notes = st.text_area(t("notes"), height=80, key="assign_notes")
+
+        disabled = (not assigned_by) or (not assignee) or (len(loc_merge)==0)
+        def parse_pallet_filter(txt:str):
+            if not txt: return set()
+            parts = re.split(r"[\s,;]+", str(txt))
+            return set([p.strip() for p in parts if p.strip()])
+        pal_filter = parse_pallet_filter(st.session_state.get("bulk_pallets_filter",""))
+
+        if st.button(t("create_assign"), type="primary", disabled=disabled, key="assign_create_btn", use_container_width=True):
+            dfA = load_assignments()
+            created_disp, created_iso = stamp_pair()
+            created=0; dup_conflicts=[]; locked_conflicts=[]; not_in_cache=[]; bulk_summary=[]
+            def _any_lock_active_for(loc, pallet_id=None):
+                if dfA is None or dfA.empty: return False
+                try:
+                    same = dfA[dfA["location"].astype(str).str.strip().str.lower()==str(loc).strip().lower()]
+                    if pallet_id is not None and "pallet_id" in same.columns:
+                        same = same[same["pallet_id"].astype(str).str.strip().str.lower()==str(pallet_id).strip().lower()]
+                except Exception:
+                    return False
+                for _,r in same.iterrows():
+                    if lock_active(r): return True
                 return False
-            for _,r in same.iterrows():
-                if lock_active(r): return True
-            return False
-
-        for loc in loc_merge:
-            loc_s = str(loc).strip()
-            is_bulk = is_bulk_location(loc_s)
-
-            # Track if location exists in cache
-            if inv_df is not None and not inv_df.empty:
-                if loc_s not in set(inv_df["location"].astype(str).str.strip().tolist()):
-                    not_in_cache.append(loc_s)
-
-            # Candidate inventory for this location, optionally narrowed by LOTs
-            cand_inv = inv_df[(inv_df["location"].astype(str).str.strip().str.lower()==loc_s.lower())] if (inv_df is not None and not inv_df.empty) else pd.DataFrame()
-            if lots_set and not cand_inv.empty and "lot_number" in cand_inv.columns:
-                cand_inv = cand_inv[cand_inv["lot_number"].astype(str).map(lot_normalize).isin(lots_set)]
-
-            if is_bulk:
-                # per-pallet expansion only
-                if cand_inv is None or cand_inv.empty:
-                    # placeholder single assignment if we have nothing in cache
-                    row = {
-                        "assignment_id": mk_id("CC"),
-                        "assigned_by": assigned_by.strip(),
-                        "assignee": assignee.strip(),
-                        "location": loc_s,
-                        "sku":"", "lot_number":"", "pallet_id":"",
-                        "expected_qty":"", "priority":"Normal","status":"Assigned",
-                        "created_ts": now_str(), "due_date":"", "notes": (st.session_state.get("assign_notes","") or "").strip(),
-                        "lock_owner":"", "lock_start_ts":"", "lock_expires_ts":""
-                    }
-                    safe_append_csv(PATHS["assign"], row, ASSIGN_COLS); created+=1
-                    continue
-                ps = cand_inv["pallet_id"].astype(str).str.strip()
-                pallets = ps[(ps!="") & (ps.str.lower()!="nan")].unique().tolist()
-                if pal_filter: pallets = [p for p in pallets if p in pal_filter]
-
-                if not pallets:
-                    # no pallets after filter -> single placeholder using first row
-                    r0 = cand_inv.iloc[0]
-                    def _norm_int(v):
-                        try: return str(int(float(v))) if str(v)!="" else ""
-                        except Exception: return (str(v) if str(v)!="" else "")
-                    row = {
-                        "assignment_id": mk_id("CC"),
-                        "assigned_by": assigned_by.strip(),
-                        "assignee": assignee.strip(),
-                        "location": loc_s,
-                        "sku": str(r0.get("sku","")),
-                        "lot_number": lot_normalize(r0.get("lot_number","")),
-                        "pallet_id": "",
-                        "expected_qty": _norm_int(r0.get("expected_qty","")),
-                        "priority":"Normal","status":"Assigned",
-                        "created_ts": now_str(),"due_date":"", "notes": (st.session_state.get("assign_notes","") or "").strip(),
-                        "lock_owner":"", "lock_start_ts":"", "lock_expires_ts":""
-                    }
-                    safe_append_csv(PATHS["assign"], row, ASSIGN_COLS); created+=1
-                    continue
-                made=0
-                for pal in pallets:
-                    # dup/lock check on location+pallet
-                    is_dup=False
-                    if dfA is not None and not dfA.empty:
-                        cand = dfA[
-                            (dfA["location"].astype(str).str.strip().str.lower()==loc_s.lower()) &
-                            (dfA["status"].isin(["Assigned","In Progress"])) &
-                            (dfA["pallet_id"].astype(str).str.strip().str.lower()==str(pal).strip().lower())
-                        ]
-                        is_dup = not cand.empty
-                    if is_dup:
-                        dup_conflicts.append(f"{loc_s}:{pal}"); continue
-                    if _any_lock_active_for(loc_s, pal):
-                        locked_conflicts.append(f"{loc_s}:{pal}"); continue
-                    rmatch = cand_inv[cand_inv["pallet_id"].astype(str).str.strip().str.lower()==str(pal).strip().lower()].iloc[0]
-                    def _norm_int(v):
-                        try: return str(int(float(v))) if str(v)!="" else ""
-                        except Exception: return (str(v) if str(v)!="" else "")
-                    row = {
-                        "assignment_id": mk_id("CC"),
-                        "assigned_by": assigned_by.strip(),
-                        "assignee": assignee.strip(),
-                        "location": loc_s,
-                        "sku": str(rmatch.get("sku","")),
-                        "lot_number": lot_normalize(rmatch.get("lot_number","")),
-                        "pallet_id": str(pal),
-                        "expected_qty": _norm_int(rmatch.get("expected_qty","")),
-                        "priority":"Normal","status":"Assigned",
-                        "created_ts": now_str(), "due_date":"", "notes": (st.session_state.get("assign_notes","") or "").strip(),
-                        "lock_owner":"", "lock_start_ts":"", "lock_expires_ts":""
-                    }
-                    safe_append_csv(PATHS["assign"], row, ASSIGN_COLS); created+=1; made+=1
-                if made>0: bulk_summary.append(f"{loc_s} → {made} pallet assignments")
-                continue
-            # Racks (8-digit or TUN): single assignment per location
-            is_dup=False
-            if dfA is not None and not dfA.empty:
-                cand = dfA[
-                    (dfA["location"].astype(str).str.strip().str.lower()==loc_s.lower()) &
-                    (dfA["status"].isin(["Assigned","In Progress"]))
-                ]
-                is_dup = not cand.empty
-            if is_dup:
-                dup_conflicts.append(loc_s); continue
-            if _any_lock_active_for(loc_s, None):
-                locked_conflicts.append(loc_s); continue
-
-            sku=lot_num=pallet=""; expected=""
-            try:
-                cand2 = cand_inv if (cand_inv is not None and not cand_inv.empty) else (
-                    inv_df[inv_df["location"].astype(str).str.strip().str.lower()==loc_s.lower()] if inv_df is not None and not inv_df.empty else None
-                )
-                if cand2 is not None and not cand2.empty:
-                    r0 = cand2.iloc[0]
-                    sku = str(r0.get("sku","")); lot_num = lot_normalize(r0.get("lot_number","")); pallet=str(r0.get("pallet_id",""))
-                    try:
-                        expected = str(int(float(r0.get("expected_qty","")))) if str(r0.get("expected_qty",""))!="" else ""
-                    except Exception:
-                        expected = str(r0.get("expected_qty","")) if str(r0.get("expected_qty",""))!="" else ""
-            except Exception:
-                pass
-            row = {
-                "assignment_id": mk_id("CC"),
-                "assigned_by": assigned_by.strip(),
-                "assignee": assignee.strip(),
-                "location": loc_s,
-                "sku": sku, "lot_number": lot_num, "pallet_id": pallet,
-                "expected_qty": expected, "priority":"Normal","status":"Assigned",
-                "created_ts": now_str(), "due_date":"", "notes": (st.session_state.get("assign_notes","") or "").strip(),
-                "lock_owner":"", "lock_start_ts":"", "lock_expires_ts":""
-            }
-            safe_append_csv(PATHS["assign"], row, ASSIGN_COLS); created+=1
-
-        if created>0:
-            st.success(t("created_n", n=created, name=assignee)); queue_feedback("success")
-        if bulk_summary: st.info("Bulk expanded: " + "; ".join(bulk_summary))
-        if dup_conflicts:
-            sample=", ".join(map(str, dup_conflicts[:10])) + ("…" if len(dup_conflicts)>10 else "")
-            st.warning(t("dup_skipped", n=len(dup_conflicts), sample=sample))
-        if locked_conflicts:
-            st.warning(t("locked_skipped", n=len(locked_conflicts)))
-        if not_in_cache:
-            sample=", ".join(map(str, not_in_cache[:10])) + ("…" if len(not_in_cache)>10 else "")
-            st.info(t("not_in_cache", n=len(not_in_cache), sample=sample))
-
-    # Show all assignments table
-    dfA = load_assignments()
-    if not dfA.empty:
-        def _lock_info(r):
-            if lock_active(r):
-                who=r.get("lock_owner","?"); until=r.get("lock_expires_ts","")
-                return t("locked_by_until", who=who, until=until)
-            return t("available")
-        dfA_disp = dfA.copy(); dfA_disp["lock_info"]=dfA_disp.apply(_lock_info, axis=1)
-        st.write(t("all_assign"))
-        show_table(dfA_disp, height=300, key="grid_all_assign")
-    else:
-        st.info(t("no_assign"))
 
-# ===== My Assignments =====
-with tabs[1]:
-    st.subheader(t("my_title"))
-    me = st.text_input(t("i_am"), key="me_name", value=st.session_state.get("assignee",""))
-    dfA = load_assignments()
-    mine = (dfA[(dfA["assignee"].str.lower()==(me or "").lower()) & (dfA["status"]!="Submitted")]) if me else dfA.iloc[0:0]
-    cA, cB, cC, cD = st.columns(4)
-    cA.metric(t("open"), int((mine["status"]=="Assigned").sum()))
-    cB.metric(t("in_progress"), int((mine["status"]=="In Progress").sum()))
-    cC.metric(t("submitted"), int((mine["status"]=="Submitted").sum()))
-    cD.metric(t("total"), int(len(mine)))
-    st.write(t("your_assign"))
-    selected_dict=None
-    if not mine.empty:
-        if AGGRID_ENABLED:
-            def _lock_info2(r):
+            for loc in loc_merge:
+                loc_s = str(loc).strip()
+                is_bulk = is_bulk_location(loc_s)
+
+                # Track if location exists in cache
+                if inv_df is not None and not inv_df.empty:
+                    if loc_s not in set(inv_df["location"].astype(str).str.strip().tolist()):
+                        not_in_cache.append(loc_s)
+
+                # Candidate inventory for this location, optionally narrowed by LOTs
+                cand_inv = inv_df[(inv_df["location"].astype(str).str.strip().str.lower()==loc_s.lower())] if (inv_df is not None and not inv_df.empty) else pd.DataFrame()
+                if lots_set and not cand_inv.empty and "lot_number" in cand_inv.columns:
+                    cand_inv = cand_inv[cand_inv["lot_number"].astype(str).map(lot_normalize).isin(lots_set)]
+
+                if is_bulk:
+                    # per-pallet expansion only
+                    if cand_inv is None or cand_inv.empty:
+                        # placeholder single assignment if we have nothing in cache
+                        row = {
+                            "assignment_id": mk_id("CC"),
+                            "assigned_by": assigned_by.strip(),
+                            "assignee": assignee.strip(),
+                            "location": loc_s,
+                            "sku":"", "lot_number":"", "pallet_id":"",
+                            "expected_qty":"", "priority":"Normal","status":"Assigned",
+                            "created_ts": created_disp, "due_date":"", "notes": (st.session_state.get("assign_notes","") or "").strip(),
+                            "lock_owner":"", "lock_start_ts":"", "lock_expires_ts":"", "created_utc": created_iso
+                        }
+                        safe_append_csv(PATHS["assign"], row, ASSIGN_COLS); created+=1
+                        continue
+                    ps = cand_inv["pallet_id"].astype(str).str.strip()
+                    pallets = ps[(ps!="") & (ps.str.lower()!="nan")].unique().tolist()
+                    if pal_filter: pallets = [p for p in pallets if p in pal_filter]
+
+                    if not pallets:
+                        # no pallets after filter -> single placeholder using first row
+                        r0 = cand_inv.iloc[0]
+                        row = {
+                            "assignment_id": mk_id("CC"),
+                            "assigned_by": assigned_by.strip(),
+                            "assignee": assignee.strip(),
+                            "location": loc_s,
+                            "sku": str(r0.get("sku","")),
+                            "lot_number": lot_normalize(r0.get("lot_number","")),
+                            "pallet_id": "",
+                            "expected_qty": qty_str(r0.get("expected_qty","")),
+                            "priority":"Normal","status":"Assigned",
+                            "created_ts": created_disp,"due_date":"", "notes": (st.session_state.get("assign_notes","") or "").strip(),
+                            "lock_owner":"", "lock_start_ts":"", "lock_expires_ts":"", "created_utc": created_iso
+                        }
+                        safe_append_csv(PATHS["assign"], row, ASSIGN_COLS); created+=1
+                        continue
+                    made=0
+                    for pal in pallets:
+                        # dup/lock check on location+pallet
+                        is_dup=False
+                        if dfA is not None and not dfA.empty:
+                            cand = dfA[
+                                (dfA["location"].astype(str).str.strip().str.lower()==loc_s.lower()) &
+                                (dfA["status"].isin(["Assigned","In Progress"])) &
+                                (dfA["pallet_id"].astype(str).str.strip().str.lower()==str(pal).strip().lower())
+                            ]
+                            is_dup = not cand.empty
+                        if is_dup:
+                            dup_conflicts.append(f"{loc_s}:{pal}"); continue
+                        if _any_lock_active_for(loc_s, pal):
+                            locked_conflicts.append(f"{loc_s}:{pal}"); continue
+                        rmatch = cand_inv[cand_inv["pallet_id"].astype(str).str.strip().str.lower()==str(pal).strip().lower()].iloc[0]
+                        row = {
+                            "assignment_id": mk_id("CC"),
+                            "assigned_by": assigned_by.strip(),
+                            "assignee": assignee.strip(),
+                            "location": loc_s,
+                            "sku": str(rmatch.get("sku","")),
+                            "lot_number": lot_normalize(rmatch.get("lot_number","")),
+                            "pallet_id": str(pal),
+                            "expected_qty": qty_str(rmatch.get("expected_qty","")),
+                            "priority":"Normal","status":"Assigned",
+                            "created_ts": created_disp, "due_date":"", "notes": (st.session_state.get("assign_notes","") or "").strip(),
+                            "lock_owner":"", "lock_start_ts":"", "lock_expires_ts":"", "created_utc": created_iso
+                        }
+                        safe_append_csv(PATHS["assign"], row, ASSIGN_COLS); created+=1; made+=1
+                    if made>0: bulk_summary.append(f"{loc_s} → {made} pallet assignments")
+                    continue
+                # Racks (8-digit or TUN): single assignment per location
+                is_dup=False
+                if dfA is not None and not dfA.empty:
+                    cand = dfA[
+                        (dfA["location"].astype(str).str.strip().str.lower()==loc_s.lower()) &
+                        (dfA["status"].isin(["Assigned","In Progress"]))
+                    ]
+                    is_dup = not cand.empty
+                if is_dup:
+                    dup_conflicts.append(loc_s); continue
+                if _any_lock_active_for(loc_s, None):
+                    locked_conflicts.append(loc_s); continue
+
+                sku=lot_num=pallet=""; expected=""
+                try:
+                    cand2 = cand_inv if (cand_inv is not None and not cand_inv.empty) else (
+                        inv_df[inv_df["location"].astype(str).str.strip().str.lower()==loc_s.lower()] if inv_df is not None and not inv_df.empty else None
+                    )
+                    if cand2 is not None and not cand2.empty:
+                        r0 = cand2.iloc[0]
+                        sku = str(r0.get("sku","")); lot_num = lot_normalize(r0.get("lot_number","")); pallet=str(r0.get("pallet_id",""))
+                        expected = qty_str(r0.get("expected_qty",""))
+                except Exception:
+                    pass
+                row = {
+                    "assignment_id": mk_id("CC"),
+                    "assigned_by": assigned_by.strip(),
+                    "assignee": assignee.strip(),
+                    "location": loc_s,
+                    "sku": sku, "lot_number": lot_num, "pallet_id": pallet,
+                    "expected_qty": expected, "priority":"Normal","status":"Assigned",
+                    "created_ts": created_disp, "due_date":"", "notes": (st.session_state.get("assign_notes","") or "").strip(),
+                    "lock_owner":"", "lock_start_ts":"", "lock_expires_ts":"", "created_utc": created_iso
+                }
+                safe_append_csv(PATHS["assign"], row, ASSIGN_COLS); created+=1
+
+            if created>0:
+                st.success(t("created_n", n=created, name=assignee)); queue_feedback("success")
+            if bulk_summary: st.info("Bulk expanded: " + "; ".join(bulk_summary))
+            if dup_conflicts:
+                sample=", ".join(map(str, dup_conflicts[:10])) + ("…" if len(dup_conflicts)>10 else "")
+                st.warning(t("dup_skipped", n=len(dup_conflicts), sample=sample))
+            if locked_conflicts:
+                st.warning(t("locked_skipped", n=len(locked_conflicts)))
+            if not_in_cache:
+                sample=", ".join(map(str, not_in_cache[:10])) + ("…" if len(not_in_cache)>10 else "")
+                st.info(t("not_in_cache", n=len(not_in_cache), sample=sample))
+
+        # Show all assignments table
+        dfA = load_assignments(typed=True)
+        if not dfA.empty:
+            def _lock_info(r):
                 if lock_active(r):
                     who=r.get("lock_owner","?"); until=r.get("lock_expires_ts","")
-                    you = "You" if st.session_state.get("lang","en")=="en" else "Tú"
-                    who_disp = you if (who or "").lower()==(me or "").lower() else who
-                    return t("locked_by_until", who=who_disp, until=until)
+                    return t("locked_by_until", who=who, until=until)
                 return t("available")
-            mine_disp = mine.copy(); mine_disp["lock_info"]=mine_disp.apply(_lock_info2, axis=1)
-            res = show_table(mine_disp, height=300, key="grid_my_assign", selectable=True, selection_mode="single")
-            sel = res.get("selected_rows", [])
-            if isinstance(sel, pd.DataFrame): srec = sel.to_dict(orient="records")
-            elif isinstance(sel, list): srec = sel
-            else:
-                try: srec = list(sel)
-                except Exception: srec=[]
-            if srec: selected_dict = srec[0]
+            dfA_disp = dfA.copy(); dfA_disp["lock_info"]=dfA_disp.apply(_lock_info, axis=1)
+            st.write(t("all_assign"))
+            show_table(dfA_disp, height=300, key="grid_all_assign")
         else:
-            opts=[]
-            for _,r in mine.iterrows():
-                label=f"{r.get('assignment_id','')} — {r.get('location','')} — {r.get('status','')}"
-                opts.append((label, r.get("assignment_id","")))
-            if opts:
-                def _fmt(val):
-                    for lbl,v in opts:
-                        if v==val: return lbl
-                    return val
-                choice = st.radio(t("radio_label"), [v for _,v in opts], format_func=_fmt, key="my_assign_choice")
-                if choice: selected_dict = mine[mine["assignment_id"]==choice].iloc[0].to_dict()
-    else:
-        st.info(t("no_assign"))
-
-    if selected_dict: st.session_state["pending_assignment"]=selected_dict
-    pending = st.session_state.get("pending_assignment")
-    if pending:
-        st.markdown(t("selected_summary", id=pending.get('assignment_id',''), loc=pending.get('location',''), status=pending.get('status','')))
-        if st.button(t("submit_assignment"), type="primary", key="my_submit_assignment_btn", use_container_width=True):
-            assign_id = pending.get("assignment_id","")
-            if not me:
-                st.error(t("err_enter_name")); queue_feedback("error")
+            st.info(t("no_assign"))
+
+# ===== My Assignments =====
+if ACTIVE_TAB==TAB_MY:
+    with timed("tab.my"):
+        st.subheader(t("my_title"))
+        _ensure_default("me_name", st.session_state.get("assignee",""))
+        me = st.text_input(t("i_am"), key="me_name")
+        dfA = load_assignments(typed=True)
+        mine = (dfA[(dfA["assignee"].str.lower()==(me or "").lower()) & (dfA["status"]!="Submitted")]) if me else dfA.iloc[0:0]
+        cA, cB, cC, cD = st.columns(4)
+        cA.metric(t("open"), int((mine["status"]=="Assigned").sum()))
+        cB.metric(t("in_progress"), int((mine["status"]=="In Progress").sum()))
+        cC.metric(t("submitted"), int((mine["status"]=="Submitted").sum()))
+        cD.metric(t("total"), int(len(mine)))
+        st.write(t("your_assign"))
+        selected_dict=None
+        if not mine.empty:
+            if AGGRID_ENABLED:
+                def _lock_info2(r):
+                    if lock_active(r):
+                        who=r.get("lock_owner","?"); until=r.get("lock_expires_ts","")
+                        you = "You" if st.session_state.get("lang","en")=="en" else "Tú"
+                        who_disp = you if (who or "").lower()==(me or "").lower() else who
+                        return t("locked_by_until", who=who_disp, until=until)
+                    return t("available")
+                mine_disp = mine.copy(); mine_disp["lock_info"]=mine_disp.apply(_lock_info2, axis=1)
+                res = show_table(mine_disp, height=300, key="grid_my_assign", selectable=True, selection_mode="single")
+                sel = res.get("selected_rows", [])
+                if isinstance(sel, pd.DataFrame): srec = sel.to_dict(orient="records")
+                elif isinstance(sel, list): srec = sel
+                else:
+                    try: srec = list(sel)
+                    except Exception: srec=[]
+                if srec: selected_dict = srec[0]
             else:
-                dfA2 = load_assignments()
-                row = dfA2[dfA2["assignment_id"]==assign_id]
-                if row.empty:
-                    st.error(t("err_missing")); queue_feedback("error")
+                opts=[]
+                for _,r in mine.iterrows():
+                    label=f"{r.get('assignment_id','')} — {r.get('location','')} — {r.get('status','')}"
+                    opts.append((label, r.get("assignment_id","")))
+                if opts:
+                    def _fmt(val):
+                        for lbl,v in opts:
+                            if v==val: return lbl
+                        return val
+                    choice = st.radio(t("radio_label"), [v for _,v in opts], format_func=_fmt, key="my_assign_choice")
+                    if choice: selected_dict = mine[mine["assignment_id"]==choice].iloc[0].to_dict()
+        else:
+            st.info(t("no_assign"))
+
+        if selected_dict: st.session_state["pending_assignment"]=selected_dict
+        pending = st.session_state.get("pending_assignment")
+        if pending:
+            st.markdown(t("selected_summary", id=pending.get('assignment_id',''), loc=pending.get('location',''), status=pending.get('status','')))
+            if st.button(t("submit_assignment"), type="primary", key="my_submit_assignment_btn", use_container_width=True):
+                assign_id = pending.get("assignment_id","")
+                if not me:
+                    st.error(t("err_enter_name")); queue_feedback("error")
                 else:
-                    r = row.iloc[0]
-                    if str(r.get("assignee","")).strip().lower()!=str(me).strip().lower():
-                        st.error(t("err_belongs_to", assignee=r.get('assignee','?'))); queue_feedback("error")
-                    elif str(r.get("status","")).strip()=="Submitted":
-                        st.error(t("err_already_submitted")); queue_feedback("error")
-                    elif lock_active(r) and not lock_owned_by(r, me):
-                        st.error(t("err_locked_other", who=r.get('lock_owner','?'), until=r.get('lock_expires_ts','?'))); queue_feedback("error")
+                    ok, code, info = claim_assignment(assign_id, me)
+                    if not ok:
+                        st.error(_core_msg(code, info)); queue_feedback("error")
                     else:
-                        ok,msg = start_or_renew_lock(assign_id, me)
-                        if not ok:
-                            st.error(msg); queue_feedback("error")
-                        else:
-                            st.session_state["current_assignment"]=r.to_dict()
-                            st.success(t("lock_success_opening", msg=msg)); queue_feedback("success")
-                            switch_to_tab(t("tab_perform"))
-    emit_feedback()
+                        st.session_state["current_assignment"]=info["row"]
+                        st.session_state.pop("_from_scan", None)
+                        queue_feedback("success")
+                        switch_to_tab(t("tab_perform"), flash=t("lock_success_opening", msg=info["msg"]))
+        emit_feedback()
 
 # ===== Perform Count =====
-with tabs[2]:
-    st.subheader(t("perform_title"))
-    t1,t2 = st.columns(2)
-    with t1: st.checkbox(t("auto_focus_loc"), key="auto_focus")
-    with t2: st.checkbox(t("auto_advance"), key="auto_advance")
-    auto_focus = st.session_state.get("auto_focus", True)
-
-    def _hydrate_from_current(cur:dict):
-        exp_raw = cur.get("expected_qty","")
-        try: exp_int = int(float(exp_raw)) if str(exp_raw).strip()!="" else 0
-        except Exception: exp_int=0
-        st.session_state.update({
-            "perform_assignment_id":cur.get("assignment_id",""),
-            "perform_assignee":cur.get("assignee", st.session_state.get("me_name","")),
-            "perform_location":cur.get("location",""),
-            "perform_pallet":cur.get("pallet_id",""),
-            "perform_sku":cur.get("sku",""),
-            "perform_lot":cur.get("lot_number",""),
-            "perform_expected":exp_int,
-            "perform_counted_str":st.session_state.get("perform_counted_str",""),
-        })
-
-    cur = st.session_state.get("current_assignment", {})
-    selected_id = cur.get("assignment_id","")
-    loaded_from = st.session_state.get("_perform_loaded_from","")
-    if selected_id and selected_id != loaded_from:
-        _hydrate_from_current(cur); st.session_state["_perform_loaded_from"]=selected_id
-    if cur and not st.session_state.get("perform_assignment_id"): _hydrate_from_current(cur)
-    if selected_id: st.session_state["_perform_loaded_from"]=selected_id
-
-    assignment_id = st.text_input(t("assignment_id"), key="perform_assignment_id", disabled=True)
-    assignee = st.text_input(t("assignee"), key="perform_assignee", disabled=True)
-    c1,c2 = st.columns(2)
-    with c1: location = st.text_input(t("scan_location"), key="perform_location", disabled=True)
-    with c2: pallet = st.text_input(t("scan_pallet"), key="perform_pallet", disabled=True)
-    c3,c4,c5 = st.columns(3)
-    with c3: sku = st.text_input(t("sku"), key="perform_sku", disabled=True)
-    with c4: lot = st.text_input(t("lot"), key="perform_lot", disabled=True)
-    with c5: expected_num = st.number_input(t("expected_qty"), min_value=0, key="perform_expected", disabled=True)
-    counted_str = st.text_input(t("counted_qty"), key="perform_counted_str")
-    note = st.text_input(t("note"), key="perform_note")
-
-    # Issue capture (keep from v1.6.2)
-    issue_opts = ["None","Wrong Pallet ID","Wrong LOT Number","Location Empty","Damaged Pallet","Other"]
-    issue_type = st.selectbox("Issue Type (optional)", issue_opts, index=0, key="perform_issue_type")
-    show_issue = st.session_state.get("perform_issue_type","None")!="None"
-    actual_pallet = st.text_input("Actual Pallet ID (if issue)", key="perform_actual_pallet_id") if show_issue else ""
-    actual_lot = st.text_input("Actual LOT Number (if issue)", key="perform_actual_lot_number") if show_issue else ""
-
-    if auto_focus and not st.session_state.get("_did_autofocus"):
-        focus_by_label(t("counted_qty")); st.session_state["_did_autofocus"]=True
-
-    def _parse_count(s):
-        s=(s or "").strip()
-        if s=="": return None
-        if not re.fullmatch(r"\d+", s): return "invalid"
-        return int(s)
-
-    def _handle_submit():
-        assignment_id = st.session_state.get("perform_assignment_id","")
-        assignee = st.session_state.get("perform_assignee","")
-        location = st.session_state.get("perform_location","")
-        pallet   = st.session_state.get("perform_pallet","")
-        sku      = st.session_state.get("perform_sku","")
-        lot      = st.session_state.get("perform_lot","")
-        note     = st.session_state.get("perform_note","")
-        counted_val = _parse_count(st.session_state.get("perform_counted_str",""))
-        expected_num = st.session_state.get("perform_expected", 0)
-        issue_type_val = st.session_state.get("perform_issue_type","None")
-        actual_pallet_val = st.session_state.get("perform_actual_pallet_id","") if issue_type_val!="None" else ""
-        actual_lot_val = lot_normalize(st.session_state.get("perform_actual_lot_number","")) if issue_type_val!="None" else ""
-        if not assignee or not location:
-            st.session_state["_submit_msg"]=("warn", t("warn_need_fields")); return
-        if counted_val in (None,"invalid"):
-            st.session_state["_submit_msg"]=("warn", t("warn_count_invalid")); return
-        ok, why = validate_lock_for_submit(assignment_id, assignee)
-        if not ok:
-            st.session_state["_submit_msg"]=("error", str(why)); return
-        variance = counted_val - expected_num if expected_num is not None else ""
-        row = {
-            "submission_id": mk_id("CCS"),
-            "assignment_id": assignment_id or "",
-            "assignee": assignee.strip(),
-            "location": location.strip(),
-            "sku": sku.strip(),
-            "lot_number": lot_normalize(lot),
-            "pallet_id": pallet.strip(),
-            "counted_qty": int(counted_val),
-            "expected_qty": int(expected_num) if expected_num is not None else "",
-            "variance": variance if variance!="" else "",
-            "variance_flag": ("Over" if variance>0 else ("Short" if variance<0 else "Match")),
-            "timestamp": now_str(),
-            "device_id":"", "note": (note or "").strip(),
-            "issue_type": issue_type_val,
-            "actual_pallet_id": actual_pallet_val,
-            "actual_lot_number": actual_lot_val,
-        }
-        safe_append_csv(PATHS["subs"], row, SUBMIT_COLS)
-        dfA2 = load_assignments()
-        if assignment_id and not dfA2.empty:
-            ix = dfA2.index[dfA2["assignment_id"]==assignment_id]
-            if len(ix)>0:
-                dfA2.loc[ix,"status"]="Submitted"
-                dfA2.loc[ix, ["lock_owner","lock_start_ts","lock_expires_ts"]] = ["","",""]
-                save_assignments(dfA2)
-        # clear form + go back to My Assignments
-        for k in [
-            "perform_assignment_id","perform_assignee","perform_location","perform_pallet","perform_sku",
-            "perform_lot","perform_expected","perform_counted_str","perform_note",
-            "perform_issue_type","perform_actual_pallet_id","perform_actual_lot_number",
-            "_did_autofocus","_perform_loaded_from"
-        ]:
-            if k in st.session_state: st.session_state.pop(k)
-        st.session_state["current_assignment"]={}
-        st.session_state["pending_assignment"]={}
-        st.session_state["_submit_msg"]=("success", t("submitted_ok"))
-        queue_feedback("success")
-        st.session_state["_navigate_to_tab"]=t("tab_my")
-
-    st.button(t("submit_count"), type="primary", key="perform_submit_btn", use_container_width=True, on_click=_handle_submit)
-    msg = st.session_state.pop("_submit_msg", None)
-    if msg:
-        level,text = msg
-        if level=="success":
-            st.success(text)
-            if st.session_state.get("_navigate_to_tab"): switch_to_tab(st.session_state.pop("_navigate_to_tab")); st.rerun()
-        elif level=="warn":
-            st.warning(text)
-        else:
-            st.error(text)
-    emit_feedback()
+if ACTIVE_TAB==TAB_PERFORM:
+    with timed("tab.perform"):
+        st.subheader(t("perform_title"))
+        t1,t2 = st.columns(2)
+        with t1: st.checkbox(t("auto_focus_loc"), key="auto_focus")
+        with t2: st.checkbox(t("auto_advance"), key="auto_advance")
+        auto_focus = st.session_state.get("auto_focus", True)
+
+        # Scan-first: pallet/location barcode -> scan index -> lock -> prefilled form, in one step
+        def _handle_scan():
+            set_site(st.session_state["site"])  # callbacks run before the script body (and its set_site)
+            code = (st.session_state.get("perform_scan","") or "").strip()
+            st.session_state["perform_scan"]=""
+            if not code: return
+            me = (st.session_state.get("me_name","") or "").strip()
+            if not me:
+                st.session_state["_scan_msg"]=("error", t("err_need_name"), []); queue_feedback("error"); return
+            ok, code_err, info = scan_claim(code, me)
+            if not ok:
+                st.session_state["_scan_msg"]=("error", _core_msg(code_err, info), info.get("choices",[])); queue_feedback("error"); return
+            row = info["row"]
+            st.session_state["current_assignment"]=row
+            st.session_state["_perform_loaded_from"]=""
+            st.session_state["perform_counted_str"]=""
+            st.session_state.pop("_did_autofocus", None)
+            st.session_state["_from_scan"]=True
+            st.session_state["_scan_msg"]=("success", t("scan_ready", msg=info["msg"], loc=row.get("location",""), pallet=row.get("pallet_id","")), [])
+            queue_feedback("success")
+        st.text_input(t("scan_first"), key="perform_scan", on_change=_handle_scan)
+        scan_msg = st.session_state.pop("_scan_msg", None)
+        if scan_msg:
+            level, text, choices = scan_msg
+            (st.success if level=="success" else st.error)(text)
+            for ch in choices: st.caption(f"{ch.get('location','')} · {ch.get('pallet_id','') or '—'} · {ch.get('sku','')} · {ch.get('assignment_id','')}")
+
+        def _hydrate_from_current(cur:dict):
+            exp_raw = qty_str(cur.get("expected_qty",""))
+            try: exp_int = int(float(exp_raw)) if exp_raw!="" else 0
+            except Exception: exp_int=0
+            st.session_state.update({
+                "perform_assignment_id":cur.get("assignment_id",""),
+                "perform_assignee":cur.get("assignee", st.session_state.get("me_name","")),
+                "perform_location":cur.get("location",""),
+                "perform_pallet":cur.get("pallet_id",""),
+                "perform_sku":cur.get("sku",""),
+                "perform_lot":cur.get("lot_number",""),
+                "perform_expected":exp_int,
+                "perform_counted_str":st.session_state.get("perform_counted_str",""),
+            })
+
+        cur = st.session_state.get("current_assignment", {})
+        selected_id = cur.get("assignment_id","")
+        loaded_from = st.session_state.get("_perform_loaded_from","")
+        if selected_id and selected_id != loaded_from:
+            _hydrate_from_current(cur); st.session_state["_perform_loaded_from"]=selected_id
+        if cur and not st.session_state.get("perform_assignment_id"): _hydrate_from_current(cur)
+        if selected_id: st.session_state["_perform_loaded_from"]=selected_id
+
+        assignment_id = st.text_input(t("assignment_id"), key="perform_assignment_id", disabled=True)
+        assignee = st.text_input(t("assignee"), key="perform_assignee", disabled=True)
+        c1,c2 = st.columns(2)
+        with c1: location = st.text_input(t("scan_location"), key="perform_location", disabled=True)
+        with c2: pallet = st.text_input(t("scan_pallet"), key="perform_pallet", disabled=True)
+        c3,c4,c5 = st.columns(3)
+        with c3: sku = st.text_input(t("sku"), key="perform_sku", disabled=True)
+        with c4: lot = st.text_input(t("lot"), key="perform_lot", disabled=True)
+        with c5: expected_num = st.number_input(t("expected_qty"), min_value=0, key="perform_expected", disabled=True)
+        counted_str = st.text_input(t("counted_qty"), key="perform_counted_str")
+        note = st.text_input(t("note"), key="perform_note")
+
+        # Issue capture (keep from v1.6.2)
+        issue_type = st.selectbox("Issue Type (optional)", ISSUE_TYPES, index=0, key="perform_issue_type")
+        show_issue = st.session_state.get("perform_issue_type","None")!="None"
+        actual_pallet = st.text_input("Actual Pallet ID (if issue)", key="perform_actual_pallet_id") if show_issue else ""
+        actual_lot = st.text_input("Actual LOT Number (if issue)", key="perform_actual_lot_number") if show_issue else ""
+
+        if auto_focus and not st.session_state.get("_did_autofocus"):
+            focus_by_label(t("counted_qty") if cur else t("scan_first")); st.session_state["_did_autofocus"]=True
+
+        def _handle_submit():
+            set_site(st.session_state["site"])  # callbacks run before the script body (and its set_site)
+            g = st.session_state.get
+            ok, code, info = submit_count({
+                "assignment_id": g("perform_assignment_id",""), "assignee": g("perform_assignee",""),
+                "location": g("perform_location",""), "pallet_id": g("perform_pallet",""),
+                "sku": g("perform_sku",""), "lot_number": g("perform_lot",""), "note": g("perform_note",""),
+                "counted_qty": g("perform_counted_str",""), "expected_qty": g("perform_expected", 0),
+                "issue_type": g("perform_issue_type","None"),
+                "actual_pallet_id": g("perform_actual_pallet_id",""), "actual_lot_number": g("perform_actual_lot_number",""),
+            })
+            if not ok:
+                st.session_state["_submit_msg"]=("warn" if code in ("need_fields","count_invalid","expected_invalid") else "error", _core_msg(code, info)); return
+            # clear form + go back to My Assignments
+            for k in [
+                "perform_assignment_id","perform_assignee","perform_location","perform_pallet","perform_sku",
+                "perform_lot","perform_expected","perform_counted_str","perform_note",
+                "perform_issue_type","perform_actual_pallet_id","perform_actual_lot_number",
+                "_did_autofocus","_perform_loaded_from"
+            ]:
+                if k in st.session_state: st.session_state.pop(k)
+            st.session_state["current_assignment"]={}
+            st.session_state["pending_assignment"]={}
+            st.session_state["_submit_msg"]=("success", t("submitted_ok"))
+            queue_feedback("success")
+            # scan-first counts stay here for the next scan; picked assignments go back to the list
+            if not st.session_state.pop("_from_scan", False): st.session_state["_navigate_to_tab"]=t("tab_my")
+
+        st.button(t("submit_count"), type="primary", key="perform_submit_btn", use_container_width=True, on_click=_handle_submit)
+        msg = st.session_state.pop("_submit_msg", None)
+        if msg:
+            level,text = msg
+            if level=="success":
+                st.success(text)
+                if st.session_state.get("_navigate_to_tab"): switch_to_tab(st.session_state.pop("_navigate_to_tab"), flash=text)
+            elif level=="warn":
+                st.warning(text)
+            else:
+                st.error(text)
+        emit_feedback()
 
 # ===== Dashboard (Live) =====
-with tabs[3]:
-    st.subheader(t("dash_title"))
-    subs_path = PATHS["subs"]
-    refresh_sec = st.slider(t("auto_refresh_sec"), 2, 30, 5, key="dash_refresh")
-    st.caption(f"{t('subs_file')}: {subs_path}")
-    dfS = load_submissions()
-    # Download full submissions log (CSV)
-    st.download_button(t("download_subs"), data=(dfS.to_csv(index=False) if not dfS.empty else ",".join(SUBMIT_COLS)+"\n"),
-                       file_name="cyclecount_submissions.csv", mime="text/csv", key="dash_download_subs_btn")
-    dfS_disp = dfS.copy()
-    # Compact/mobile view shows a minimal, readable set incl. Notes & issue fields
-    if st.session_state.get("mobile_mode", True) and not dfS_disp.empty:
-        keep=[c for c in ["timestamp","assignee","location","counted_qty","expected_qty","variance","variance_flag","note","issue_type","actual_pallet_id","actual_lot_number"] if c in dfS_disp.columns]
-        if keep: dfS_disp=dfS_disp[keep]
-    today_str = now_local().strftime("%m/%d/%Y")
-    today_df = dfS[dfS["timestamp"].str.contains(today_str)] if not dfS.empty else dfS
-    c1,c2,c3,c4 = st.columns(4)
-    c1.metric(t("counts_today"), int(len(today_df)))
-    c2.metric(t("over"), int((today_df["variance_flag"]=="Over").sum()) if not today_df.empty else 0)
-    c3.metric(t("short"), int((today_df["variance_flag"]=="Short").sum()) if not today_df.empty else 0)
-    c4.metric(t("match"), int((today_df["variance_flag"]=="Match").sum()) if not today_df.empty else 0)
-    st.write(t("latest_subs"))
-    show_table(dfS_disp, height=320, key="grid_submissions", numeric_cols=["variance"])
+if ACTIVE_TAB==TAB_DASH:
+    with timed("tab.dashboard"):
+        st.subheader(t("dash_title"))
+        subs_path = PATHS["subs"]
+        refresh_sec = st.slider(t("auto_refresh_sec"), 2, 30, 5, key="dash_refresh")
+        st.caption(f"{t('subs_file')}: {subs_path}")
+        dfS = load_submissions(with_ts=True, typed=True)
+        # Download full submissions log (CSV)
+        st.download_button(t("download_subs"), data=(dfS.drop(columns=["ts"]).to_csv(index=False) if not dfS.empty else ",".join(SUBMIT_COLS)+"\n"),
+                           file_name="cyclecount_submissions.csv", mime="text/csv", key="dash_download_subs_btn")
+        dfS_disp = dfS.sort_values("ts", ascending=False, kind="stable", na_position="last").drop(columns=["ts"])
+        # Compact/mobile view shows a minimal, readable set incl. Notes & issue fields
+        if st.session_state.get("mobile_mode", True) and not dfS_disp.empty:
+            keep=[c for c in ["timestamp","assignee","location","counted_qty","expected_qty","variance","variance_flag","note","issue_type","actual_pallet_id","actual_lot_number"] if c in dfS_disp.columns]
+            if keep: dfS_disp=dfS_disp[keep]
+        day_start, day_end = day_bounds()
+        today_df = dfS[(dfS["ts"]>=day_start) & (dfS["ts"]<day_end)]
+        c1,c2,c3,c4 = st.columns(4)
+        c1.metric(t("counts_today"), int(len(today_df)))
+        c2.metric(t("over"), int((today_df["variance_flag"]=="Over").sum()) if not today_df.empty else 0)
+        c3.metric(t("short"), int((today_df["variance_flag"]=="Short").sum()) if not today_df.empty else 0)
+        c4.metric(t("match"), int((today_df["variance_flag"]=="Match").sum()) if not today_df.empty else 0)
+        st.write(t("latest_subs"))
+        show_table(dfS_disp, height=320, key="grid_submissions", numeric_cols=["variance"])
+
+        st.markdown(f"### {t('cov_title')}")
+        v1, v2 = st.columns(2)
+        with v1: cov_days = st.radio(t("cov_period"), [7, 30], format_func=lambda d: t(f"cov_{d}"), horizontal=True, key="cov_period")
+        with v2: cov_by = st.radio(t("cov_by"), ["zone","aisle"], format_func=lambda b: t(f"cov_{b}"), horizontal=True, key="cov_by")
+        since = coverage_since(cov_days-1)
+        cov = coverage_summary(since, cov_by)
+        if cov.empty:
+            st.caption(t("cov_none"))
+        else:
+            pal = coverage_pallets(since)
+            m1, m2 = st.columns(2)
+            m1.metric(t("cov_locs"), f"{cov['coverage_pct'].iloc[0]}%", f"{int(cov['counted'].iloc[0]):,} / {int(cov['locations'].iloc[0]):,}", delta_color="off")
+            if not pal.empty: m2.metric(t("cov_pallets"), f"{round(pal['counted'].mean()*100,1)}%", f"{int(pal['counted'].sum()):,} / {len(pal):,}", delta_color="off")
+            show_table(cov, height=220, key="grid_coverage", numeric_cols=["coverage_pct"])
+            st.write(t("cov_by_day")); st.bar_chart(coverage_by_day(cov_days).set_index("day")["coverage_pct"])
+            cov_zone = st.selectbox(t("cov_uncounted"), [""]+list(COVERAGE_ZONES), format_func=lambda z: z or t("cov_all_zones"), key="cov_zone")
+            unc = uncounted_locations(since, cov_zone or None)
+            show_table(unc.head(500), height=260, key="grid_uncounted")
+            st.download_button(t("cov_dl"), data=unc.to_csv(index=False), file_name=f"uncounted_locations_{cov_days}d.csv", mime="text/csv", key="cov_dl_btn")
     last_mod = os.path.getmtime(subs_path) if os.path.exists(subs_path) else 0
     time.sleep(refresh_sec)
     if os.path.exists(subs_path) and os.path.getmtime(subs_path)!=last_mod: st.rerun()
 
 # ===== Discrepancies =====
-with tabs[4]:
-    st.subheader(t("disc_title"))
-    dfS = load_submissions()
-    ex = dfS[dfS["variance_flag"].isin(["Over","Short"])]
-    ex_disp = ex.copy()
-    if st.session_state.get("mobile_mode", True) and not ex_disp.empty:
-        keep=[c for c in ["timestamp","assignee","location","counted_qty","expected_qty","variance","variance_flag","note","issue_type","actual_pallet_id","actual_lot_number"] if c in ex_disp.columns]
-        if keep: ex_disp=ex_disp[keep]
-    st.write(t("exceptions")); show_table(ex_disp, height=300, key="grid_exceptions", numeric_cols=["variance"])
-    st.download_button(t("export_ex"), data=ex.to_csv(index=False), file_name="cyclecount_exceptions.csv", mime="text/csv", key="disc_export_btn")
+if ACTIVE_TAB==TAB_DISC:
+    with timed("tab.discrepancies"):
+        st.subheader(t("disc_title"))
+        dfS = load_submissions(typed=True)
+        ex = dfS[dfS["variance_flag"].isin(["Over","Short"])]
+        ex_disp = ex.copy()
+        if st.session_state.get("mobile_mode", True) and not ex_disp.empty:
+            keep=[c for c in ["timestamp","assignee","location","counted_qty","expected_qty","variance","variance_flag","note","issue_type","actual_pallet_id","actual_lot_number"] if c in ex_disp.columns]
+            if keep: ex_disp=ex_disp[keep]
+        st.write(t("exceptions")); show_table(ex_disp, height=300, key="grid_exceptions", numeric_cols=["variance"])
+        st.download_button(t("export_ex"), data=ex.to_csv(index=False), file_name="cyclecount_exceptions.csv", mime="text/csv", key="disc_export_btn")
+
+        st.markdown(f"### {t('rc_title')}")
+        rules = recount_rules()
+        rc_on = st.checkbox(t("rc_enabled"), value=rules["enabled"], key="rc_enabled")
+        r1, r2, r3, r4 = st.columns(4)
+        with r1: rc_abs = st.number_input(t("rc_min_abs"), min_value=0, value=int(rules["min_abs"]), step=1, key="rc_min_abs")
+        with r2: rc_pct = st.number_input(t("rc_min_pct"), min_value=0.0, value=float(rules["min_pct"]), step=5.0, key="rc_min_pct")
+        with r3: rc_days = st.number_input(t("rc_repeat_days"), min_value=1, value=max(1,int(rules["repeat_days"])), step=1, key="rc_repeat_days")
+        with r4: rc_rep = st.number_input(t("rc_repeat_count"), min_value=0, value=int(rules["repeat_count"]), step=1, key="rc_repeat_count")
+        rc_issue = st.multiselect(t("rc_issue"), [i for i in ISSUE_TYPES if i!="None"], default=rules["issue_types"], key="rc_issue")
+        rc_rr = st.checkbox(t("rc_recounts"), value=rules["recount_recounts"], key="rc_recounts")
+        b1, b2 = st.columns(2)
+        with b1:
+            if st.button(t("rc_save"), key="rc_save_btn"):
+                save_recount_rules({**rules, "enabled":rc_on, "min_abs":rc_abs, "min_pct":rc_pct, "repeat_days":rc_days, "repeat_count":rc_rep,
+                                    "issue_types":rc_issue, "recount_recounts":rc_rr, "counters":ASSIGN_NAME_OPTIONS})
+                st.success(t("rc_saved"))
+        with b2:
+            if st.button(t("rc_run"), key="rc_run_btn"):
+                st.session_state["_rc"]=generate_recounts(counters=ASSIGN_NAME_OPTIONS)
+        if st.session_state.get("_rc"): st.info(t("rc_result", **st.session_state["_rc"]))
+        dfR = load_assignments()
+        if "source_submission_id" in dfR.columns:
+            dfR = dfR[(dfR["source_submission_id"].astype(str).str.strip()!="") & dfR["status"].isin(["Assigned","In Progress"])]
+            if not dfR.empty:
+                st.write(t("rc_open")); show_table(dfR[["assignment_id","assignee","location","pallet_id","expected_qty","status","notes","source_submission_id"]], height=220, key="grid_recounts")
 
 # ===== Settings =====
-with tabs[5]:
-    st.subheader(t("settings_title"))
-    st.write(t("env_vars"))
-    st.code("""CYCLE_COUNT_LOG_DIR=<shared path>
+if ACTIVE_TAB==TAB_SETTINGS:
+    with timed("tab.settings"):
+        st.subheader(t("settings_title"))
+        st.write(t("env_vars"))
+        st.code("""CYCLE_COUNT_LOG_DIR=<shared path>
 BIN_HELPER_LOG_DIR=<fallback if set>
 CC_LOCK_MINUTES=<default 20>
+CC_LEASE_SWEEP_SEC=<expired-lock sweep interval, default 60; 0 disables>
 AGGRID_ENABLED=<1 or 0>
 CC_LANG=<en|es>
-CC_TZ=<IANA TZ, e.g. America/Chicago>""", language="bash")
-    st.caption(t("tip_dir"))
-    st.write(t("active_paths"), PATHS)
-    st.divider()
-    st.markdown(f"### {t('inv_upload_title')}")
-    dfS_all = load_submissions()
-    st.download_button(t("download_subs"), data=(dfS_all.to_csv(index=False) if not dfS_all.empty else ",".join(SUBMIT_COLS)+"\n"),
-                       file_name="cyclecount_submissions.csv", mime="text/csv", key="settings_download_subs_btn")
-
-    inv_df_cached = load_cached_inventory()
-    if not inv_df_cached.empty:
-        st.success(t("inv_cache_loaded", n=f"{len(inv_df_cached):,}"))
-        st.dataframe(inv_df_cached.head(10), use_container_width=True)
-
-    upload = st.file_uploader("Upload Inventory Excel (.xlsx/.xls/.csv)", type=["xlsx","xls","csv"], key="settings_upload_inv")
-    if upload is not None:
-        try:
-            name = getattr(upload,"name","") or ""
-            ext = (name.lower().split(".")[-1] if "." in name else "")
-            if ext=="csv":
-                raw = read_csv_fallback(upload, dtype=str).fillna("")
-                st.write(t("preview_first10")); st.dataframe(raw.head(10), use_container_width=True)
+CC_TZ=<IANA TZ, e.g. America/Chicago>
+CC_PERF=<1 to record timings to perf_log.jsonl>
+CC_CSV_ENGINE=<pyarrow (default when installed) or c>
+CC_SITES=<optional: DAL,HOU or DAL=/path/to/logs,HOU (one server, several warehouses)>
+CC_SITE_CACHE_MAX=<sites whose parsed frames stay in memory, default 4>
+CC_PROCESS_LOCK=<1 (default) serializes writes across processes via .cc_write.lock>
+CC_OS_LOCK_TIMEOUT=<seconds to wait for .cc_write.lock on Windows before failing the write, default 120>
+CC_API_HOST / CC_API_PORT=<cc_api.py listen address, default 127.0.0.1:8765>
+CC_API_TOKEN=<optional; API clients send it as X-API-Key>
+CC_WARM_WAIT_SEC=<max seconds a page waits for the startup preload, default 30>
+CC_INGEST_WORKERS=<processes for multi-file/sheet inventory ingest, default = CPU count>
+CC_WRITEBACK_DIR=<optional local folder; writes go there first and are pushed to the log dir in batches>
+CC_WRITEBACK_SEC=<write-back push interval, default 2>""", language="bash")
+        st.caption(t("tip_dir"))
+        st.write(t("active_paths"), dict(PATHS))
+        st.divider()
+        st.markdown(f"### {t('inv_upload_title')}")
+        dfS_all = load_submissions()
+        st.download_button(t("download_subs"), data=(dfS_all.to_csv(index=False) if not dfS_all.empty else ",".join(SUBMIT_COLS)+"\n"),
+                           file_name="cyclecount_submissions.csv", mime="text/csv", key="settings_download_subs_btn")
+
+        inv_df_cached = load_cached_inventory()
+        if not inv_df_cached.empty:
+            st.success(t("inv_cache_loaded", n=f"{len(inv_df_cached):,}"))
+            st.dataframe(inv_df_cached.head(10), use_container_width=True)
+        ing = st.session_state.pop("_inv_ingest", None)
+        if ing:
+            st.caption(t("inv_ingested", parts=len(ing["parts"]), workers=ing["workers"], ms=ing["ms"], rows_in=ing["rows_in"], rows=ing["rows"], dup=ing["duplicates"]))
+            st.dataframe(pd.DataFrame(ing["parts"]), use_container_width=True, hide_index=True)
+        inv_rep = st.session_state.pop("_inv_refresh", None)
+        if inv_rep:
+            if inv_rep["changes"]==0:
+                st.info(t("inv_refresh_none", rows=inv_rep["rows"]))
             else:
-                engine = "openpyxl" if ext=="xlsx" else "xlrd"
-                xls = pd.ExcelFile(upload, engine=engine)
-                sheet = st.selectbox("Select sheet", xls.sheet_names, index=0, key="settings_sheet")
-                raw = pd.read_excel(xls, sheet_name=sheet, dtype=str).fillna("")
-                st.write(t("preview_first10")); st.dataframe(raw.head(10), use_container_width=True)
-            mapping_saved = load_inventory_mapping() or {}
-            mapping_session = st.session_state.get("map_defaults", {})
-            base_map = {**DEFAULT_MAPPING, **mapping_session, **mapping_saved}
-            cols = list(raw.columns)
-            st.markdown(f"#### {t('column_mapping')}")
-            def idx_for(colname): return (cols.index(colname)+1) if (colname in cols and colname) else 0
-            c1,c2,c3,c4,c5 = st.columns(5)
-            with c1: loc_col = st.selectbox(t("map_loc"), ["<none>"]+cols, index=idx_for(base_map.get("location","")), key="map_loc")
-            with c2: sku_col = st.selectbox(t("map_sku"), ["<none>"]+cols, index=idx_for(base_map.get("sku","")), key="map_sku")
-            with c3: lot_col = st.selectbox(t("map_lot"), ["<none>"]+cols, index=idx_for(base_map.get("lot_number","")), key="map_lot")
-            with c4: pal_col = st.selectbox(t("map_pal"), ["<none>"]+cols, index=idx_for(base_map.get("pallet_id","")), key="map_pal")
-            with c5: qty_col = st.selectbox(t("map_qty"), ["<none>"]+cols, index=idx_for(base_map.get("expected_qty","")), key="map_qty")
-            current_map = {
-                "location": (st.session_state.get("map_loc") if st.session_state.get("map_loc") and st.session_state.get("map_loc")!="<none>" else ""),
-                "sku": (st.session_state.get("map_sku") if st.session_state.get("map_sku") and st.session_state.get("map_sku")!="<none>" else ""),
-                "lot_number": (st.session_state.get("map_lot") if st.session_state.get("map_lot") and st.session_state.get("map_lot")!="<none>" else ""),
-                "pallet_id": (st.session_state.get("map_pal") if st.session_state.get("map_pal") and st.session_state.get("map_pal")!="<none>" else ""),
-                "expected_qty": (st.session_state.get("map_qty") if st.session_state.get("map_qty") and st.session_state.get("map_qty")!="<none>" else ""),
-            }
-            st.session_state["map_defaults"]=current_map
-            if st.button(t("save_map"), type="primary", key="map_save_btn"):
-                norm = normalize_inventory_df(raw, current_map)
-                save_inventory_cache(norm); save_inventory_mapping(current_map)
-                st.success(f"Saved mapping and cached {len(norm):,} rows."); st.rerun()
-        except Exception as e:
-            st.warning(t("excel_err", err=e))
\ No newline at end of file
+                st.success(t("inv_refresh", ms=inv_rep["ms"], added=len(inv_rep["added"]), removed=len(inv_rep["removed"]), moved=len(inv_rep["moved"]),
+                             qty=len(inv_rep["qty_changed"]), attr=len(inv_rep["attr_changed"]), rows=inv_rep["rows"]))
+                st.caption(t("inv_refresh_assign", qty=inv_rep["assign_qty_updated"], moved=inv_rep["assign_moved"]))
+                with st.expander(t("inv_changes")):
+                    for k in ["moved","qty_changed","added","removed","attr_changed"]:
+                        if len(inv_rep[k]): st.write(f"**{k}** ({len(inv_rep[k]):,})"); st.dataframe(inv_rep[k].head(500), use_container_width=True, hide_index=True)
+
+        uploads = st.file_uploader("Upload Inventory Excel (.xlsx/.xls/.csv)", type=["xlsx","xls","csv"], key="settings_upload_inv",
+                                   accept_multiple_files=True) or []
+        if uploads:
+            try:
+                # first file/sheet drives the preview and column mapping; the rest are ingested with the same mapping
+                upload = uploads[0]
+                name = getattr(upload,"name","") or ""
+                ext = (name.lower().split(".")[-1] if "." in name else "")
+                sheet = ""; sheet_count = 1
+                if ext=="csv":
+                    read_rep = {}
+                    raw = read_csv_fallback(upload, dtype=str, report=read_rep)
+                    if read_rep.get("bad_lines"):
+                        bl = read_rep["bad_lines"]
+                        st.warning(t("bad_lines", n=len(bl), sample="; ".join(bl[:5]) + ("…" if len(bl)>5 else "")))
+                    st.write(t("preview_first10")); st.dataframe(raw.head(10), use_container_width=True)
+                else:
+                    engine = "openpyxl" if ext=="xlsx" else "xlrd"
+                    xls = pd.ExcelFile(upload, engine=engine)
+                    sheet = st.selectbox("Select sheet", xls.sheet_names, index=0, key="settings_sheet"); sheet_count = len(xls.sheet_names)
+                    raw = pd.read_excel(xls, sheet_name=sheet, dtype=str).fillna("")
+                    st.write(t("preview_first10")); st.dataframe(raw.head(10), use_container_width=True)
+                all_sheets = st.checkbox(t("inv_all_sheets"), value=False, key="settings_all_sheets") if (len(uploads)>1 or sheet_count>1) else False
+                mapping_saved = load_inventory_mapping() or {}
+                mapping_session = st.session_state.get("map_defaults", {})
+                base_map = {**DEFAULT_MAPPING, **mapping_session, **mapping_saved}
+                cols = list(raw.columns)
+                st.markdown(f"#### {t('column_mapping')}")
+                def idx_for(colname): return (cols.index(colname)+1) if (colname in cols and colname) else 0
+                c1,c2,c3,c4,c5 = st.columns(5)
+                with c1: loc_col = st.selectbox(t("map_loc"), ["<none>"]+cols, index=idx_for(base_map.get("location","")), key="map_loc")
+                with c2: sku_col = st.selectbox(t("map_sku"), ["<none>"]+cols, index=idx_for(base_map.get("sku","")), key="map_sku")
+                with c3: lot_col = st.selectbox(t("map_lot"), ["<none>"]+cols, index=idx_for(base_map.get("lot_number","")), key="map_lot")
+                with c4: pal_col = st.selectbox(t("map_pal"), ["<none>"]+cols, index=idx_for(base_map.get("pallet_id","")), key="map_pal")
+                with c5: qty_col = st.selectbox(t("map_qty"), ["<none>"]+cols, index=idx_for(base_map.get("expected_qty","")), key="map_qty")
+                current_map = {
+                    "location": (st.session_state.get("map_loc") if st.session_state.get("map_loc") and st.session_state.get("map_loc")!="<none>" else ""),
+                    "sku": (st.session_state.get("map_sku") if st.session_state.get("map_sku") and st.session_state.get("map_sku")!="<none>" else ""),
+                    "lot_number": (st.session_state.get("map_lot") if st.session_state.get("map_lot") and st.session_state.get("map_lot")!="<none>" else ""),
+                    "pallet_id": (st.session_state.get("map_pal") if st.session_state.get("map_pal") and st.session_state.get("map_pal")!="<none>" else ""),
+                    "expected_qty": (st.session_state.get("map_qty") if st.session_state.get("map_qty") and st.session_state.get("map_qty")!="<none>" else ""),
+                }
+                st.session_state["map_defaults"]=current_map
+                if st.button(t("save_map"), type="primary", key="map_save_btn"):
+                    if len(uploads)==1 and not all_sheets:
+                        norm = normalize_inventory_df(raw, current_map)
+                    else:
+                        files = [(u.name, u.getvalue()) for u in uploads]
+                        # unchecked: the selected sheet of the first file, the first sheet of the others
+                        sheets = None if all_sheets else {n:[sheet if i==0 else excel_sheet_names(n,d)[0]] for i,(n,d) in enumerate(files)}
+                        norm, st.session_state["_inv_ingest"] = ingest_inventory(files, current_map, sheets)
+                    st.session_state["_inv_refresh"] = refresh_inventory(norm); save_inventory_mapping(current_map)
+                    start_warmup([st.session_state["site"]], force=True)
+                    st.success(f"Saved mapping and cached {len(norm):,} rows."); st.rerun()
+            except Exception as e:
+                st.warning(t("excel_err", err=e))
+        # Change feed: delta since this consumer's watermark; the watermark moves only on "Mark as exported"
+        st.divider()
+        st.markdown(f"### {t('feed_title')}")
+        f1,f2 = st.columns([2,1])
+        with f1: feed_consumer = st.text_input(t("feed_consumer"), value="wms", key="feed_consumer").strip()
+        with f2: feed_fmt = st.radio(t("feed_format"), FEED_FORMATS, horizontal=True, key="feed_format")
+        try:
+            wm = feed_watermark(feed_consumer)
+            st.caption(t("feed_wm", id=wm.get("submission_id") or "—", ts=wm.get("updated_utc","")) if wm else t("feed_never"))
+            if st.button(t("feed_prepare"), key="feed_prepare_btn"):
+                subs_d, chg_d, new_wm = feed_delta(feed_consumer)
+                st.session_state["_feed"]={"consumer":feed_consumer, "fmt":feed_fmt, "wm":new_wm,
+                                           "subs":feed_bytes(subs_d, feed_fmt), "chg":feed_bytes(chg_d, feed_fmt)}
+        except ValueError:
+            st.warning(t("feed_bad_consumer"))
+        feed = st.session_state.get("_feed")
+        if feed and feed["consumer"]==feed_consumer:
+            st.write(t("feed_counts", subs=feed["wm"]["rows"], changes=feed["wm"]["changes"]))
+            d1,d2,d3 = st.columns(3)
+            mime = "text/csv" if feed["fmt"]=="csv" else "application/x-ndjson"
+            with d1: st.download_button(t("feed_dl_subs"), data=feed["subs"], file_name=f"{feed_consumer}_submissions.{feed['fmt']}", mime=mime, key="feed_dl_subs_btn")
+            with d2: st.download_button(t("feed_dl_assign"), data=feed["chg"], file_name=f"{feed_consumer}_assignments.{feed['fmt']}", mime=mime, key="feed_dl_assign_btn")
+            with d3:
+                if st.button(t("feed_commit"), type="primary", key="feed_commit_btn"):
+                    feed_commit(feed_consumer, feed["wm"]); st.session_state.pop("_feed", None)
+                    st.success(t("feed_committed", consumer=feed_consumer))
+        st.caption("CLI: python cc_core.py export-changes --consumer wms --out <dir> [--format jsonl] [--site DAL]")
+        # Diagnostics: p50/p95 per operation from the in-process perf ring buffer
+        st.divider()
+        st.markdown(f"### {t('diag_title')}")
+        perf_on = st.checkbox(t("perf_enable"), value=cc_perf.is_enabled(), key="perf_enabled")
+        if perf_on != cc_perf.is_enabled(): cc_perf.set_enabled(perf_on)
+        st.caption(f"{t('perf_log')}: {cc_perf.log_path()} · CC_PERF=1")
+        perf_all = cc_perf.summary()
+        if perf_all.empty:
+            st.info(t("perf_none"))
+        else:
+            st.write(t("perf_all")); st.dataframe(perf_all, use_container_width=True, hide_index=True)
+            perf_run = cc_perf.summary(cc_perf.recent(cc_perf.current_run()))
+            if not perf_run.empty:
+                st.write(t("perf_run")); st.dataframe(perf_run, use_container_width=True, hide_index=True)
+            if st.button(t("perf_clear"), key="perf_clear_btn"): cc_perf.clear(); st.rerun()
+        st.write(t("warm_title"))
+        warm = warm_status()
+        if warm: st.dataframe(pd.DataFrame(warm), use_container_width=True, hide_index=True)
+        if st.button(t("warm_again"), key="warm_again_btn"): start_warmup([st.session_state["site"]], force=True); st.rerun()
+        wb = writeback_status()
+        if wb: st.write(t("wb_title")); st.dataframe(pd.DataFrame(wb), use_container_width=True, hide_index=True)
+        if READ_REPORTS:
+            st.write(t("read_issues"))
+            st.dataframe(pd.DataFrame([{"path":r["path"], "encoding":r["encoding"], "engine":r.get("engine",""), "bad_lines":len(r["bad_lines"]),
+                                        "replaced_chars":r["replaced_chars"], "sample":"; ".join(r["bad_lines"][:3]), "ts":r["ts"]}
+                                       for r in list(READ_REPORTS.values())]), use_container_width=True, hide_index=True)
+
+cc_perf.flush()
@@ -0,0 +1,134 @@
+# HTTP/JSON API for handheld scanners and integrations (stdlib only, runs beside the Streamlit app).
+#   python cc_api.py [--host 127.0.0.1] [--port 8765]
+# Uses the same cc_core lock/submit functions as the UI; writes are serialized across processes by
+# cc_core.WRITE_LOCK, so the API and Streamlit can share one log directory.
+import os, hmac, json, argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from cc_core import (SITES, use_site, load_assignments, inv_lookup_expected, qty_str,
+                     claim_assignment, scan_claim, submit_count, submit_counts, start_lease_sweeper, start_writeback, start_warmup)
+
+API_HOST = os.getenv("CC_API_HOST","127.0.0.1")
+API_PORT = int(os.getenv("CC_API_PORT", 8765))
+API_TOKEN = os.getenv("CC_API_TOKEN","")
+API_BATCH_MAX = int(os.getenv("CC_API_BATCH_MAX", 500))
+
+_STATUS = {"need_fields":400, "count_invalid":400, "expected_invalid":400, "belongs_to":403, "missing":404,
+           "already_submitted":409, "locked_other":409, "lock_failed":409, "scan_no_match":404, "scan_ambiguous":409}
+
+class ApiError(Exception):
+    def __init__(self, status:int, msg:str): super().__init__(msg); self.status=status
+
+def _result(res):
+    ok, code, info = res
+    if ok: return {"ok":True, **{k:v for k,v in info.items() if k!="row"}}
+    return {"ok":False, "error":code, "message":info.get("msg","")}
+
+def _status_for(res): return 200 if res[0] else _STATUS.get(res[1], 400)
+
+def _need(body:dict, *keys):
+    miss=[k for k in keys if not str(body.get(k,"") or "").strip()]
+    if miss: raise ApiError(400, "missing field(s): "+", ".join(miss))
+
+def get_assignments(q:dict, body:dict):
+    who=(q.get("assignee") or "").strip().lower()
+    if not who: raise ApiError(400, "assignee is required")
+    df=load_assignments()
+    if not df.empty:
+        df=df[(df["assignee"].str.strip().str.lower()==who) & (df["status"].isin(["Assigned","In Progress"]))]
+    return 200, {"assignments": df.fillna("").to_dict("records")}
+
+def get_expected(q:dict, body:dict):
+    exp=inv_lookup_expected(q.get("location",""), q.get("sku",""), q.get("lot",""), q.get("pallet_id",""))
+    return 200, {"expected_qty": exp}
+
+def post_lock(q:dict, body:dict):
+    _need(body, "assignment_id", "user")
+    res=claim_assignment(str(body["assignment_id"]).strip(), str(body["user"]).strip())
+    out=_result(res)
+    if res[0]:
+        r=res[2]["row"]
+        out.update({k:qty_str(r.get(k,"")) if k=="expected_qty" else r.get(k,"")
+                    for k in ["assignment_id","location","pallet_id","sku","lot_number","expected_qty"]})
+    return _status_for(res), out
+
+def post_scan(q:dict, body:dict):
+    _need(body, "code", "user")
+    res=scan_claim(str(body["code"]), str(body["user"]).strip())
+    out=_result(res)
+    if res[0]: out["assignment"]={k:qty_str(v) if k=="expected_qty" else v for k,v in res[2]["row"].items()}
+    elif res[1]=="scan_ambiguous": out["choices"]=res[2]["choices"]
+    return _status_for(res), out
+
+def post_submit(q:dict, body:dict):
+    res=submit_count(body)
+    return _status_for(res), _result(res)
+
+def post_submit_batch(q:dict, body:dict):
+    items=body.get("items")
+    if not isinstance(items, list) or not items: raise ApiError(400, "items must be a non-empty list")
+    if len(items)>API_BATCH_MAX: raise ApiError(400, f"at most {API_BATCH_MAX} items per batch")
+    if not all(isinstance(i, dict) for i in items): raise ApiError(400, "items must be objects")
+    results=[_result(r) for r in submit_counts(items)]
+    return 200, {"submitted":sum(r["ok"] for r in results), "results":results}
+
+ROUTES = {
+    ("GET","/health"): lambda q,b: (200, {"ok":True, "sites":list(SITES)}),
+    ("GET","/assignments"): get_assignments,
+    ("GET","/expected"): get_expected,
+    ("POST","/lock"): post_lock,
+    ("POST","/scan"): post_scan,
+    ("POST","/submit"): post_submit,
+    ("POST","/submit/batch"): post_submit_batch,
+}
+
+def handle(method:str, path:str, query:dict, body:dict, token:str=""):
+    # Pure dispatch: (status, payload). ?site= (or "site" in the body) picks the warehouse.
+    fn=ROUTES.get((method, path.rstrip("/") or "/"))
+    if fn is None: return 404, {"ok":False, "error":"not_found"}
+    if API_TOKEN and not hmac.compare_digest((token or "").encode("utf-8"), API_TOKEN.encode("utf-8")):
+        return 401, {"ok":False, "error":"unauthorized"}
+    site=query.get("site") or (body or {}).get("site") or None
+    if site is not None and (not isinstance(site, str) or site not in SITES): return 400, {"ok":False, "error":"unknown_site", "message":str(site)}
+    try:
+        with use_site(site): return fn(query, body or {})
+    except ApiError as e:
+        return e.status, {"ok":False, "error":"bad_request", "message":str(e)}
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "CycleCountAPI/1"
+    def _dispatch(self, method):
+        parts=urlsplit(self.path)
+        query={k:v[-1] for k,v in parse_qs(parts.query).items()}
+        body={}
+        if method=="POST":
+            n=int(self.headers.get("Content-Length") or 0)
+            try: body=json.loads(self.rfile.read(n) or b"{}")
+            except ValueError: return self._send(400, {"ok":False, "error":"bad_json"})
+            if not isinstance(body, dict): return self._send(400, {"ok":False, "error":"bad_json"})
+        try: status,payload=handle(method, parts.path, query, body, self.headers.get("X-API-Key",""))
+        except Exception as e:
+            status,payload=500, {"ok":False, "error":"internal", "message":type(e).__name__}
+        self._send(status, payload)
+    def _send(self, status:int, payload:dict):
+        data=json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type","application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers(); self.wfile.write(data)
+    def do_GET(self): self._dispatch("GET")
+    def do_POST(self): self._dispatch("POST")
+    def log_message(self, fmt, *args): pass
+
+def serve(host:str=API_HOST, port:int=API_PORT):
+    start_lease_sweeper(); start_writeback(); start_warmup()
+    httpd=ThreadingHTTPServer((host, port), _Handler)
+    print(f"Cycle Count API on http://{host}:{port}")
+    try: httpd.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: httpd.server_close()
+
+if __name__=="__main__":
+    ap=argparse.ArgumentParser(description="Cycle Count HTTP/JSON API")
+    ap.add_argument("--host", default=API_HOST); ap.add_argument("--port", type=int, default=API_PORT)
+    a=ap.parse_args(); serve(a.host, a.port)
@@ -0,0 +1,1718 @@
+# Core storage for the Cycle Counting app (no Streamlit imports).
+# Streamlit re-executes app.py on every rerun; anything that must live for the whole
+# server process (lease cache, background sweeper, write lock) belongs here instead.
+import os, io, re, csv, time, uuid, json, codecs, atexit, shutil, warnings, threading, contextvars
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+import pandas as pd
+import cc_perf
+from cc_perf import timed, perf_op
+
+# ===== Constants =====
+TZ_NAME = os.getenv("CC_TZ", "America/Chicago")
+LOCK_MINUTES_DEFAULT = 20
+LOCK_MINUTES = int(os.getenv("CC_LOCK_MINUTES", LOCK_MINUTES_DEFAULT))
+LEASE_SWEEP_SEC = int(os.getenv("CC_LEASE_SWEEP_SEC", 60))
+WARM_WAIT_SEC = float(os.getenv("CC_WARM_WAIT_SEC", 30))
+WRITEBACK_DIR = os.getenv("CC_WRITEBACK_DIR","")        # local disk buffer in front of a synced log dir; empty = off
+WRITEBACK_SEC = float(os.getenv("CC_WRITEBACK_SEC", 2))
+TS_FMT = "%m/%d/%Y %I:%M:%S %p"          # display form, kept for humans and old readers
+ISO_FMT = "%Y-%m-%dT%H:%M:%SZ"           # UTC companion columns; sorts chronologically as text
+
+# ===== Sites / Paths =====
+# CC_SITES="DAL,HOU=/mnt/hou/logs": one server, several warehouses. Each site gets its own
+# log dir (default <base>/<site>); unset means a single site living in the base dir as before.
+# The site is chosen per session (per thread) via set_site(); PATHS resolves against it.
+def ensure_dirs(paths): [os.makedirs(p, exist_ok=True) for p in paths]
+def _base_dir():
+    base = os.getenv("CYCLE_COUNT_LOG_DIR") or os.getenv("BIN_HELPER_LOG_DIR") or os.path.join(os.getcwd(),"logs")
+    cloud = "/mount/src/bin-helper/logs"
+    return cloud if os.path.isdir(cloud) else base
+BASE_DIR = _base_dir()
+
+def _parse_sites(spec:str)->"OrderedDict[str,str]":
+    sites=OrderedDict()
+    for part in (spec or "").split(","):
+        name,_,path=part.strip().partition("=")
+        name=name.strip()
+        if name: sites[name]=path.strip() or os.path.join(BASE_DIR, name)
+    return sites or OrderedDict([("", BASE_DIR)])
+SITES = _parse_sites(os.getenv("CC_SITES",""))
+DEFAULT_SITE = next(iter(SITES))
+SITE_CACHE_MAX = int(os.getenv("CC_SITE_CACHE_MAX", 4))
+_SITE = contextvars.ContextVar("cc_site", default=DEFAULT_SITE)
+
+def set_site(site:str)->str:
+    site = site if site in SITES else DEFAULT_SITE
+    _SITE.set(site); return site
+def current_site()->str: return _SITE.get()
+@contextmanager
+def use_site(site:str):
+    token=_SITE.set(site if site in SITES else DEFAULT_SITE)
+    try: yield
+    finally: _SITE.reset(token)
+
+_PATHS_BY_SITE = {}
+_PATHS_READY = set()
+_PATHS_INIT = threading.Lock()     # guards the dicts above only; never held while recovering
+_PATHS_RECOVER = {}                # site -> RLock held while its write-back recovery runs
+_RECOVERING = threading.local()    # sites this thread is recovering (their paths resolve as-is)
+def get_paths(site:str=None)->dict:
+    # With CC_WRITEBACK_DIR the app works on a local copy (root) and "shared" is the site's log dir
+    site = current_site() if site is None else site
+    if site in _PATHS_READY: return _PATHS_BY_SITE[site]
+    with _PATHS_INIT:
+        paths = _PATHS_BY_SITE.get(site)
+        if paths is None:
+            shared = SITES.get(site, SITES[DEFAULT_SITE])
+            active = os.path.join(WRITEBACK_DIR, re.sub(r"[^A-Za-z0-9_.-]+","_",site) or "default") if WRITEBACK_DIR else shared
+            ensure_dirs([active, shared])
+            paths = _PATHS_BY_SITE[site] = {
+                "root":active,
+                "shared":shared,
+                "assign":os.path.join(active,"counts_assignments.csv"),
+                "assign_deleted":os.path.join(active,"counts_assignments_deleted.csv"),
+                "subs":os.path.join(active,"cyclecount_submissions.csv"),
+                "inv_csv":os.path.join(active,"inventory_lookup.csv"),
+                "inv_map":os.path.join(active,"inventory_mapping.json"),
+                "leases":os.path.join(active,"assignment_leases.json"),
+                "feed_wm":os.path.join(active,"feed_watermarks.json"),
+                "recount_rules":os.path.join(active,"recount_rules.json"),
+                "recount_state":os.path.join(active,"recount_state.json"),
+            }
+            _PATHS_RECOVER[site] = threading.RLock()
+        recover = _PATHS_RECOVER[site]
+    if not WRITEBACK_DIR:
+        _PATHS_READY.add(site); return paths
+    busy = getattr(_RECOVERING, "sites", None)
+    if busy is None: busy = _RECOVERING.sites = set()
+    if site in busy: return paths
+    # Recovery takes WRITE_LOCK and the flush lock, so it runs outside _PATHS_INIT; other threads
+    # asking for this site wait here until the local copy matches the shared dir.
+    with recover:
+        if site not in _PATHS_READY:
+            busy.add(site)
+            try:
+                with use_site(site): writeback_recover()
+            finally: busy.discard(site)
+            _PATHS_READY.add(site)
+    return paths
+
+class _SitePaths(Mapping):
+    # PATHS["assign"] -> the current session's site
+    def __getitem__(self, k): return get_paths()[k]
+    def __iter__(self): return iter(get_paths())
+    def __len__(self): return len(get_paths())
+    def __repr__(self): return repr(get_paths())
+PATHS = _SitePaths()
+# perf_log.jsonl is process-wide and rotated in place: with CC_WRITEBACK_DIR it stays on local disk, out of the synced dir
+_PERF_DIR = WRITEBACK_DIR or BASE_DIR
+ensure_dirs([_PERF_DIR]); cc_perf.configure(_PERF_DIR)
+
+# Process-wide frame cache (and per-site indexes): buckets per site, least recently used site evicted first,
+# so memory follows the number of active sites rather than the number of sessions.
+class SiteLRU:
+    def __init__(self, max_sites:int):
+        self.max_sites=max(1,max_sites); self._d=OrderedDict(); self._lock=threading.Lock()
+    def get(self, site, key):
+        with self._lock:
+            b=self._d.get(site)
+            if b is None: return None
+            self._d.move_to_end(site); return b.get(key)
+    def put(self, site, key, value):
+        with self._lock:
+            self._d.setdefault(site,{})[key]=value; self._d.move_to_end(site)
+            while len(self._d)>self.max_sites: self._d.popitem(last=False)
+    def drop(self, site, key=None):
+        with self._lock:
+            if key is None: self._d.pop(site,None)
+            elif site in self._d: self._d[site].pop(key,None)
+    def sites(self)->list:
+        with self._lock: return list(self._d)
+FRAME_CACHE = SiteLRU(SITE_CACHE_MAX)
+
+def _file_sig(path): st=os.stat(path); return (st.st_mtime_ns, st.st_size)
+def _sig_or_none(path):
+    try: return _file_sig(path)
+    except OSError: return None
+def cached_frame(path:str, variant:str, build):
+    # build() is re-run only when the file's mtime/size changes; None results are not cached
+    try: sig=_file_sig(path)
+    except OSError: return build()
+    key=(os.path.abspath(path), variant); site=current_site()
+    hit=FRAME_CACHE.get(site, key)
+    if hit is not None and hit[0]==sig: return hit[1]
+    df=build()
+    if df is not None: FRAME_CACHE.put(site, key, (sig, df))
+    return df
+
+ASSIGN_COLS = ["assignment_id","assigned_by","assignee","location","sku","lot_number","pallet_id",
+               "expected_qty","priority","status","created_ts","due_date","notes",
+               "lock_owner","lock_start_ts","lock_expires_ts","created_utc","source_submission_id"]
+SUBMIT_COLS = ["submission_id","assignment_id","assignee","location","sku","lot_number","pallet_id",
+               "counted_qty","expected_qty","variance","variance_flag","timestamp","device_id","note",
+               "issue_type","actual_pallet_id","actual_lot_number","timestamp_utc"]
+# display column -> UTC ISO companion column
+TS_PAIRS = {"assign":("created_ts","created_utc"), "subs":("timestamp","timestamp_utc")}
+LOCK_COLS = ["lock_owner","lock_start_ts","lock_expires_ts"]
+
+INV_COLS = ["location","sku","lot_number","pallet_id","expected_qty"]
+
+# Serializes read-modify-write of the log files: re-entrant per thread, and across processes
+# (Streamlit, cc_api, load-test workers) via an OS lock on <site dir>/.cc_write.lock.
+PROCESS_LOCK = os.getenv("CC_PROCESS_LOCK","1")=="1"
+OS_LOCK_TIMEOUT = float(os.getenv("CC_OS_LOCK_TIMEOUT", 120))   # Windows: give up waiting on another process
+try:
+    import fcntl
+    def _os_lock(fh)->int:
+        # -> 1 if another process held it and we had to wait, else 0
+        try: fcntl.flock(fh.fileno(), fcntl.LOCK_EX|fcntl.LOCK_NB); return 0
+        except BlockingIOError: fcntl.flock(fh.fileno(), fcntl.LOCK_EX); return 1
+    def _os_unlock(fh): fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt, errno
+    _CONTENDED = {errno.EACCES, getattr(errno,"EDEADLOCK",errno.EDEADLK)}
+    def _os_lock(fh)->int:
+        # -> number of contended attempts before we got it
+        fh.seek(0); deadline=time.monotonic()+OS_LOCK_TIMEOUT; waits=0
+        while True:
+            try: msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK if waits==0 else msvcrt.LK_LOCK, 1); return waits
+            except OSError as e:
+                if e.errno not in _CONTENDED: raise  # not contention (bad handle, share without locking)
+                if time.monotonic()>=deadline: raise TimeoutError(f"{fh.name} held by another process for {OS_LOCK_TIMEOUT:.0f}s")
+                waits+=1  # LK_LOCK gives up after ~10s of contention; keep waiting until the deadline
+    def _os_unlock(fh): fh.seek(0); msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+class _WriteLock:
+    def __init__(self): self._rl=threading.RLock(); self._local=threading.local()
+    def __enter__(self):
+        depth=getattr(self._local,"depth",0)
+        # resolve the site's paths before taking the RLock: first use of a site may run write-back recovery
+        lock_fp=os.path.join(PATHS["root"],".cc_write.lock") if depth==0 and PROCESS_LOCK else None
+        if depth:
+            self._rl.acquire(); self._local.depth=depth+1; return self
+        # outermost entry: lock.write records the wait; retries = contended acquires (other thread / other process)
+        with timed("lock.write") as rec:
+            waits=0
+            if not self._rl.acquire(blocking=False): self._rl.acquire(); waits=1
+            if lock_fp:
+                fh=None
+                try:
+                    fh=open(lock_fp,"a+b"); waits+=_os_lock(fh)
+                except TimeoutError:
+                    fh.close(); self._rl.release(); raise  # another process holds it: writing anyway would race
+                except Exception:
+                    if fh: fh.close()
+                    fh=None  # filesystem without locking: fall back to in-process only
+                self._local.fh=fh
+            if rec: rec["retries"]=waits
+        self._local.depth=1
+        return self
+    def __exit__(self, *exc):
+        self._local.depth-=1
+        if self._local.depth==0 and getattr(self._local,"fh",None):
+            try: _os_unlock(self._local.fh)
+            finally: self._local.fh.close(); self._local.fh=None
+        self._rl.release()
+        return False
+WRITE_LOCK = _WriteLock()
+
+# ===== CSV I/O =====
+# One parse per load: the encoding is sniffed once (BOM, else head/tail sample) and remembered
+# per path; bytes are decoded once and parsed by pyarrow's multithreaded reader when available.
+# Malformed lines are skipped but reported via `report` / READ_REPORTS instead of vanishing.
+try:
+    import pyarrow as pa, pyarrow.csv as pacsv
+    _PA_CSV = True
+except Exception:
+    _PA_CSV = False
+CSV_ENGINE = os.getenv("CC_CSV_ENGINE", "pyarrow" if _PA_CSV else "c")
+_ENCODINGS = ["utf-8","cp1252","latin-1"]
+_BOMS = [(codecs.BOM_UTF8,"utf-8-sig"), (codecs.BOM_UTF16_LE,"utf-16"), (codecs.BOM_UTF16_BE,"utf-16")]
+_SNIFF_BYTES = 65536
+_ENC_CACHE = {}     # abs path -> encoding
+READ_REPORTS = {}   # abs path -> last read report that had bad lines or undecodable bytes
+
+def _path_key(fp): return os.path.abspath(fp) if isinstance(fp,(str,os.PathLike)) else None
+
+def _read_bytes(fp)->bytes:
+    if isinstance(fp,(str,os.PathLike)):
+        with open(fp,"rb") as f: return f.read()
+    raw = fp.getvalue() if hasattr(fp,"getvalue") else fp.read()
+    if hasattr(fp,"seek"): fp.seek(0)
+    return raw if isinstance(raw,bytes) else str(raw).encode("utf-8")
+
+def _sample_decodes(raw:bytes, enc:str)->bool:
+    head=raw[:_SNIFF_BYTES]; tail=raw[-_SNIFF_BYTES:] if len(raw)>2*_SNIFF_BYTES else b""
+    if enc=="utf-8":
+        while tail and (tail[0] & 0xC0)==0x80: tail=tail[1:]  # don't start mid-character
+    try:
+        dec=codecs.getincrementaldecoder(enc)()
+        dec.decode(head, final=(len(raw)<=_SNIFF_BYTES)); dec.reset(); dec.decode(tail, final=True)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def sniff_encoding(raw:bytes)->str:
+    for bom,enc in _BOMS:
+        if raw.startswith(bom): return enc
+    for enc in _ENCODINGS:
+        if _sample_decodes(raw, enc): return enc
+    return "latin-1"
+
+def _to_utf8(raw:bytes, enc:str):
+    # -> (utf-8 bytes without BOM, count of undecodable bytes replaced)
+    if enc in ("utf-8","utf-8-sig"):
+        body=raw[3:] if raw.startswith(codecs.BOM_UTF8) else raw
+        try: body.decode("utf-8"); return body, 0
+        except UnicodeDecodeError:
+            text=body.decode("utf-8", errors="replace")
+    else:
+        text=raw.decode(enc, errors="replace")
+        if text.startswith("\ufeff"): text=text[1:]
+    return text.encode("utf-8"), text.count("\ufffd")
+
+def _parse_pyarrow(data:bytes, rep:dict):
+    header=next(csv.reader([data.split(b"\n",1)[0].decode("utf-8").rstrip("\r")]), [])
+    if not header or "" in header or len(set(header))!=len(header): return None  # let pandas name/mangle columns
+    bad=[]; short=[]
+    def _invalid(row):
+        (short if row.actual_columns<row.expected_columns else bad).append(row); return "skip"
+    tbl=pacsv.read_csv(io.BytesIO(data),
+        read_options=pacsv.ReadOptions(use_threads=True),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True, invalid_row_handler=_invalid),
+        convert_options=pacsv.ConvertOptions(column_types={c:pa.string() for c in header},
+                                             strings_can_be_null=False, quoted_strings_can_be_null=False))
+    if short: return None  # rows from older, narrower writers: pandas pads them in place
+    rep["bad_lines"]=[(f"line {r.number}: " if r.number is not None else "")+f"expected {r.expected_columns} fields, saw {r.actual_columns}: {r.text[:60]}" for r in bad]
+    return tbl.to_pandas()
+
+def _parse_pandas(data:bytes, dtype, rep:dict):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        df=pd.read_csv(io.BytesIO(data), dtype=dtype, encoding="utf-8", on_bad_lines="warn")
+    rep["bad_lines"]=[ln.strip() for w in caught if issubclass(w.category, pd.errors.ParserWarning)
+                      for ln in str(w.message).splitlines() if ln.strip()]
+    return df
+
+def read_csv_fallback(fp, dtype=str, report:dict=None):
+    rep = report if report is not None else {}
+    key=_path_key(fp); raw=_read_bytes(fp)
+    enc=_ENC_CACHE.get(key) or sniff_encoding(raw)
+    if key: _ENC_CACHE[key]=enc
+    data, replaced = _to_utf8(raw, enc)
+    if not data.strip(): raise pd.errors.EmptyDataError("No columns to parse from file")
+    rep.update(encoding=enc, replaced_chars=replaced, bad_lines=[])
+    df=None
+    if CSV_ENGINE=="pyarrow" and _PA_CSV and dtype is str:
+        df=_parse_pyarrow(data, rep); rep["engine"]="pyarrow"
+    if df is None:
+        df=_parse_pandas(data, dtype, rep); rep["engine"]="c"
+    if key:
+        if rep["bad_lines"] or replaced: READ_REPORTS[key]={**rep, "path":key, "ts":now_str()}
+        else: READ_REPORTS.pop(key, None)
+    return df.fillna("")
+
+def dataframe_to_csv_utf8(df, out_path):
+    # Write-then-rename so readers that don't take WRITE_LOCK never see a truncated file
+    tmp=f"{out_path}.{os.getpid()}.tmp"
+    df.to_csv(tmp, index=False, encoding="utf-8"); _durable(tmp)
+    try: os.replace(tmp, out_path)
+    except PermissionError:  # Windows: target held open by a sync client/Excel; fall back to in-place
+        os.remove(tmp); df.to_csv(out_path, index=False, encoding="utf-8")
+    if _path_key(out_path): _ENC_CACHE[_path_key(out_path)]="utf-8"
+    _wb_note(out_path, "snapshot")
+def _csv_header(path)->list:
+    with open(path,"r",encoding="utf-8-sig",errors="replace") as f: first=f.readline()
+    return [c.strip() for c in first.rstrip("\r\n").split(",")] if first.strip() else []
+
+def safe_append_csv(path, row:dict, columns:list): safe_append_rows(path, [row], columns)
+def safe_append_rows(path, rows:list, columns:list):
+    if not rows: return
+    with WRITE_LOCK, timed("csv.append", file=os.path.basename(path)) as rec:
+        pre=_sig_or_none(path)
+        exists=os.path.exists(path)
+        if exists:
+            # never append rows wider than the file's header (pandas would skip them on read)
+            header=_csv_header(path)
+            missing=[c for c in columns if c not in header]
+            if missing:
+                old=read_csv_fallback(path, dtype=str)
+                for c in missing: old[c]=""
+                dataframe_to_csv_utf8(old, path); header=list(old.columns)
+            columns=header
+        df=pd.DataFrame(rows, columns=columns).fillna("")
+        tmp=path+".tmp"
+        if exists:
+            with open(tmp,"a",encoding="utf-8") as f: df.to_csv(f, header=False, index=False)
+            with open(tmp,"rb") as fin, open(path,"ab") as fout:
+                chunk=fin.read(); fout.write(chunk)
+            os.remove(tmp)
+            _wb_note(path, "append", chunk.decode("utf-8"))
+            if rec: rec["rows"]=len(rows); rec["bytes_out"]=len(chunk)
+        else:
+            df.to_csv(path, index=False, encoding="utf-8"); _durable(path)
+            _wb_note(path, "snapshot")
+            if rec: rec["rows"]=len(rows); rec["bytes_out"]=os.path.getsize(path)
+        if os.path.abspath(path)==os.path.abspath(PATHS["assign"]): _scan_after_write(pre, lambda ix: ix.upsert(rows))
+
+def _read_csv_retry(path):
+    with timed("csv.read", file=os.path.basename(path)) as rec:
+        for i in range(5):
+            try:
+                rep={}; df=read_csv_fallback(path, dtype=str, report=rep)
+                if rec: rec.update(rows=len(df), bytes_in=os.path.getsize(path), retries=i, bad_lines=len(rep["bad_lines"]))
+                return df
+            except pd.errors.EmptyDataError: return None
+            except Exception: time.sleep(0.1)  # file held by a writer/sync client
+        if rec: rec["retries"]=5
+    return None
+
+def read_csv_locked(path, columns=None):
+    # Parsed frames are shared across sessions until the file changes; callers get a private copy
+    if not os.path.exists(path): return pd.DataFrame(columns=columns or [])
+    df=cached_frame(path, "str", lambda: _read_csv_retry(path))
+    return df.copy() if df is not None else pd.DataFrame(columns=columns or [])
+
+# ===== Write-back buffer =====
+# CC_WRITEBACK_DIR=<local disk>: each site's files live in <dir>/<site> and that copy is what the app reads and
+# writes. Every write is also recorded in an fsync'd journal there (.cc_journal.jsonl: the appended CSV text, or
+# "snapshot" for a rewritten file). Every CC_WRITEBACK_SEC a flusher moves the journal into a batch (.cc_batch,
+# with copies of the rewritten files) under WRITE_LOCK, then pushes it to the shared log dir outside the lock:
+# one append per file for all of its rows, one copy per rewritten file. Files other machines changed are pulled
+# back when nothing local is pending for them. After a crash the leftover batch is pushed first, then the journal,
+# in order; intent.json remembers each shared file's size before the push so rows already landed are not re-sent.
+_JOURNAL = ".cc_journal.jsonl"
+_BATCH = ".cc_batch"
+_SYNC = ".cc_sync.json"       # file -> [mtime_ns, size] of the shared copy as of our last push/pull
+_WB_STATE = {}                # site -> last flush report
+_WB_THREAD = threading.Lock()
+
+def _durable(fp):
+    if not WRITEBACK_DIR: return
+    with open(fp,"rb+") as f: os.fsync(f.fileno())
+
+def _wb_file(name:str)->str: return os.path.join(PATHS["root"], name)
+def _wb_tracked()->list: return [os.path.basename(v) for k,v in PATHS.items() if k not in ("root","shared")]
+
+def _wb_note(path, op:str, data:str=""):
+    if not WRITEBACK_DIR or os.path.abspath(path) not in {os.path.abspath(_wb_file(f)) for f in _wb_tracked()}: return
+    line=json.dumps({"file":os.path.basename(path), "op":op, "data":data}, ensure_ascii=False)+"\n"
+    with WRITE_LOCK, open(_wb_file(_JOURNAL),"a",encoding="utf-8") as f:
+        f.write(line); f.flush(); os.fsync(f.fileno())
+
+def _wb_ops(fp:str)->list:
+    ops=[]
+    try:
+        with open(fp,"r",encoding="utf-8") as f:
+            for ln in f:
+                try: ops.append(json.loads(ln))
+                except ValueError: break  # torn last line from a crash mid-write; that write was never acknowledged
+    except OSError: pass
+    return ops
+
+def _copy_file(src:str, dst:str, durable:bool=False):
+    # write-then-rename like dataframe_to_csv_utf8, with the same in-place fallback for locked targets
+    tmp=f"{dst}.{os.getpid()}.tmp"
+    shutil.copyfile(src, tmp)
+    if durable:
+        with open(tmp,"rb+") as f: os.fsync(f.fileno())
+    try: os.replace(tmp, dst)
+    except PermissionError: os.remove(tmp); shutil.copyfile(src, dst)
+
+def _landed(dst:str, pre:int, chunk:bytes)->bool:
+    # did an interrupted push already append chunk (possibly after someone else's rows)?
+    try:
+        with open(dst,"rb") as f: f.seek(pre); return chunk in f.read()
+    except OSError: return False
+
+@contextmanager
+def _flush_lock():
+    # one flusher per local dir across processes (the app and cc_api can share a buffer)
+    fp=_wb_file(".cc_flush.lock")  # resolve the site first: get_paths may itself be recovering under this lock
+    with _WB_THREAD, open(fp,"a+b") as fh:
+        _os_lock(fh)
+        try: yield
+        finally: _os_unlock(fh)
+
+def _wb_push(bdir:str, sync:dict)->int:
+    ops=_wb_ops(os.path.join(bdir,_JOURNAL)); shared=PATHS["shared"]
+    plan=OrderedDict()
+    for o in ops:
+        p=plan.setdefault(o["file"], {"snapshot":False, "data":[]})
+        if o["op"]=="snapshot": p["snapshot"]=True
+        else: p["data"].append(o["data"])
+    ip=os.path.join(bdir,"intent.json"); intent=_json_load(ip)
+    if not intent:
+        intent={f:(_sig_or_none(os.path.join(shared,f)) or (0,0))[1] for f,p in plan.items() if not p["snapshot"]}
+        _json_save(ip, intent)
+    for f,p in plan.items():
+        dst=os.path.join(shared,f)
+        before=_sig_or_none(dst)
+        if p["snapshot"]:
+            if os.path.exists(os.path.join(bdir,f)): _copy_file(os.path.join(bdir,f), dst)
+        else:
+            chunk="".join(p["data"]).encode("utf-8")
+            if before is None:  # shared copy gone: header from the local copy + rows
+                with open(_wb_file(f),"rb") as fl: chunk=fl.readline()+chunk
+            if not _landed(dst, intent.get(f,0), chunk):
+                with open(dst,"ab") as fh: fh.write(chunk)
+        # someone else wrote the shared append-only file since our last sync: pull it once nothing is pending
+        stale=not p["snapshot"] and before is not None and list(before)!=sync.get(f)
+        sync[f]=None if stale else list(_sig_or_none(dst))
+    shutil.rmtree(bdir)
+    return len(plan)
+
+def _wb_pull(sync:dict, force:bool=False)->int:
+    shared=PATHS["shared"]; n=0
+    for f in _wb_tracked():
+        src=os.path.join(shared,f); dst=_wb_file(f); sig=_sig_or_none(src)
+        if sig is None or (not force and list(sig)==sync.get(f) and os.path.exists(dst)): continue
+        tmp=f"{dst}.pull.tmp"
+        shutil.copyfile(src, tmp)  # slow side outside the lock
+        with WRITE_LOCK:
+            if any(o["file"]==f for o in _wb_ops(_wb_file(_JOURNAL))): os.remove(tmp); continue  # local write pending
+            os.replace(tmp, dst)
+        sync[f]=list(sig); n+=1
+    return n
+
+def writeback_flush(force_pull:bool=False)->dict:
+    # Push the current site's pending writes to the shared log dir, then pull what changed there.
+    if not WRITEBACK_DIR: return {}
+    with _flush_lock(), timed("writeback.flush") as rec:
+        t0=time.perf_counter(); out={"files_pushed":0, "files_pulled":0, "error":""}
+        sync=_json_load(_wb_file(_SYNC)); bdir=_wb_file(_BATCH)
+        try:
+            for _ in range(2):  # a batch left by a crash first, then the live journal
+                if not os.path.exists(os.path.join(bdir,_JOURNAL)):
+                    with WRITE_LOCK:
+                        ops=_wb_ops(_wb_file(_JOURNAL))
+                        if not ops: break
+                        shutil.rmtree(bdir, ignore_errors=True); os.makedirs(bdir)
+                        for f in {o["file"] for o in ops if o["op"]=="snapshot"}:
+                            if os.path.exists(_wb_file(f)): _copy_file(_wb_file(f), os.path.join(bdir,f), durable=True)
+                        os.replace(_wb_file(_JOURNAL), os.path.join(bdir,_JOURNAL))
+                out["files_pushed"]+=_wb_push(bdir, sync)
+            out["files_pulled"]=_wb_pull(sync, force_pull)
+        except OSError as e:
+            out["error"]=f"{type(e).__name__}: {e}"  # shared dir unreachable/locked: the journal keeps everything for the next try
+        _json_save(_wb_file(_SYNC), sync)
+        out.update(pending=len(_wb_ops(_wb_file(_JOURNAL))), ms=round((time.perf_counter()-t0)*1000,1), ts=time.time())
+        if rec: rec.update(rows=out["files_pushed"]+out["files_pulled"])
+    _WB_STATE[current_site()]=out
+    return out
+
+def writeback_recover():
+    # First use of a site in this process: replay anything a crash left behind, then make the local copy match
+    # the shared dir (a write that reached the local file but not the journal was never acknowledged).
+    crashed=os.path.exists(_wb_file(_JOURNAL)) or os.path.exists(_wb_file(_BATCH))
+    writeback_flush(force_pull=crashed)
+
+def _writeback_all():
+    for site in SITES:
+        try:
+            with use_site(site): writeback_flush()
+        except Exception as e: _WB_STATE[site]={"error":f"{type(e).__name__}: {e}", "ts":time.time()}
+
+_WRITEBACK = {"thread":None}
+def start_writeback(interval:float=WRITEBACK_SEC):
+    if not WRITEBACK_DIR or _WRITEBACK["thread"] is not None: return
+    def _loop():
+        while True:
+            time.sleep(interval); _writeback_all()
+    th=threading.Thread(target=_loop, name="cc-writeback", daemon=True)
+    _WRITEBACK["thread"]=th; th.start()
+    atexit.register(_writeback_all)
+
+def writeback_status()->list:
+    out=[]
+    for site,w in list(_WB_STATE.items()):
+        with use_site(site):
+            out.append({"site":site or "(default)", "local":PATHS["root"], "shared":PATHS["shared"],
+                        "pending":len(_wb_ops(_wb_file(_JOURNAL))), "last_flush":epoch_to_str(w["ts"]) if w.get("ts") else "",
+                        "ms":w.get("ms"), "pushed":w.get("files_pushed",0), "pulled":w.get("files_pulled",0), "error":w.get("error","")})
+    return out
+
+# ===== Typed schema =====
+# Frames are read as str and typed here. Anything not listed becomes an Arrow-backed string
+# (falls back to pandas "string" without pyarrow). Write paths keep plain str frames; typed
+# frames go back to str via to_str_frame() at the UI/CSV boundary.
+try:
+    import pyarrow  # noqa: F401
+    STR_DTYPE = "string[pyarrow]"
+except Exception:
+    STR_DTYPE = "string"
+SCHEMAS = {
+    "assign":{"assigned_by":"category","assignee":"category","priority":"category","status":"category",
+              "lock_owner":"category","expected_qty":"Int32"},
+    "subs":{"assignee":"category","variance_flag":"category","issue_type":"category","device_id":"category",
+            "counted_qty":"Int32","expected_qty":"Int32","variance":"Int32"},
+    "inv":{"expected_qty":"Int32"},
+}
+
+def _to_int32(s:pd.Series)->pd.Series:
+    num=pd.to_numeric(s, errors="coerce")
+    if (num.notna() & ((num%1)!=0)).any(): return num.astype("Float64")  # fractional qty: keep it exact
+    return num.astype("Int32")
+
+def apply_schema(df:pd.DataFrame, kind:str)->pd.DataFrame:
+    spec=SCHEMAS.get(kind,{}); out={}
+    for c in df.columns:
+        s=df[c]
+        if not (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)): out[c]=s; continue
+        typ=spec.get(c, STR_DTYPE)
+        out[c]=_to_int32(s) if typ=="Int32" else s.astype(typ)
+    return pd.DataFrame(out, index=df.index)
+
+def to_str_frame(df:pd.DataFrame)->pd.DataFrame:
+    out={}
+    for c in df.columns:
+        s=df[c]
+        if pd.api.types.is_datetime64_any_dtype(s) or pd.api.types.is_object_dtype(s): out[c]=s; continue
+        out[c]=s.astype(object).where(s.notna(), "").astype(str)
+    return pd.DataFrame(out, index=df.index)
+
+def lot_normalize(x:str)->str:
+    if x is None or (isinstance(x,float) and pd.isna(x)): return ""
+    s = re.sub(r"\D","", str(x))
+    s = re.sub(r"^0+","", s)
+    return s or ""
+
+def qty_str(v)->str:
+    # "15.0" / 15 / pd.NA -> "15" / "15" / ""
+    if v is None or (not isinstance(v,str) and pd.isna(v)) or str(v).strip()=="": return ""
+    try: return str(int(float(v)))
+    except Exception: return str(v)
+
+# ===== Time helpers =====
+def now_local(): return datetime.now(ZoneInfo(TZ_NAME))
+def now_str(): return now_local().strftime(TS_FMT)
+def stamp_pair():
+    # (display, UTC ISO) from one clock reading
+    now=now_local(); return now.strftime(TS_FMT), now.astimezone(timezone.utc).strftime(ISO_FMT)
+def mk_id(prefix): return f"{prefix}-{now_local().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6].upper()}"
+def parse_ts(s:str):
+    try:
+        dt=datetime.strptime(s, TS_FMT)
+        return dt.replace(tzinfo=ZoneInfo(TZ_NAME))
+    except Exception:
+        return None
+def epoch_to_str(ep:float)->str: return datetime.fromtimestamp(ep, ZoneInfo(TZ_NAME)).strftime(TS_FMT)
+
+def _blank(df:pd.DataFrame, col:str)->pd.Series:
+    return df[col] if col in df.columns else pd.Series("", index=df.index, dtype=object)
+
+def parse_ts_series(iso:pd.Series, disp:pd.Series=None)->pd.Series:
+    # Vectorized: UTC ISO column first, display strings only where the ISO value is missing.
+    ts=pd.to_datetime(iso, format="ISO8601", utc=True, errors="coerce")
+    if disp is not None:
+        need=ts.isna() & (disp.astype(str).str.strip()!="")
+        if need.any():
+            loc=pd.to_datetime(disp[need], format=TS_FMT, errors="coerce")
+            if loc.isna().any():  # hand-edited logs ("10/24/2025 11:13")
+                loc=loc.fillna(pd.to_datetime(disp[need][loc.isna()], format="mixed", errors="coerce"))
+            ts.loc[need]=loc.dt.tz_localize(TZ_NAME, ambiguous="NaT", nonexistent="NaT").dt.tz_convert("UTC")
+    return ts.dt.tz_convert(TZ_NAME)
+
+def add_ts_column(df:pd.DataFrame, kind:str, out:str="ts")->pd.DataFrame:
+    disp_col, iso_col = TS_PAIRS[kind]
+    df[out]=parse_ts_series(_blank(df,iso_col), _blank(df,disp_col))
+    return df
+
+def day_bounds(day=None):
+    # [local midnight, next local midnight) for range filters
+    start=pd.Timestamp(day if day is not None else now_local()).tz_convert(TZ_NAME).normalize()
+    return start, start+pd.DateOffset(days=1)
+
+# ===== Leases =====
+# assignment_leases.json: {assignment_id: {"owner":..., "start":epoch, "exp":epoch}}
+# The file only holds live locks, so acquire/renew/release cost O(1) in the number of assignments.
+_LEASES = {}   # lease file path -> {"sig":(mtime_ns, size), "data":{...}}
+
+def _leases_load()->dict:
+    fp=PATHS["leases"]; cache=_LEASES.setdefault(fp, {"sig":None, "data":{}})
+    try: sig=_file_sig(fp)
+    except OSError: cache.update(sig=None, data={}); return cache["data"]
+    if sig!=cache["sig"]:
+        try:
+            with open(fp,"r",encoding="utf-8") as f: data=json.load(f)
+            cache.update(sig=sig, data=(data if isinstance(data,dict) else {}))
+        except Exception:
+            pass  # partially written by another writer; keep the last good copy
+    return cache["data"]
+
+def _leases_save(data:dict):
+    fp=PATHS["leases"]; tmp=fp+".tmp"
+    with open(tmp,"w",encoding="utf-8") as f: json.dump(data,f,separators=(",",":"))
+    _durable(tmp); sig=_file_sig(tmp)  # rename keeps mtime/size; stat before another writer can replace fp
+    os.replace(tmp,fp); _wb_note(fp, "snapshot")
+    _LEASES[fp]={"sig":sig, "data":data}
+
+def lease_get(assignment_id:str):
+    with WRITE_LOCK: return _leases_load().get(assignment_id)
+
+def lease_put(assignment_id:str, owner:str, minutes:int=LOCK_MINUTES)->dict:
+    with WRITE_LOCK:
+        data=dict(_leases_load()); now=time.time()
+        cur=data.get(assignment_id)
+        start = cur["start"] if (cur and cur.get("owner","").lower()==owner.lower() and cur.get("exp",0)>now) else now
+        data[assignment_id]={"owner":owner, "start":start, "exp":now+minutes*60}
+        _leases_save(data)
+        return data[assignment_id]
+
+def lease_release(assignment_id:str): lease_release_many([assignment_id])
+def lease_release_many(assignment_ids):
+    with WRITE_LOCK:
+        data=_leases_load()
+        drop=[a for a in assignment_ids if a in data]
+        if not drop: return
+        data=dict(data)
+        for a in drop: data.pop(a,None)
+        _leases_save(data)
+
+def _lease_overlay(row:dict)->dict:
+    l=_leases_load().get(row.get("assignment_id",""))
+    if l: row.update(lock_owner=l.get("owner",""), lock_start_ts=epoch_to_str(l.get("start",0)), lock_expires_ts=epoch_to_str(l.get("exp",0)))
+    return row
+
+def apply_leases(df:pd.DataFrame)->pd.DataFrame:
+    # Overlay live lease info onto the lock_* display columns
+    data=_leases_load()
+    if df.empty or not data: return df
+    ids=df["assignment_id"]
+    hit=ids.isin(data.keys())
+    if not hit.any(): return df
+    df.loc[hit,"lock_owner"]=ids[hit].map(lambda a: data[a].get("owner",""))
+    df.loc[hit,"lock_start_ts"]=ids[hit].map(lambda a: epoch_to_str(data[a].get("start",0)))
+    df.loc[hit,"lock_expires_ts"]=ids[hit].map(lambda a: epoch_to_str(data[a].get("exp",0)))
+    return df
+
+# ===== Assignments / Submissions =====
+def load_assignments(typed:bool=False):
+    df = read_csv_locked(PATHS["assign"], ASSIGN_COLS)
+    for c in LOCK_COLS:
+        if c not in df.columns: df[c]=""
+    df = apply_leases(df)
+    return apply_schema(df, "assign") if typed else df
+def save_assignments(df:pd.DataFrame, changed:list=None):
+    # changed: assignment_ids whose rows differ from the file, so the scan index updates only those
+    for c in ASSIGN_COLS:
+        if c not in df.columns: df[c]=""
+    out=df[ASSIGN_COLS].copy()
+    out[LOCK_COLS]=""  # lock state lives in the lease store, not in the assignments file
+    with WRITE_LOCK, timed("assignments.save") as rec:
+        pre=_sig_or_none(PATHS["assign"])
+        dataframe_to_csv_utf8(out, PATHS["assign"])
+        if rec: rec.update(rows=len(out), bytes_out=os.path.getsize(PATHS["assign"]))
+        if changed is None: _scan_after_write(pre, lambda ix: ix.reset(out))
+        else: _scan_after_write(pre, lambda ix: ix.upsert(out[out["assignment_id"].isin(changed)]))
+
+def load_submissions(with_ts:bool=False, typed:bool=False):
+    fp=PATHS["subs"]
+    if not (with_ts or typed): return read_csv_locked(fp, SUBMIT_COLS)
+    def _build():
+        df=read_csv_locked(fp, SUBMIT_COLS)
+        if with_ts: df=add_ts_column(df, "subs")
+        return apply_schema(df, "subs") if typed else df
+    # typed/ts frames are read-only by convention, so a shallow copy is enough
+    return cached_frame(fp, f"subs:{int(with_ts)}{int(typed)}", _build).copy(deep=False)
+
+# ===== Inventory =====
+def load_cached_inventory()->pd.DataFrame:
+    # One typed inventory frame per site, shared by every session on that site (treat as read-only)
+    fp=PATHS["inv_csv"]
+    if not os.path.exists(fp): return pd.DataFrame(columns=INV_COLS)
+    def _build():
+        with timed("inventory.load") as rec:
+            try: inv=apply_schema(read_csv_fallback(fp, dtype=str), "inv")
+            except Exception: return None
+            if rec: rec.update(rows=len(inv), bytes_in=os.path.getsize(fp))
+        return inv
+    inv=cached_frame(fp, "inv", _build)
+    return inv if inv is not None else pd.DataFrame(columns=INV_COLS)
+
+def save_inventory_cache(df:pd.DataFrame):
+    fp=PATHS["inv_csv"]
+    with WRITE_LOCK: dataframe_to_csv_utf8(df, fp)
+    FRAME_CACHE.put(current_site(), (os.path.abspath(fp),"inv"), (_file_sig(fp), apply_schema(df, "inv")))
+
+def save_inventory_mapping(mapping:dict):
+    with open(PATHS["inv_map"],"w",encoding="utf-8") as f: json.dump(mapping,f,indent=2)
+    _wb_note(PATHS["inv_map"], "snapshot")
+def load_inventory_mapping()->dict:
+    if os.path.exists(PATHS["inv_map"]):
+        try: return json.load(open(PATHS["inv_map"],"r",encoding="utf-8"))
+        except Exception: return {}
+    return {}
+
+def normalize_inventory_df(df:pd.DataFrame, mapping:dict)->pd.DataFrame:
+    out=pd.DataFrame()
+    out["location"]=df[mapping.get("location","")].astype(str) if mapping.get("location","") in df.columns else ""
+    out["sku"]=df[mapping.get("sku","")].astype(str) if mapping.get("sku","") in df.columns else ""
+    lot_col=mapping.get("lot_number","")
+    out["lot_number"]=df[lot_col].astype(str).map(lot_normalize) if lot_col in df.columns else ""
+    out["pallet_id"]=df[mapping.get("pallet_id","")].astype(str) if mapping.get("pallet_id","") in df.columns else ""
+    qty_col=mapping.get("expected_qty","")
+    if qty_col in df.columns:
+        q=pd.to_numeric(df[qty_col], errors="coerce").fillna("").astype(str)
+        out["expected_qty"]=q
+    else:
+        out["expected_qty"]=""
+    for c in ["location","sku","pallet_id"]:
+        out[c]=out[c].astype(str).str.strip()
+    return out.fillna("")
+
+# Multi-file / multi-sheet ingest: one task per (file, sheet) in a process pool, since the Excel
+# readers are pure Python and hold the GIL. Parts are normalized with the mapping, then
+# concatenated and de-duplicated on (location, pallet_id), later files winning.
+INGEST_WORKERS = int(os.getenv("CC_INGEST_WORKERS", 0)) or (os.cpu_count() or 2)
+
+def _excel_engine(name:str)->str: return "xlrd" if name.lower().endswith(".xls") else "openpyxl"
+
+def excel_sheet_names(name:str, data:bytes)->list:
+    if name.lower().endswith(".csv"): return [""]
+    if _excel_engine(name)=="xlrd":
+        import xlrd
+        return xlrd.open_workbook(file_contents=data, on_demand=True).sheet_names()
+    import openpyxl
+    wb=openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    try: return list(wb.sheetnames)
+    finally: wb.close()
+
+def _ingest_part(task):
+    # Runs in a worker process: (label, name, data, sheet, mapping) -> (label, normalized frame, stats)
+    label, name, data, sheet, mapping = task
+    t0=time.perf_counter(); stats={"part":label, "rows":0, "ms":0.0, "error":"", "missing":""}
+    try:
+        if name.lower().endswith(".csv"):
+            raw=read_csv_fallback(io.BytesIO(data), dtype=str)
+        else:
+            raw=pd.read_excel(io.BytesIO(data), sheet_name=sheet, dtype=str, engine=_excel_engine(name)).fillna("")
+        stats["missing"]=", ".join(k for k,v in mapping.items() if v and v not in raw.columns)
+        out=normalize_inventory_df(raw, mapping)
+        stats["rows"]=len(out)
+    except Exception as e:
+        out=pd.DataFrame(columns=INV_COLS); stats["error"]=f"{type(e).__name__}: {e}"
+    stats["ms"]=round((time.perf_counter()-t0)*1000,1)
+    return label, out, stats
+
+def ingest_inventory(files:list, mapping:dict, sheets:dict=None, workers:int=None):
+    # files: [(name, bytes)]; sheets: {name: [sheet, ...]} (missing name = every sheet). -> (snapshot, report)
+    t0=time.perf_counter(); sheets=sheets or {}
+    tasks=[]
+    for name,data in files:
+        try: names=sheets.get(name) or excel_sheet_names(name, data)
+        except Exception: names=[""]  # unreadable: let the part report the error
+        for sh in names:
+            tasks.append((f"{name}:{sh}" if sh else name, name, data, sh or 0, mapping))
+    n=max(1, min(workers or INGEST_WORKERS, len(tasks)))
+    with timed("inventory.ingest", parts=len(tasks), workers=n) as rec:
+        if n==1:
+            results=[_ingest_part(tk) for tk in tasks]
+        else:
+            import multiprocessing as mp
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: the server process has threads, and forking it is not safe
+            with ProcessPoolExecutor(max_workers=n, mp_context=mp.get_context("spawn")) as ex:
+                results=list(ex.map(_ingest_part, tasks))
+        parts=[df for _,df,_ in results if not df.empty]
+        snap=pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=INV_COLS)
+        before=len(snap)
+        if before:
+            pal=snap["pallet_id"].astype(str).str.strip()
+            # pallets dedupe on (location, pallet_id); rows without a pallet only drop exact repeats
+            key=snap["location"].str.lower()+_KSEP+pal.str.lower()
+            dup=(pal!="") & key.duplicated(keep="last")
+            dup|=(pal=="") & snap.duplicated(keep="last")
+            snap=snap[~dup].reset_index(drop=True)
+        if rec: rec["rows"]=len(snap)
+    return snap, {"parts":[s for _,_,s in results], "rows_in":before, "rows":len(snap), "duplicates":before-len(snap),
+                  "workers":n, "ms":round((time.perf_counter()-t0)*1000,1)}
+
+def inventory_locations()->list:
+    # Sorted location list for the Assign multiselect; rebuilt only when the inventory file changes
+    def _build():
+        inv=load_cached_inventory()
+        if inv.empty or "location" not in inv.columns: return []
+        return sorted(inv["location"].astype(str).str.strip().replace("nan","").dropna().unique().tolist())
+    fp=PATHS["inv_csv"]
+    return cached_frame(fp, "locs", _build) if os.path.exists(fp) else []
+
+def inv_lookup_expected(location:str, sku:str="", lot:str="", pallet_id:str=""):
+    inv=load_cached_inventory()
+    if inv.empty or "expected_qty" not in inv.columns: return None
+    loc=(location or "").strip(); sku=(sku or "").strip(); pal=(pallet_id or "").strip(); lotN=lot_normalize(lot)
+    if loc=="" and pal=="" and sku=="" and lotN=="": return None
+    candidates = [
+        {"location":loc,"pallet_id":pal,"lot_number":lotN,"sku":sku},
+        {"location":loc,"pallet_id":pal,"lot_number":lotN},
+        {"location":loc,"pallet_id":pal,"sku":sku},
+        {"location":loc,"pallet_id":pal},
+        {"location":loc,"lot_number":lotN,"sku":sku},
+        {"location":loc,"lot_number":lotN},
+        {"location":loc,"sku":sku},
+        {"location":loc},
+    ]
+    for cond in candidates:
+        tmp=inv
+        for k,v in cond.items():
+            if v!="":
+                tmp = tmp[tmp[k].astype(str).str.strip().str.lower()==str(v).strip().lower()]
+        if not tmp.empty:
+            for val in tmp["expected_qty"].tolist():
+                try: return int(float(val))
+                except Exception: continue
+    return None
+
+# Snapshot diff on (location, pallet_id): pandas merges are hash joins, so a 20k-row refresh is a few merges
+_KSEP = "\x1f"
+def _inv_keyed(df:pd.DataFrame)->pd.DataFrame:
+    out=pd.DataFrame({c:(df[c].astype("string").fillna("").str.strip() if c in df.columns else "") for c in INV_COLS}, index=df.index)
+    out=out.astype(object)
+    out["_qty"]=pd.to_numeric(out["expected_qty"], errors="coerce")
+    out["_pal"]=out["pallet_id"].str.lower()
+    out["_k"]=out["location"].str.lower()+_KSEP+out["_pal"]
+    return out.drop_duplicates("_k", keep="first")
+
+def inventory_diff(old:pd.DataFrame, new:pd.DataFrame)->dict:
+    o=_inv_keyed(old); n=_inv_keyed(new)
+    m=o.merge(n, on="_k", how="outer", suffixes=("_old","_new"), indicator=True)
+    both=m[m["_merge"]=="both"]
+    q_old, q_new = both["_qty_old"], both["_qty_new"]
+    qty_changed=both[~((q_old==q_new) | (q_old.isna() & q_new.isna()))]
+    attr_changed=both[(both["sku_old"]!=both["sku_new"]) | (both["lot_number_old"]!=both["lot_number_new"])]
+    gone=m[m["_merge"]=="left_only"]; came=m[m["_merge"]=="right_only"]
+    # same pallet_id removed from one location and added at another = moved
+    g=gone[gone["_pal_old"]!=""].drop_duplicates("_pal_old"); c=came[came["_pal_new"]!=""].drop_duplicates("_pal_new")
+    mv=g.merge(c, left_on="_pal_old", right_on="_pal_new", suffixes=("","_to"))
+    moved=pd.DataFrame({"pallet_id":mv["pallet_id_new_to"], "from_location":mv["location_old"], "to_location":mv["location_new_to"],
+                        "old_qty":mv["expected_qty_old"].map(qty_str), "new_qty":mv["expected_qty_new_to"].map(qty_str), "_k_from":mv["_k"], "_k_to":mv["_k_to"]})
+    cols_old={f"{c}_old":c for c in INV_COLS}; cols_new={f"{c}_new":c for c in INV_COLS}
+    return {
+        "added": came[~came["_k"].isin(moved["_k_to"])][list(cols_new)+["_k"]].rename(columns=cols_new).reset_index(drop=True),
+        "removed": gone[~gone["_k"].isin(moved["_k_from"])][list(cols_old)+["_k"]].rename(columns=cols_old).reset_index(drop=True),
+        "moved": moved.reset_index(drop=True),
+        "qty_changed": pd.DataFrame({"location":qty_changed["location_new"], "pallet_id":qty_changed["pallet_id_new"], "sku":qty_changed["sku_new"],
+                                     "old_qty":qty_changed["expected_qty_old"].map(qty_str), "new_qty":qty_changed["expected_qty_new"].map(qty_str),
+                                     "_k":qty_changed["_k"]}).reset_index(drop=True),
+        "attr_changed": pd.DataFrame({"location":attr_changed["location_new"], "pallet_id":attr_changed["pallet_id_new"],
+                                      "old_sku":attr_changed["sku_old"], "new_sku":attr_changed["sku_new"],
+                                      "old_lot":attr_changed["lot_number_old"], "new_lot":attr_changed["lot_number_new"]}).reset_index(drop=True),
+        "unchanged": int(len(both))-int(len(qty_changed.index.union(attr_changed.index))),
+    }
+
+def _refresh_open_assignments(diff:dict)->dict:
+    # Open assignments follow the new snapshot: new expected_qty on qty changes; moved pallets follow the pallet
+    df=read_csv_locked(PATHS["assign"], ASSIGN_COLS)
+    if df.empty: return {"qty":0, "moved":0}
+    key=df["location"].astype(str).str.strip().str.lower()+_KSEP+df["pallet_id"].astype(str).str.strip().str.lower()
+    open_=df["status"].isin(OPEN_STATUSES)
+    qmap=dict(zip(diff["qty_changed"]["_k"], diff["qty_changed"]["new_qty"].map(qty_str)))
+    newq=key.map(qmap)
+    hit_q=open_ & newq.notna() & (newq!=df["expected_qty"].map(qty_str))
+    df.loc[hit_q,"expected_qty"]=newq[hit_q]
+    mv=diff["moved"]
+    taken=set(key[open_])  # do not relocate onto a pallet that already has an open assignment
+    mv=mv[~mv["_k_to"].isin(taken)]
+    hit_m=open_ & key.isin(mv["_k_from"])
+    if hit_m.any():
+        mk=mv.set_index("_k_from")
+        df.loc[hit_m,"location"]=key[hit_m].map(mk["to_location"])
+        df.loc[hit_m,"expected_qty"]=key[hit_m].map(mk["new_qty"])
+    changed=df.loc[hit_q|hit_m,"assignment_id"].tolist()
+    if changed: save_assignments(df, changed=changed)
+    return {"qty":int(hit_q.sum()), "moved":int(hit_m.sum())}
+
+def refresh_inventory(new:pd.DataFrame)->dict:
+    # Upload path: diff against the cached snapshot, write only if something changed, then fix open assignments
+    t0=time.perf_counter()
+    with WRITE_LOCK, timed("inventory.refresh") as rec:
+        diff=inventory_diff(load_cached_inventory(), new)
+        n_changes=sum(len(diff[k]) for k in ("added","removed","moved","qty_changed","attr_changed"))
+        upd={"qty":0, "moved":0}
+        if n_changes or not os.path.exists(PATHS["inv_csv"]):
+            save_inventory_cache(new)
+            upd=_refresh_open_assignments(diff)
+        if rec: rec.update(rows=len(new))
+    for k in ("added","removed","moved","qty_changed"): diff[k]=diff[k].drop(columns=[c for c in diff[k].columns if c.startswith("_k")])
+    return {**diff, "rows":len(new), "changes":n_changes, "assign_qty_updated":upd["qty"], "assign_moved":upd["moved"],
+            "ms":round((time.perf_counter()-t0)*1000,1)}
+
+# ===== Timestamp migration =====
+def _migrate_ts_file(path:str, kind:str, columns:list)->int:
+    if not os.path.exists(path): return 0
+    disp_col, iso_col = TS_PAIRS[kind]
+    with WRITE_LOCK:
+        df=read_csv_locked(path, columns)
+        if df.empty and iso_col in df.columns: return 0
+        iso=_blank(df, iso_col)
+        need=(iso.astype(str).str.strip()=="") & (_blank(df, disp_col).astype(str).str.strip()!="")
+        if iso_col in df.columns and not need.any(): return 0
+        if need.any():
+            ts=parse_ts_series(pd.Series("", index=df.index[need]), df.loc[need, disp_col])
+            iso=iso.copy(); iso.loc[need]=ts.dt.tz_convert("UTC").dt.strftime(ISO_FMT).fillna("")
+        df[iso_col]=iso
+        ordered=[c for c in columns if c in df.columns]+[c for c in df.columns if c not in columns]
+        dataframe_to_csv_utf8(df[ordered], path)
+        return int(need.sum())
+
+_MIGRATED = set()   # sites already migrated in this process
+def migrate_timestamps(force:bool=False)->dict:
+    # Backfill created_utc / timestamp_utc from the display strings for the current site; idempotent.
+    site=current_site()
+    if site in _MIGRATED and not force: return {}
+    res={"assign":_migrate_ts_file(PATHS["assign"], "assign", ASSIGN_COLS),
+         "subs":_migrate_ts_file(PATHS["subs"], "subs", SUBMIT_COLS)}
+    _MIGRATED.add(site)
+    return res
+
+# ===== Locks =====
+def lock_active(row:pd.Series)->bool:
+    exp=parse_ts(row.get("lock_expires_ts","")); return bool(exp and exp>now_local())
+def lock_owned_by(row:pd.Series, user:str)->bool:
+    return (row.get("lock_owner","").strip().lower()==(user or "").strip().lower())
+
+def start_or_renew_lock(assignment_id:str, user:str):
+    if not assignment_id or not user: return False, "Missing assignment or user"
+    user=user.strip()
+    with WRITE_LOCK:
+        cur=lease_get(assignment_id)
+        renewing = bool(cur and cur.get("owner","").lower()==user.lower() and cur.get("exp",0)>time.time())
+        if not renewing:
+            # first acquire flips the row to In Progress; renewals only touch the lease store
+            df=read_csv_locked(PATHS["assign"], ASSIGN_COLS)
+            ix=df.index[df["assignment_id"]==assignment_id] if "assignment_id" in df.columns else []
+            if len(ix)==0: return False, "Assignment not found"
+            if df.loc[ix[0],"status"]!="In Progress":
+                df.loc[ix[0],"status"]="In Progress"
+                save_assignments(df, changed=[assignment_id])
+        lease=lease_put(assignment_id, user)
+    exp=datetime.fromtimestamp(lease["exp"], ZoneInfo(TZ_NAME))
+    return True, f"Locked by {user} until {exp.strftime('%I:%M %p')}"
+
+def release_lock(assignment_id:str):
+    if assignment_id: lease_release(assignment_id)
+
+def validate_lock_for_submit(assignment_id:str, user:str, df:pd.DataFrame=None)->(bool,str):
+    if not assignment_id: return True, "Ad-hoc submission"
+    df=load_assignments() if df is None else df
+    row=df[df["assignment_id"]==assignment_id]
+    if row.empty: return True, "Assignment not found; proceeding"
+    r=row.iloc[0]
+    if not lock_active(r): return True, "Lock expired or not set; proceeding"
+    if lock_owned_by(r,user): return True, "Lock valid for user"
+    return False, f"Locked by {r.get('lock_owner','?')} until {r.get('lock_expires_ts','?')}"
+
+def mark_submitted(assignment_id:str): mark_submitted_many([assignment_id])
+def mark_submitted_many(assignment_ids):
+    ids=[a for a in assignment_ids if a]
+    if not ids: return
+    with WRITE_LOCK:
+        df=read_csv_locked(PATHS["assign"], ASSIGN_COLS)
+        if not df.empty:
+            hit=df["assignment_id"].isin(ids)
+            if hit.any():
+                df.loc[hit,"status"]="Submitted"
+                save_assignments(df, changed=ids)
+        lease_release_many(ids)
+
+# ===== Counting workflow (shared by app.py and cc_api) =====
+# Results are (ok, code, info): code is None on success, otherwise one of
+# missing / belongs_to / already_submitted / locked_other / need_fields / count_invalid / expected_invalid / lock_failed;
+# info carries the fields the UI needs to format its message plus an English "msg".
+ISSUE_TYPES = ["None","Wrong Pallet ID","Wrong LOT Number","Location Empty","Damaged Pallet","Other"]
+_MSGS = {"missing":"Assignment no longer exists.", "belongs_to":"This assignment belongs to {assignee}.",
+         "already_submitted":"This assignment is already Submitted.", "locked_other":"Locked by {who} until {until}",
+         "need_fields":"Assignee and Location are required.", "count_invalid":"Enter a valid non-negative integer for Counted QTY.",
+         "expected_invalid":"Expected QTY must be a non-negative integer (got {value}).",
+         "scan_no_match":"No open assignment for {code}.", "scan_ambiguous":"{n} open assignments at {code}; scan the pallet ID."}
+def _fail(err, **info): return False, err, {**info, "msg":_MSGS.get(err,"{msg}").format(**{"msg":"", **info})}
+
+def parse_count(s):
+    if isinstance(s,int) and not isinstance(s,bool): return s if s>=0 else "invalid"
+    s=str(s if s is not None else "").strip()
+    if s=="": return None
+    if not re.fullmatch(r"\d+", s): return "invalid"
+    return int(s)
+
+def parse_expected(v):
+    # like parse_count, but whole floats ("15.0" from Excel / float columns) are accepted
+    if isinstance(v,float) and v.is_integer(): v=int(v)
+    elif isinstance(v,str) and re.fullmatch(r"\s*\d+\.0*\s*", v): v=v.strip().split(".")[0]
+    return parse_count(v)
+
+@perf_op("lock.claim")
+def claim_assignment(assignment_id:str, user:str, row:dict=None):
+    # My Assignments -> Perform Count: ownership/status/lock checks, then lock.
+    # row: the assignment as already known (scan index), which skips reading the assignments file.
+    with WRITE_LOCK:
+        if row is None:
+            df=load_assignments()
+            hit=df[df["assignment_id"]==assignment_id]
+            if hit.empty: return _fail("missing")
+            r=hit.iloc[0].to_dict()
+        else:
+            r=_lease_overlay(dict(row))
+        if str(r.get("assignee","")).strip().lower()!=str(user).strip().lower(): return _fail("belongs_to", assignee=r.get("assignee","?"))
+        if str(r.get("status","")).strip()=="Submitted": return _fail("already_submitted")
+        if lock_active(r) and not lock_owned_by(r, user): return _fail("locked_other", who=r.get("lock_owner","?"), until=r.get("lock_expires_ts","?"))
+        ok,msg=start_or_renew_lock(assignment_id, user)
+        if not ok: return _fail("lock_failed", msg=msg)
+    return True, None, {"msg":msg, "row":r}
+
+def build_submission_row(f:dict, counted:int, expected:int, ts=None)->dict:
+    issue=f.get("issue_type") or "None"
+    variance = counted - expected
+    ts_disp, ts_iso = ts or stamp_pair()
+    return {
+        "submission_id": mk_id("CCS"),
+        "assignment_id": f.get("assignment_id") or "",
+        "assignee": str(f.get("assignee","")).strip(),
+        "location": str(f.get("location","")).strip(),
+        "sku": str(f.get("sku","") or "").strip(),
+        "lot_number": lot_normalize(f.get("lot_number","")),
+        "pallet_id": str(f.get("pallet_id","") or "").strip(),
+        "counted_qty": int(counted),
+        "expected_qty": int(expected),
+        "variance": variance,
+        "variance_flag": ("Over" if variance>0 else ("Short" if variance<0 else "Match")),
+        "timestamp": ts_disp,
+        "device_id": str(f.get("device_id","") or ""), "note": str(f.get("note","") or "").strip(),
+        "issue_type": issue,
+        "actual_pallet_id": str(f.get("actual_pallet_id","") or "").strip() if issue!="None" else "",
+        "actual_lot_number": lot_normalize(f.get("actual_lot_number","")) if issue!="None" else "",
+        "timestamp_utc": ts_iso,
+    }
+
+@perf_op("submit.write")
+def submit_counts(items:list)->list:
+    # Validate every item against one assignments snapshot, then one append + one status write.
+    results=[None]*len(items); rows=[]; done=set()
+    with WRITE_LOCK:
+        dfA=load_assignments()
+        by_id=dfA.drop_duplicates("assignment_id").set_index("assignment_id", drop=False) if not dfA.empty else dfA
+        for i,f in enumerate(items):
+            assignee=str(f.get("assignee","") or "").strip(); aid=str(f.get("assignment_id","") or "").strip()
+            r = by_id.loc[aid] if (aid and aid in by_id.index) else None
+            if r is not None:  # fields the caller left out come from the assignment
+                f={**f, **{k:r.get(k,"") for k in ("location","pallet_id","sku","lot_number") if not str(f.get(k,"") or "").strip()}}
+            if not assignee or not str(f.get("location","") or "").strip(): results[i]=_fail("need_fields"); continue
+            if r is not None and str(r.get("assignee","")).strip().lower()!=assignee.lower():
+                results[i]=_fail("belongs_to", assignee=r.get("assignee","?")); continue
+            counted=parse_count(f.get("counted_qty"))
+            if counted in (None,"invalid"): results[i]=_fail("count_invalid"); continue
+            if aid and (aid in done or (r is not None and str(r.get("status","")).strip()=="Submitted")):
+                results[i]=_fail("already_submitted"); continue
+            ok,why=validate_lock_for_submit(aid, assignee, dfA)
+            if not ok: results[i]=_fail("locked_other", who=r.get("lock_owner","?"), until=r.get("lock_expires_ts","?")); continue
+            expected=f.get("expected_qty")
+            if expected in (None,""):
+                expected = qty_str(r.get("expected_qty","")) if r is not None else ""
+                if expected=="": expected=inv_lookup_expected(f.get("location",""), f.get("sku",""), f.get("lot_number",""), f.get("pallet_id",""))
+            exp=parse_expected(expected)
+            if exp=="invalid": results[i]=_fail("expected_invalid", value=str(expected)); continue
+            expected=exp or 0  # nothing known (no assignment / inventory match): variance against 0 as before
+            row=build_submission_row({**f, "assignment_id":aid}, counted, expected)
+            rows.append(row); done.add(aid)
+            results[i]=(True, None, {k:row[k] for k in ["submission_id","assignment_id","expected_qty","variance","variance_flag","timestamp_utc"]})
+        safe_append_rows(PATHS["subs"], rows, SUBMIT_COLS)
+        mark_submitted_many([r["assignment_id"] for r in rows])
+        if any(r["variance_flag"]!="Match" for r in rows): _auto_recount()
+    return results
+
+def submit_count(f:dict): return submit_counts([f])[0]
+
+# ===== Scan index (scan-first Perform Count) =====
+# Per-site, in-memory: pallet_id -> open assignments, location -> open assignments, pallet_id -> inventory row.
+# Our own writes patch it in place (safe_append_rows / save_assignments); a change to the file by another
+# process shows up as a different (mtime, size) and the next lookup rebuilds from disk.
+OPEN_STATUSES = ("Assigned","In Progress")
+_UNBUILT = object()
+def _key(v)->str: return "" if v is None or (isinstance(v,float) and pd.isna(v)) else str(v).strip().lower()
+
+class ScanIndex:
+    def __init__(self):
+        self.sig=_UNBUILT; self.lock=threading.Lock()
+        self.rows={}; self.by_pallet={}; self.by_loc={}
+        self.inv=None; self.inv_by_pallet={}
+    def reset(self, df):
+        with self.lock: self.rows={}; self.by_pallet={}; self.by_loc={}
+        self.upsert(df)
+    def upsert(self, rows):
+        recs=rows.to_dict("records") if isinstance(rows, pd.DataFrame) else rows
+        with self.lock:
+            for r in recs:
+                aid=str(r.get("assignment_id","") or "")
+                if not aid: continue
+                self._drop(aid)
+                if str(r.get("status","")).strip() not in OPEN_STATUSES: continue
+                r={c:("" if r.get(c) is None else r.get(c)) for c in ASSIGN_COLS}
+                self.rows[aid]=r
+                # dicts as ordered sets: creation order is kept for display
+                for m,k in ((self.by_pallet,_key(r["pallet_id"])),(self.by_loc,_key(r["location"]))):
+                    if k: m.setdefault(k,{})[aid]=None
+    def _drop(self, aid):
+        r=self.rows.pop(aid, None)
+        if r is None: return
+        for m,k in ((self.by_pallet,_key(r["pallet_id"])),(self.by_loc,_key(r["location"]))):
+            b=m.get(k)
+            if b is not None:
+                b.pop(aid, None)
+                if not b: m.pop(k, None)
+    def lookup(self, code:str):
+        k=_key(code)
+        with self.lock:
+            ids=list(self.by_pallet.get(k,())); kind="pallet"
+            if not ids: ids=list(self.by_loc.get(k,())); kind="location"
+            return (kind if ids else None), [dict(self.rows[a]) for a in ids]
+    def inventory_row(self, pallet_id:str):
+        inv=load_cached_inventory()  # same object until the inventory file changes
+        with self.lock:
+            if inv is not self.inv:
+                pal=inv["pallet_id"].astype(str).str.strip().str.lower() if "pallet_id" in inv.columns else pd.Series(dtype=str)
+                first=(pal!="") & ~pal.duplicated()
+                self.inv_by_pallet=dict(zip(pal[first], first.to_numpy().nonzero()[0].tolist()))
+                self.inv=inv
+            pos=self.inv_by_pallet.get(_key(pallet_id))
+        if pos is None: return None
+        return {c:qty_str(v) if c=="expected_qty" else ("" if pd.isna(v) else str(v)) for c,v in inv.iloc[pos].items()}
+
+_SCAN_INIT = threading.Lock()
+def _site_object(key:str, make):
+    # per-site index kept in FRAME_CACHE, so it goes (with the frames it points at) when the site is evicted
+    site=current_site()
+    with _SCAN_INIT:
+        obj=FRAME_CACHE.get(site, key)
+        if obj is None: obj=make(); FRAME_CACHE.put(site, key, obj)
+    return obj
+
+def scan_index()->ScanIndex:
+    idx=_site_object("scan_index", ScanIndex)
+    if idx.sig is _UNBUILT or idx.sig!=_sig_or_none(PATHS["assign"]):
+        with WRITE_LOCK, timed("scan.index_build") as rec:
+            sig=_sig_or_none(PATHS["assign"])
+            if idx.sig is _UNBUILT or idx.sig!=sig:
+                df=read_csv_locked(PATHS["assign"], ASSIGN_COLS)
+                idx.reset(df); idx.sig=sig
+                if rec: rec["rows"]=len(df)
+    return idx
+
+def _scan_after_write(pre_sig, apply):
+    # Called under WRITE_LOCK right after writing the assignments file
+    idx=FRAME_CACHE.get(current_site(), "scan_index")
+    if idx is None or idx.sig is _UNBUILT: return
+    if idx.sig!=pre_sig: idx.sig=_UNBUILT; return  # missed someone else's write: rebuild lazily
+    apply(idx); idx.sig=_sig_or_none(PATHS["assign"])
+
+def scan_resolve(code:str):
+    # -> (kind, open assignment rows, inventory row); kind is "pallet", "location" or None
+    idx=scan_index()
+    kind, rows = idx.lookup(code)
+    pal = code if kind!="location" else (rows[0].get("pallet_id","") if len(rows)==1 else "")
+    return kind, rows, (idx.inventory_row(pal) if pal else None)
+
+def scan_claim(code:str, user:str):
+    # Scan -> lock -> prefilled assignment row, without touching the assignments file unless the lock flips status
+    with timed("scan.claim") as rec:
+        code=(code or "").strip()
+        if not code: return _fail("need_fields")
+        kind, rows, inv = scan_resolve(code)
+        if rec: rec["rows"]=len(rows)
+        if not rows: return _fail("scan_no_match", code=code)
+        u=_key(user)
+        mine=[r for r in rows if _key(r.get("assignee"))==u]
+        if not mine: return _fail("belongs_to", assignee=rows[0].get("assignee","?"))
+        if len(mine)>1: return _fail("scan_ambiguous", code=code, n=len(mine), choices=mine)
+        r=mine[0]
+        ok, err, info = claim_assignment(r["assignment_id"], user, row=r)
+        if not ok: return ok, err, info
+        row=info["row"]
+        if inv:  # fill blanks from the inventory snapshot so Perform Count opens ready to count
+            for c in ("sku","lot_number","expected_qty"):
+                if str(row.get(c,"") or "").strip()=="": row[c]=inv.get(c,"")
+        return True, None, {**info, "kind":kind}
+
+# ===== Change feed (delta export for WMS reconciliation) =====
+# feed_watermarks.json: {consumer: {"submission_id", "timestamp_utc", "updated_utc", "assign": {assignment_id: status}}}
+# Submissions are append-only, so the cursor is the last exported submission_id and the delta is every
+# row after it in file (append) order; if that id is gone, rows newer than its timestamp_utc are used.
+# Assignments are rewritten in place, so their changes come from diffing statuses against the
+# consumer's last snapshot (deleted assignments show up as status "Deleted").
+FEED_FORMATS = ("csv","jsonl")
+FEED_ASSIGN_COLS = ["assignment_id","assignee","location","pallet_id","sku","lot_number","previous_status","status","observed_utc"]
+_CONSUMER_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+def _json_load(fp:str)->dict:
+    try:
+        with open(fp,"r",encoding="utf-8") as f: data=json.load(f)
+        return data if isinstance(data,dict) else {}
+    except (OSError, ValueError): return {}
+def _json_save(fp:str, data:dict):
+    tmp=fp+".tmp"
+    with open(tmp,"w",encoding="utf-8") as f: json.dump(data,f,separators=(",",":"))
+    _durable(tmp); os.replace(tmp,fp); _wb_note(fp, "snapshot")
+def _feed_load()->dict: return _json_load(PATHS["feed_wm"])
+
+def _check_consumer(consumer:str)->str:
+    if not _CONSUMER_RE.match(consumer or ""): raise ValueError(f"Invalid consumer name: {consumer!r}")
+    return consumer
+def feed_watermark(consumer:str)->dict: return _feed_load().get(_check_consumer(consumer), {})
+def feed_consumers()->list: return sorted(_feed_load())
+
+def _with_utc(subs:pd.DataFrame)->pd.DataFrame:
+    if "timestamp_utc" not in subs.columns: subs["timestamp_utc"]=""
+    blank=subs["timestamp_utc"].astype(str).str.strip()==""
+    if blank.any():  # not migrated yet: derive from the display timestamp
+        ts=parse_ts_series(pd.Series("", index=subs.index[blank]), subs.loc[blank,"timestamp"] if "timestamp" in subs.columns else None)
+        subs.loc[blank,"timestamp_utc"]=ts.dt.tz_convert("UTC").dt.strftime(ISO_FMT).fillna("")
+    return subs
+
+def _subs_after(subs:pd.DataFrame, last_id:str, last_ts:str)->pd.DataFrame:
+    if last_id or last_ts:  # legacy rows have no submission_id: fall back to the timestamp
+        pos=(subs["submission_id"]==last_id).to_numpy().nonzero()[0] if last_id else []
+        subs=subs.iloc[pos[-1]+1:] if len(pos) else subs[subs["timestamp_utc"]>last_ts]
+    return subs[[c for c in SUBMIT_COLS if c in subs.columns]].reset_index(drop=True)
+
+_TAIL_BYTES = 64
+def _subs_since(state:dict):
+    # Incremental read of the append-only submissions file. state is a cursor {"offset", "tail" (hex of the bytes
+    # just before offset), "submission_id", "timestamp_utc"}; a rewritten file no longer matches tail.
+    # -> (rows after the cursor, cursor at the last complete line, full frame if the offset was unusable else None)
+    fp=PATHS["subs"]
+    if not os.path.exists(fp): return pd.DataFrame(columns=SUBMIT_COLS), {"offset":0, "tail":""}, None
+    with open(fp,"rb") as f:
+        head=f.readline(); size=os.fstat(f.fileno()).st_size
+        off=int(state.get("offset") or 0); tail=bytes.fromhex(state.get("tail",""))
+        ok=bool(state) and len(head)<=off<=size and off>=len(tail)
+        if ok: f.seek(off-len(tail)); ok=f.read(len(tail))==tail
+        if ok:
+            chunk=f.read(size-off); chunk=chunk[:chunk.rfind(b"\n")+1]; end=off+len(chunk)  # a row mid-append waits for the next call
+        else:
+            f.seek(max(0,size-4096)); last=f.read(); end=size-len(last)+last.rfind(b"\n")+1
+        f.seek(max(0,end-_TAIL_BYTES)); cur={"offset":end, "tail":f.read(end-max(0,end-_TAIL_BYTES)).hex()}
+    if ok:
+        new=read_csv_fallback(io.BytesIO(head+chunk)) if chunk.strip() else pd.DataFrame(columns=SUBMIT_COLS)
+        return _with_utc(new.reindex(columns=SUBMIT_COLS, fill_value="")), cur, None
+    full=_with_utc(read_csv_locked(fp, SUBMIT_COLS).reindex(columns=SUBMIT_COLS, fill_value=""))
+    return _subs_after(full, state.get("submission_id",""), state.get("timestamp_utc","")) if state else full.iloc[0:0], cur, full
+
+def feed_delta(consumer:str):
+    # -> (submissions delta, assignment status changes, watermark to commit once the export is delivered)
+    with timed("feed.delta") as rec:
+        wm=feed_watermark(consumer)
+        last_id, last_ts = wm.get("submission_id",""), wm.get("timestamp_utc","")
+        subs=read_csv_locked(PATHS["subs"], SUBMIT_COLS).reindex(columns=SUBMIT_COLS, fill_value="")
+        delta=_subs_after(_with_utc(subs), last_id, last_ts)
+
+        assign=read_csv_locked(PATHS["assign"], ASSIGN_COLS)
+        snap=wm.get("assign", {})
+        now_iso=stamp_pair()[1]
+        cur=assign.drop_duplicates("assignment_id", keep="last") if not assign.empty else assign
+        status=dict(zip(cur["assignment_id"], cur["status"])) if not cur.empty else {}
+        ch=cur.assign(previous_status=cur["assignment_id"].map(snap).fillna("")) if not cur.empty else pd.DataFrame(columns=FEED_ASSIGN_COLS)
+        if not ch.empty: ch=ch[ch["previous_status"]!=ch["status"]]
+        gone=[a for a in snap if a not in status and snap[a]!="Deleted"]
+        if gone: ch=pd.concat([ch, pd.DataFrame({"assignment_id":gone, "previous_status":[snap[a] for a in gone], "status":"Deleted"})], ignore_index=True)
+        ch=ch.assign(observed_utc=now_iso).reindex(columns=FEED_ASSIGN_COLS).fillna("").reset_index(drop=True)
+
+        new_wm={"submission_id": delta["submission_id"].iloc[-1] if len(delta) else last_id,
+                "timestamp_utc": delta["timestamp_utc"].iloc[-1] if len(delta) else last_ts,
+                "updated_utc": now_iso, "assign": status, "rows": len(delta), "changes": len(ch)}
+        if rec: rec.update(rows=len(delta)+len(ch))
+    return delta, ch, new_wm
+
+def _feed_save(data:dict): _json_save(PATHS["feed_wm"], data)
+
+def feed_commit(consumer:str, wm:dict):
+    with WRITE_LOCK:
+        data=_feed_load(); data[_check_consumer(consumer)]=wm; _feed_save(data)
+
+def feed_reset(consumer:str):
+    with WRITE_LOCK:
+        data=_feed_load()
+        if data.pop(consumer, None) is not None: _feed_save(data)
+
+def feed_bytes(df:pd.DataFrame, fmt:str="csv")->bytes:
+    if fmt=="jsonl":
+        return "".join(json.dumps(r, ensure_ascii=False)+"\n" for r in df.to_dict("records")).encode("utf-8")
+    return df.to_csv(index=False).encode("utf-8")
+
+def feed_export(consumer:str, out_dir:str, fmt:str="csv", commit:bool=True)->dict:
+    # Write <out_dir>/<consumer>_{submissions,assignments}_<UTC stamp>.<fmt>; the watermark moves only after both files are written
+    if fmt not in FEED_FORMATS: raise ValueError(f"Unknown format: {fmt}")
+    subs, changes, wm = feed_delta(consumer)
+    ensure_dirs([out_dir])
+    stamp=datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    files={}
+    for name,df in (("submissions",subs),("assignments",changes)):
+        fp=os.path.join(out_dir, f"{consumer}_{name}_{stamp}.{fmt}"); tmp=fp+".tmp"
+        with open(tmp,"wb") as f: f.write(feed_bytes(df, fmt))
+        os.replace(tmp,fp); files[name]=fp
+    if commit: feed_commit(consumer, wm)
+    return {"consumer":consumer, "submissions":len(subs), "assignment_changes":len(changes),
+            "watermark":wm["submission_id"], "files":files, "committed":commit}
+
+# ===== Recounts =====
+# recount_rules.json holds the thresholds (edited under Discrepancies); recount_state.json is the cursor into the
+# append-only submissions file (byte offset plus the bytes just before it, so a rewritten file is noticed and the
+# cursor falls back to the last submission_id) and recent Over/Short times per location for the repeat rule.
+# An Over/Short submission is recounted when |variance| and |variance|/expected both clear min_abs / min_pct, when
+# its issue_type is listed, or when its location reaches repeat_count exceptions within repeat_days.
+# Recounts go to the least-loaded other counter and keep the original submission in source_submission_id.
+RECOUNT_DEFAULTS = {"enabled":False, "min_abs":1, "min_pct":0.0, "issue_types":[], "repeat_days":7, "repeat_count":3,
+                    "recount_recounts":False, "priority":"High", "counters":[]}
+
+def recount_rules()->dict:
+    r=_json_load(PATHS["recount_rules"])
+    return {**RECOUNT_DEFAULTS, **{k:v for k,v in r.items() if k in RECOUNT_DEFAULTS}}
+
+def save_recount_rules(rules:dict)->dict:
+    r={**RECOUNT_DEFAULTS, **{k:v for k,v in rules.items() if k in RECOUNT_DEFAULTS}}
+    r.update(min_abs=max(0,int(r["min_abs"])), min_pct=max(0.0,float(r["min_pct"])),
+             repeat_days=max(0,int(r["repeat_days"])), repeat_count=max(0,int(r["repeat_count"])),
+             enabled=bool(r["enabled"]), recount_recounts=bool(r["recount_recounts"]),
+             issue_types=[i for i in r["issue_types"] if i in ISSUE_TYPES and i!="None"],
+             counters=[str(c).strip() for c in r["counters"] if str(c).strip()])
+    with WRITE_LOCK:
+        _json_save(PATHS["recount_rules"], r)
+        if r["enabled"] and not _json_load(PATHS["recount_state"]): generate_recounts(r)  # start from the current end
+    return r
+
+def _exc_frame(df:pd.DataFrame)->pd.DataFrame:
+    return df[df["variance_flag"].isin(["Over","Short"])] if "variance_flag" in df.columns else df.iloc[0:0]
+
+def generate_recounts(rules:dict=None, counters:list=None)->dict:
+    # Evaluate submissions added since the last run; every recount is written with one append.
+    rules={**RECOUNT_DEFAULTS, **(rules or recount_rules())}
+    with WRITE_LOCK, timed("recount.generate") as rec:
+        t0=time.perf_counter()
+        state=_json_load(PATHS["recount_state"])
+        new, cur, full = _subs_since(state)
+        now=datetime.now(timezone.utc)
+        cutoff=(now-pd.Timedelta(days=rules["repeat_days"])).strftime(ISO_FMT)
+        hist={} if full is not None else state.get("history", {})
+        if full is not None and not state:  # first run: history from the file, nothing before now is recounted
+            for loc,ts in zip(_exc_frame(full)["location"], _exc_frame(full)["timestamp_utc"]):
+                if ts>=cutoff: hist.setdefault(_key(loc), []).append(ts)
+        elif full is not None:
+            seen=full.iloc[:len(full)-len(new)]
+            for loc,ts in zip(_exc_frame(seen)["location"], _exc_frame(seen)["timestamp_utc"]):
+                if ts>=cutoff: hist.setdefault(_key(loc), []).append(ts)
+
+        dfA=load_assignments()
+        if "source_submission_id" not in dfA.columns: dfA["source_submission_id"]=""
+        is_recount=set(dfA.loc[dfA["source_submission_id"].astype(str).str.strip()!="","assignment_id"])
+        linked=set(dfA["source_submission_id"].astype(str).str.strip())-{""}
+        open_=dfA[dfA["status"].isin(OPEN_STATUSES)]
+        busy={(_key(l),_key(p)) for l,p in zip(open_["location"], open_["pallet_id"])}
+        load={}
+        for a in open_["assignee"]: load[_key(a)]=load.get(_key(a),0)+1
+        roster=list(dict.fromkeys(counters or rules["counters"] or sorted(set(dfA["assignee"].astype(str).str.strip())-{""})))
+
+        rows=[]; skipped={}; disp, iso = stamp_pair()
+        exc=_exc_frame(new)
+        for r in exc.to_dict("records"):
+            lk=_key(r["location"])
+            hist.setdefault(lk, []).append(r["timestamp_utc"])
+            why=None
+            try: var=int(float(r.get("variance") or 0)); exp=int(float(r.get("expected_qty") or 0))
+            except ValueError: var,exp=0,0
+            pct=abs(var)*100.0/max(abs(exp),1)
+            n=sum(ts>=cutoff for ts in hist[lk])
+            if r.get("issue_type") in rules["issue_types"]: reason=f"issue: {r['issue_type']}"
+            elif rules["repeat_count"] and n>=rules["repeat_count"]: reason=f"repeat: {n} in {rules['repeat_days']}d"
+            elif abs(var)>=rules["min_abs"] and pct>=rules["min_pct"]: reason=f"variance {var:+d} ({pct:.0f}%)"
+            else: reason=None; why="below_threshold"
+            if why is None and r["submission_id"] in linked: why="already_linked"
+            if why is None and r.get("assignment_id") in is_recount and not rules["recount_recounts"]: why="is_recount"
+            if why is None and (lk,_key(r.get("pallet_id"))) in busy: why="open_assignment"
+            if why is None:
+                orig=_key(r.get("assignee"))
+                cands=[c for c in roster if _key(c)!=orig]
+                if not cands: why="no_counter"
+            if why: skipped[why]=skipped.get(why,0)+1; continue
+            who=min(cands, key=lambda c:(load.get(_key(c),0), roster.index(c)))
+            load[_key(who)]=load.get(_key(who),0)+1; busy.add((lk,_key(r.get("pallet_id"))))
+            rows.append({"assignment_id":mk_id("RC"), "assigned_by":"recount", "assignee":who, "location":r["location"],
+                         "sku":r.get("sku",""), "lot_number":r.get("lot_number",""), "pallet_id":r.get("pallet_id",""),
+                         "expected_qty":qty_str(r.get("expected_qty","")), "priority":rules["priority"], "status":"Assigned",
+                         "created_ts":disp, "due_date":"", "notes":f"Recount of {r['submission_id']} ({r.get('assignee','')}): {reason}",
+                         "created_utc":iso, "source_submission_id":r["submission_id"]})
+        safe_append_rows(PATHS["assign"], rows, ASSIGN_COLS)
+        last=new.iloc[-1] if len(new) else None
+        _json_save(PATHS["recount_state"], {**cur,
+            "submission_id": last["submission_id"] if last is not None else state.get("submission_id", full["submission_id"].iloc[-1] if full is not None and len(full) else ""),
+            "timestamp_utc": last["timestamp_utc"] if last is not None else state.get("timestamp_utc", full["timestamp_utc"].iloc[-1] if full is not None and len(full) else ""),
+            "history": {k:[ts for ts in v if ts>=cutoff] for k,v in hist.items() if any(ts>=cutoff for ts in v)},
+            "updated_utc": iso})
+        if rec: rec.update(rows=len(new))
+        return {"scanned":len(new), "exceptions":len(exc), "created":len(rows), "skipped":skipped,
+                "assignment_ids":[r["assignment_id"] for r in rows], "baseline":not state, "full_read":full is not None,
+                "ms":round((time.perf_counter()-t0)*1000,1)}
+
+def _auto_recount():
+    # after a submit with Over/Short rows; a recount problem must never fail the count itself
+    try:
+        rules=recount_rules()
+        if rules["enabled"]: generate_recounts(rules)
+    except Exception: pass
+
+# ===== Count coverage =====
+# Per-site, in-memory: last counted (UTC ISO) per location and per location+pallet, and the locations counted on
+# each local day. Built once from the submissions history, then fed only the rows appended since (_subs_since),
+# so coverage queries map the inventory's location list against dicts instead of joining the whole history.
+COVERAGE_ZONES = ("Rack","TUN","Bulk")
+COVERAGE_COLS = ["location","zone","aisle","last_counted_utc","counted"]
+
+def is_bulk_location(loc:str)->bool:
+    s=(loc or "").strip().upper()
+    return not (bool(re.fullmatch(r"\d{8}", s)) or s.startswith("TUN"))
+def location_zone(loc:str)->str:
+    s=(loc or "").strip().upper()
+    return "Bulk" if is_bulk_location(s) else ("TUN" if s.startswith("TUN") else "Rack")
+def location_aisle(loc:str)->str:
+    # racks 12203704 -> 122, TUN12309 -> TUN, bulk H030 -> H; anything else is its own aisle
+    s=(loc or "").strip().upper()
+    if re.fullmatch(r"\d{8}", s): return s[:3]
+    if s.startswith("TUN"): return "TUN"
+    m=re.match(r"([A-Z]+)\d", s)
+    return m.group(1) if m else s
+
+class CoverageIndex:
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.reset()
+    def reset(self):
+        self.cursor={}; self.sig=None
+        self.loc={}; self.pallet={}; self.days={}   # loc key -> ISO, loc+pallet key -> ISO, local day -> {loc keys}
+    def apply(self, subs:pd.DataFrame):
+        if subs.empty: return
+        day=parse_ts_series(subs["timestamp_utc"], subs.get("timestamp")).dt.tz_localize(None).to_numpy().astype("datetime64[D]").astype(str)
+        d=pd.DataFrame({"l":subs["location"].astype(str).str.strip().str.lower(), "p":subs["pallet_id"].astype(str).str.strip().str.lower(),
+                        "t":subs["timestamp_utc"].astype(str), "d":day}).replace({"d":{"NaT":""}})
+        d=d[(d["l"]!="") & (d["t"]!="")].sort_values("t", kind="stable")   # ISO text sorts chronologically
+        last=d.drop_duplicates("l", keep="last")
+        for k,t in zip(last["l"], last["t"]):
+            if t>self.loc.get(k,""): self.loc[k]=t
+        pl=d[d["p"]!=""]
+        pl=pl.assign(k=pl["l"]+_KSEP+pl["p"]).drop_duplicates("k", keep="last")
+        for k,t in zip(pl["k"], pl["t"]):
+            if t>self.pallet.get(k,""): self.pallet[k]=t
+        for day,keys in d[d["d"]!=""].groupby("d")["l"]:
+            self.days.setdefault(day, set()).update(keys)
+    def refresh(self):
+        # catch up with rows appended by any process since the last call; rebuild if the file was rewritten
+        with self.lock:
+            sig=_sig_or_none(PATHS["subs"])
+            if sig is not None and sig==self.sig: return self
+            with timed("coverage.refresh") as rec:
+                new, cur, full = _subs_since(self.cursor)
+                if full is not None: self.reset(); new=full
+                self.apply(new); self.cursor=cur; self.sig=sig
+                if rec: rec.update(rows=len(new), full=full is not None)
+        return self
+
+def coverage_index()->CoverageIndex:
+    return _site_object("coverage_index", CoverageIndex).refresh()
+
+def _coverage_locs()->pd.DataFrame:
+    # one row per inventory location with zone/aisle; rebuilt only when the inventory file changes
+    def _build():
+        df=pd.DataFrame({"location":inventory_locations()})
+        df=df.assign(key=df["location"].map(_key)).drop_duplicates("key")
+        return df.assign(zone=df["location"].map(location_zone), aisle=df["location"].map(location_aisle)).reset_index(drop=True)
+    fp=PATHS["inv_csv"]
+    return cached_frame(fp, "coverage_locs", _build) if os.path.exists(fp) else pd.DataFrame(columns=["location","key","zone","aisle"])
+
+def coverage_since(days:int)->str:
+    # UTC ISO of local midnight `days` days ago (days=0: today)
+    start,_=day_bounds(now_local()-pd.Timedelta(days=days))
+    return start.tz_convert("UTC").strftime(ISO_FMT)
+
+def coverage_locations(since:str="")->pd.DataFrame:
+    # every inventory location; counted = last count at or after since (UTC ISO, "" = ever)
+    ix=coverage_index(); df=_coverage_locs()
+    if df.empty: return pd.DataFrame(columns=COVERAGE_COLS).astype({"counted":bool})  # no inventory yet
+    last=df["key"].map(ix.loc).fillna("")
+    return df.assign(last_counted_utc=last, counted=(last!="") & (last>=since))[COVERAGE_COLS]
+
+def coverage_pallets(since:str="")->pd.DataFrame:
+    inv=load_cached_inventory()
+    empty=pd.DataFrame(columns=["location","pallet_id","sku","zone","last_counted_utc","counted"]).astype({"counted":bool})
+    if inv.empty or "pallet_id" not in inv.columns: return empty
+    inv=inv[inv["pallet_id"].astype(str).str.strip()!=""]
+    if inv.empty: return empty
+    k=inv["location"].map(_key)+_KSEP+inv["pallet_id"].map(_key)
+    last=k.map(coverage_index().pallet).fillna("")
+    out=inv[["location","pallet_id","sku"]].assign(zone=inv["location"].map(location_zone), last_counted_utc=last, counted=(last!="") & (last>=since))
+    return out[~k.duplicated()].reset_index(drop=True)
+
+def coverage_summary(since:str="", by:str="zone")->pd.DataFrame:
+    # by zone / aisle: locations, counted, uncounted, coverage_pct, plus an "All" row first
+    df=coverage_locations(since)
+    cols=[by,"locations","counted","uncounted","coverage_pct"]
+    if df.empty: return pd.DataFrame(columns=cols)
+    g=df.groupby(by, sort=True)["counted"].agg(locations="size", counted="sum").reset_index()
+    g=pd.concat([pd.DataFrame({by:["All"], "locations":[len(df)], "counted":[int(df["counted"].sum())]}), g], ignore_index=True)
+    g["uncounted"]=g["locations"]-g["counted"]
+    g["coverage_pct"]=(g["counted"]*100/g["locations"]).round(1)
+    return g[cols]
+
+def coverage_by_day(days:int=14)->pd.DataFrame:
+    # distinct inventory locations counted per local day, oldest first
+    ix=coverage_index(); keys=set(_coverage_locs()["key"]); n=len(keys)
+    today=now_local().date()
+    rows=[]
+    for i in range(days-1, -1, -1):
+        d=(today-pd.Timedelta(days=i)).strftime("%Y-%m-%d")
+        c=len(keys.intersection(ix.days.get(d, ()))) if n else 0
+        rows.append({"day":d, "counted":c, "coverage_pct":round(c*100/n,1) if n else 0.0})
+    return pd.DataFrame(rows, columns=["day","counted","coverage_pct"])
+
+def uncounted_locations(since:str="", zone:str=None)->pd.DataFrame:
+    # never-counted first, then oldest last count
+    df=coverage_locations(since)
+    df=df[~df["counted"]]
+    if zone: df=df[df["zone"]==zone]
+    return df.sort_values(["last_counted_utc","location"], kind="stable").drop(columns="counted").reset_index(drop=True)
+
+# ===== Lease sweeper =====
+@perf_op("lease.sweep")
+def sweep_expired_leases()->int:
+    # Revert In Progress rows without a live lock to Assigned in one write; drop expired leases.
+    with WRITE_LOCK:
+        now=time.time()
+        data=_leases_load()
+        live={a for a,l in data.items() if l.get("exp",0)>now}
+        df=read_csv_locked(PATHS["assign"], ASSIGN_COLS)
+        n=0
+        if not df.empty and "status" in df.columns:
+            for c in LOCK_COLS:
+                if c not in df.columns: df[c]=""
+            legacy_exp=pd.to_datetime(df["lock_expires_ts"], format=TS_FMT, errors="coerce")
+            legacy_live=legacy_exp>pd.Timestamp(now_local().replace(tzinfo=None))
+            stale=(df["status"]=="In Progress") & ~df["assignment_id"].isin(live) & ~legacy_live
+            n=int(stale.sum())
+            if n:
+                df.loc[stale,"status"]="Assigned"
+                save_assignments(df, changed=df.loc[stale,"assignment_id"].tolist())
+        if len(live)!=len(data):
+            _leases_save({a:l for a,l in data.items() if a in live})
+        return n
+
+_SWEEPER = {"thread":None}
+def start_lease_sweeper(interval:int=LEASE_SWEEP_SEC):
+    if _SWEEPER["thread"] is not None or interval<=0: return
+    def _loop():
+        while True:
+            for site in SITES:
+                try:
+                    with use_site(site): sweep_expired_leases()
+                except Exception: pass
+            time.sleep(interval)
+    th=threading.Thread(target=_loop, name="cc-lease-sweeper", daemon=True)
+    _SWEEPER["thread"]=th; th.start()
+
+# ===== Warm start =====
+# One background thread per server process parses inventory, locations, assignments and indexes for the
+# first CC_SITE_CACHE_MAX sites (default first) before anyone needs them; other sites load cold.
+# Script runs wait on the site's future (warm_wait) instead of each repeating the same work.
+_WARM = {}   # site -> {"future", "started", "steps":{name: ms}, "ms", "error"}
+_WARM_LOCK = threading.Lock()
+_WARM_STEPS = (
+    ("migrate_ts", migrate_timestamps),
+    ("inventory", load_cached_inventory),
+    ("locations", inventory_locations),
+    ("assignments", load_assignments),
+    ("scan_index", lambda: scan_index().inventory_row("")),
+    ("submissions", lambda: load_submissions(with_ts=True, typed=True)),
+    ("coverage", lambda: coverage_locations()),
+)
+
+def _warm_run(sites:list, states:dict):
+    for site in sites:
+        w=states[site]; t_all=time.perf_counter()
+        try:
+            with use_site(site), timed("warm.site", site=site):
+                for name,fn in _WARM_STEPS:
+                    t0=time.perf_counter(); fn(); w["steps"][name]=round((time.perf_counter()-t0)*1000,1)
+            w["ms"]=round((time.perf_counter()-t_all)*1000,1); w["future"].set_result(True)
+        except Exception as e:
+            w["ms"]=round((time.perf_counter()-t_all)*1000,1); w["error"]=f"{type(e).__name__}: {e}"
+            w["future"].set_exception(e)
+
+def start_warmup(sites:list=None, force:bool=False):
+    # force=True re-warms (e.g. after an inventory upload) even if the site is already ready.
+    # Never more sites than FRAME_CACHE holds: warming past the cap would only evict what was just built.
+    sites=list(SITES) if sites is None else [s for s in sites if s in SITES]
+    sites=sites[:SITE_CACHE_MAX]
+    todo={}
+    with _WARM_LOCK:
+        for site in sites:
+            cur=_WARM.get(site)
+            if cur and not force and (not cur["future"].done() or cur["error"] is None): continue
+            _WARM[site]=todo[site]={"future":Future(), "started":time.time(), "steps":{}, "ms":None, "error":None}
+    if todo: threading.Thread(target=_warm_run, args=(list(todo), todo), name="cc-warmup", daemon=True).start()
+
+def warm_ready(site:str=None)->bool:
+    w=_WARM.get(current_site() if site is None else site)
+    return w is None or w["future"].done()
+
+def warm_wait(site:str=None, timeout:float=WARM_WAIT_SEC)->bool:
+    # True once the site is warm (or was never scheduled / failed: callers then just load cold)
+    w=_WARM.get(current_site() if site is None else site)
+    if w is None: return True
+    try: w["future"].result(timeout=timeout); return True
+    except FutureTimeout: return False
+    except Exception: return True
+
+def warm_status()->list:
+    out=[]
+    for site,w in list(_WARM.items()):
+        f=w["future"]
+        out.append({"site":site or "(default)", "state":("error" if w["error"] else "ready") if f.done() else "warming",
+                    "total_ms":w["ms"], **{f"{k}_ms":v for k,v in w["steps"].items()},
+                    "started":epoch_to_str(w["started"]), "error":w["error"] or ""})
+    return out
+
+if __name__=="__main__":
+    import argparse
+    ap=argparse.ArgumentParser(description="Cycle Counting maintenance commands")
+    sub=ap.add_subparsers(dest="cmd", required=True)
+    m=sub.add_parser("migrate-ts", help="Backfill created_utc / timestamp_utc in the active log dir")
+    m.add_argument("--site", default=None, help="site name (default: every site in CC_SITES)")
+    x=sub.add_parser("export-changes", help="Write submissions / assignment status changes since this consumer's last export")
+    x.add_argument("--consumer", required=True, help="watermark name, e.g. wms")
+    x.add_argument("--out", required=True, help="output directory")
+    x.add_argument("--format", choices=FEED_FORMATS, default="csv")
+    x.add_argument("--site", default=None, help="site name (default: the default site)")
+    x.add_argument("--peek", action="store_true", help="write the files but do not move the watermark")
+    x.add_argument("--reset", action="store_true", help="forget the watermark first (full re-export)")
+    r=sub.add_parser("recounts", help="Create recount assignments for Over/Short submissions since the last run")
+    r.add_argument("--site", default=None, help="site name (default: every site in CC_SITES)")
+    v=sub.add_parser("coverage", help="Coverage % by zone or aisle for locations counted in the last N days")
+    v.add_argument("--days", type=int, default=7)
+    v.add_argument("--by", choices=["zone","aisle"], default="zone")
+    v.add_argument("--uncounted", default=None, help="also write the uncounted locations to this CSV")
+    v.add_argument("--site", default=None, help="site name (default: the default site)")
+    args=ap.parse_args()
+    if args.cmd=="migrate-ts":
+        for site in ([args.site] if args.site is not None else list(SITES)):
+            with use_site(site): print(json.dumps({"site":site, **migrate_timestamps(force=True)}))
+    elif args.cmd=="export-changes":
+        with use_site(args.site):
+            if args.reset: feed_reset(args.consumer)
+            print(json.dumps(feed_export(args.consumer, args.out, args.format, commit=not args.peek)))
+    elif args.cmd=="recounts":
+        for site in ([args.site] if args.site is not None else list(SITES)):
+            with use_site(site): print(json.dumps({"site":site, **generate_recounts()}))
+    elif args.cmd=="coverage":
+        with use_site(args.site):
+            since=coverage_since(max(args.days,1)-1)
+            print(coverage_summary(since, args.by).to_string(index=False))
+            if args.uncounted: uncounted_locations(since).to_csv(args.uncounted, index=False)
+    _writeback_all()  # CLI runs are short-lived: push before exiting
@@ -0,0 +1,112 @@
+# Lightweight timing for hot paths (CSV reads/writes, tab renders, grids).
+# Disabled by default (CC_PERF=1 or the Settings toggle turns it on); when off, timed()
+# returns a shared no-op context so the cost is one function call and a flag check.
+import os, time, json, uuid, threading
+from collections import deque
+
+PERF_LOG_MAX_BYTES = int(os.getenv("CC_PERF_LOG_MAX_BYTES", 5_000_000))
+PERF_LOG_BACKUPS = 3
+_STATE = {"enabled": os.getenv("CC_PERF","0")=="1", "log_path":"", "pending":[]}
+_RING = deque(maxlen=5000)   # recent records, process-wide, for the Diagnostics panel
+_IO = threading.Lock()
+_LOCAL = threading.local()   # Streamlit runs each session's script in its own thread
+
+def configure(log_dir:str):
+    _STATE["log_path"]=os.path.join(log_dir,"perf_log.jsonl") if log_dir else ""
+def set_enabled(on:bool): _STATE["enabled"]=bool(on)
+def is_enabled()->bool: return _STATE["enabled"]
+def log_path()->str: return _STATE["log_path"]
+
+class _Noop:
+    __slots__=()
+    def __enter__(self): return {}
+    def __exit__(self, *exc): return False
+_NOOP=_Noop()
+
+class _Timer:
+    __slots__=("rec","t0")
+    def __init__(self, op, attrs):
+        self.rec={"op":op, "rows":0, "bytes_in":0, "bytes_out":0, "retries":0, **attrs}
+    def __enter__(self):
+        self.t0=time.perf_counter(); return self.rec
+    def __exit__(self, exc_type, *exc):
+        rec=self.rec
+        rec["ms"]=round((time.perf_counter()-self.t0)*1000, 3)
+        rec["ts"]=round(time.time(), 3); rec["run"]=getattr(_LOCAL,"run","")
+        if exc_type is not None: rec["error"]=exc_type.__name__
+        _record(rec)
+        return False
+
+def timed(op:str, **attrs):
+    # with timed("csv.read", path=fp) as rec: ...; rec["rows"]=len(df)
+    if not _STATE["enabled"]: return _NOOP
+    return _Timer(op, attrs)
+
+def perf_op(op:str):
+    def deco(fn):
+        def wrapper(*a, **kw):
+            if not _STATE["enabled"]: return fn(*a, **kw)
+            with _Timer(op, {}): return fn(*a, **kw)
+        wrapper.__name__=fn.__name__; wrapper.__doc__=fn.__doc__; wrapper.__wrapped__=fn
+        return wrapper
+    return deco
+
+def _record(rec:dict):
+    _RING.append(rec)
+    with _IO:
+        _STATE["pending"].append(rec)
+        if len(_STATE["pending"])>=50: _flush_locked()
+
+# Per-rerun grouping: app.py calls begin_run() at the top of each script run
+def begin_run():
+    _LOCAL.run=uuid.uuid4().hex[:8]
+    if _STATE["enabled"]: flush()
+def current_run()->str: return getattr(_LOCAL,"run","")
+
+def flush():
+    with _IO: _flush_locked()
+
+def _flush_locked():
+    pend=_STATE["pending"]; fp=_STATE["log_path"]
+    if not pend or not fp: pend.clear(); return
+    try:
+        if os.path.exists(fp) and os.path.getsize(fp)>PERF_LOG_MAX_BYTES: _rotate(fp)
+        with open(fp,"a",encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, separators=(",",":"), default=str)+"\n" for r in pend))
+    except Exception:
+        pass  # diagnostics must never break a count
+    pend.clear()
+
+def _rotate(fp:str):
+    for i in range(PERF_LOG_BACKUPS-1, 0, -1):
+        src=f"{fp}.{i}"
+        if os.path.exists(src): os.replace(src, f"{fp}.{i+1}")
+    os.replace(fp, fp+".1")
+
+def recent(run:str=None)->list:
+    recs=list(_RING)
+    return [r for r in recs if r.get("run")==run] if run else recs
+
+def clear():
+    _RING.clear()
+    with _IO: _STATE["pending"].clear()
+
+def summary(records:list=None):
+    # p50/p95 wall time plus I/O totals per operation
+    import pandas as pd
+    recs=records if records is not None else list(_RING)
+    cols=["op","count","p50_ms","p95_ms","max_ms","rows","bytes_in","bytes_out","retries"]
+    if not recs: return pd.DataFrame(columns=cols)
+    df=pd.DataFrame(recs)
+    for c in ["rows","bytes_in","bytes_out","retries"]:
+        if c not in df.columns: df[c]=0
+    g=df.groupby("op")
+    out=pd.DataFrame({
+        "count":g["ms"].size(),
+        "p50_ms":g["ms"].quantile(0.5).round(2),
+        "p95_ms":g["ms"].quantile(0.95).round(2),
+        "max_ms":g["ms"].max().round(2),
+        "rows":g["rows"].sum(), "bytes_in":g["bytes_in"].sum(),
+        "bytes_out":g["bytes_out"].sum(), "retries":g["retries"].sum(),
+    }).reset_index()
+    return out[cols].sort_values("p95_ms", ascending=False, ignore_index=True)
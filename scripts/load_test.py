@@ -0,0 +1,170 @@
+# Multi-process load test: N counters hammering one shared log dir through the same cc_core paths as the UI.
+#   python scripts/load_test.py --workers 16 --per-worker 40 [--source <log dir to copy>] [--collide 0.1] [--json]
+# Runs against a temp copy of the log dir (never the live one) and reports throughput, p50/p99 per
+# operation and consistency violations: lost rows, double-submitted assignments, status/lock mismatches.
+import os, sys, ast, json, time, random, shutil, tempfile, argparse, multiprocessing as mp
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def counter_names(n:int)->list:
+    # Same roster as the Assign Counts dropdown (read from app.py without importing Streamlit)
+    names=[]
+    try:
+        tree=ast.parse(open(os.path.join(ROOT,"app.py"),"rb").read())
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(getattr(t,"id","")=="ASSIGN_NAME_OPTIONS" for t in node.targets):
+                names=list(ast.literal_eval(node.value)); break
+    except Exception:
+        pass
+    names=names or [f"Counter{i:02d}" for i in range(1,17)]
+    return [names[i] if i<len(names) else f"{names[i%len(names)]}{i//len(names)+1}" for i in range(n)]
+
+def prepare_dir(source:str, dest:str):
+    if source and os.path.isdir(source):
+        for name in os.listdir(source):
+            fp=os.path.join(source,name)
+            if os.path.isfile(fp) and name.lower().endswith((".csv",".json")): shutil.copy2(fp, os.path.join(dest,name))
+
+def seed(names:list, per_worker:int, shared_locs:int)->list:
+    # per_worker assignments per counter; the first shared_locs locations are shared by every counter (collisions)
+    import cc_core as c
+    disp, iso = c.stamp_pair(); rows=[]
+    for w,name in enumerate(names):
+        for i in range(per_worker):
+            loc = f"LT-SHARED-{i%shared_locs:03d}" if (shared_locs and i<shared_locs) else f"LT-{w:02d}-{i:04d}"
+            rows.append({"assignment_id":c.mk_id("LT"), "assigned_by":"loadtest", "assignee":name, "location":loc,
+                         "pallet_id":f"P-{w:02d}-{i:04d}", "sku":"LT", "expected_qty":str(10+i%7), "priority":"Normal",
+                         "status":"Assigned", "created_ts":disp, "created_utc":iso})
+    c.safe_append_rows(c.PATHS["assign"], rows, c.ASSIGN_COLS)
+    return [r["assignment_id"] for r in rows]
+
+def _ms(t0): return (time.perf_counter()-t0)*1000
+
+def worker(args):
+    me, names, seed_ids, opts = args
+    import cc_core as c
+    rnd=random.Random(f"{opts['seed']}:{me}")
+    lat=defaultdict(list); outcomes=Counter(); acked=[]
+    ids=set(seed_ids)
+    deadline=time.time()+opts["duration"] if opts["duration"] else None
+    while True:
+        if deadline and time.time()>deadline: break
+        t0=time.perf_counter(); df=c.load_assignments(); lat["fetch"].append(_ms(t0))
+        df=df[df["assignment_id"].isin(ids)]
+        if len(df)<len(ids):  # nothing is ever deleted here, so a short read means a half-written file
+            outcomes["torn_read"]+=1; continue
+        df=df[df["status"].isin(["Assigned","In Progress"])]
+        mine=df[df["assignee"]==me]
+        if mine.empty: break
+        # collision: act as a second device for another counter on one of their open assignments
+        user=me; pool=mine
+        if rnd.random()<opts["collide"]:
+            other=df[df["assignee"]!=me]
+            if not other.empty: pool=other; user=None
+        r=pool.iloc[rnd.randrange(len(pool))]
+        user=user or r["assignee"]; aid=r["assignment_id"]
+        t0=time.perf_counter(); ok,code,info=c.claim_assignment(aid, user); lat["lock"].append(_ms(t0))
+        outcomes[f"lock:{code or 'ok'}"]+=1
+        if not ok: continue
+        if rnd.random()<0.2:
+            t0=time.perf_counter(); c.start_or_renew_lock(aid, user); lat["renew"].append(_ms(t0))
+        if opts["think_ms"]: time.sleep(rnd.uniform(0, opts["think_ms"])/1000)
+        t0=time.perf_counter()
+        ok,code,info=c.submit_count({"assignment_id":aid, "assignee":user, "location":r["location"], "pallet_id":r["pallet_id"],
+                                     "sku":r["sku"], "counted_qty":str(rnd.randint(5,20)), "expected_qty":r["expected_qty"],
+                                     "note":f"loadtest {me}", "device_id":f"lt-{me}"})
+        lat["submit"].append(_ms(t0)); outcomes[f"submit:{code or 'ok'}"]+=1
+        if ok: acked.append((info["submission_id"], aid))
+    return {"worker":me, "lat":dict(lat), "outcomes":dict(outcomes), "acked":acked}
+
+def check(seed_ids:list, acked:list, base_subs:int)->dict:
+    import cc_core as c
+    rep={}
+    subs=c.read_csv_fallback(c.PATHS["subs"], report=rep) if os.path.exists(c.PATHS["subs"]) else c.pd.DataFrame(columns=c.SUBMIT_COLS)
+    assign=c.read_csv_fallback(c.PATHS["assign"])
+    leases=c._leases_load(); now=time.time()
+    ids=set(seed_ids); on_file=set(subs["submission_id"])
+    mine=subs[subs["assignment_id"].isin(ids)]
+    per_aid=mine["assignment_id"].value_counts()
+    st=dict(zip(assign["assignment_id"], assign["status"]))
+    submitted=set(mine["assignment_id"])
+    v={
+        "lost_rows": [sid for sid,_ in acked if sid not in on_file],
+        "unacked_rows": sorted(set(mine["submission_id"])-{sid for sid,_ in acked}),
+        "row_count_mismatch": (len(subs)-base_subs)!=len(acked),
+        "double_submitted": per_aid[per_aid>1].index.tolist(),
+        "submitted_not_marked": sorted(a for a in submitted if st.get(a)!="Submitted"),
+        "marked_without_submission": sorted(a for a in ids if st.get(a)=="Submitted" and a not in submitted),
+        "in_progress_without_lease": sorted(a for a in ids if st.get(a)=="In Progress" and leases.get(a,{}).get("exp",0)<=now),
+        "phantom_locks": sorted(a for a in ids if a in leases and st.get(a)=="Submitted"),
+        "missing_assignments": sorted(a for a in ids if a not in st),
+        "malformed_lines": rep.get("bad_lines", []),
+    }
+    return {k:x for k,x in v.items() if x}
+
+def pct(xs:list, p:float)->float:
+    if not xs: return 0.0
+    xs=sorted(xs); k=(len(xs)-1)*p; f=int(k); c=min(f+1,len(xs)-1)
+    return round(xs[f]+(xs[c]-xs[f])*(k-f), 2)
+
+def main():
+    ap=argparse.ArgumentParser(description="Concurrent counter load test against a temp copy of the log dir")
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--per-worker", type=int, default=25, help="assignments seeded per counter")
+    ap.add_argument("--shared-locs", type=int, default=3, help="locations every counter gets an assignment at")
+    ap.add_argument("--collide", type=float, default=0.1, help="chance a step acts as a second device for another counter")
+    ap.add_argument("--think-ms", type=float, default=0, help="max random pause between lock and submit")
+    ap.add_argument("--duration", type=float, default=0, help="stop after N seconds (default: when all work is done)")
+    ap.add_argument("--source", default=None, help="log dir to copy first (default: CYCLE_COUNT_LOG_DIR / BIN_HELPER_LOG_DIR if set)")
+    ap.add_argument("--keep", action="store_true", help="keep the temp dir for inspection")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true")
+    a=ap.parse_args()
+
+    source=a.source or os.getenv("CYCLE_COUNT_LOG_DIR") or os.getenv("BIN_HELPER_LOG_DIR") or ""
+    tmp=tempfile.mkdtemp(prefix="cc_loadtest_")
+    prepare_dir(source, tmp)
+    # workers inherit the environment, so every process resolves the temp dir as its log dir
+    os.environ["CYCLE_COUNT_LOG_DIR"]=tmp; os.environ.pop("CC_SITES", None); os.environ["CC_LEASE_SWEEP_SEC"]="0"
+    import cc_core as c
+    names=counter_names(a.workers)
+    base_subs=len(c.read_csv_fallback(c.PATHS["subs"])) if os.path.exists(c.PATHS["subs"]) else 0
+    seed_ids=seed(names, a.per_worker, a.shared_locs)
+    opts={"collide":a.collide, "think_ms":a.think_ms, "duration":a.duration, "seed":a.seed}
+
+    t0=time.perf_counter()
+    with mp.get_context("spawn").Pool(a.workers) as pool:
+        results=pool.map(worker, [(n, names, seed_ids, opts) for n in names])
+    wall=time.perf_counter()-t0
+
+    lat=defaultdict(list); outcomes=Counter(); acked=[]
+    for r in results:
+        for op,xs in r["lat"].items(): lat[op].extend(xs)
+        outcomes.update(r["outcomes"]); acked.extend(r["acked"])
+    violations=check(seed_ids, acked, base_subs)
+    if outcomes.get("torn_read"): violations["torn_reads"]=outcomes["torn_read"]
+    report={
+        "workers":a.workers, "assignments":len(seed_ids), "wall_s":round(wall,2), "log_dir":tmp,
+        "submits":len(acked), "submits_per_s":round(len(acked)/wall,1) if wall else 0,
+        "ops":{op:{"count":len(xs), "p50_ms":pct(xs,0.5), "p99_ms":pct(xs,0.99), "max_ms":round(max(xs),2)} for op,xs in sorted(lat.items())},
+        "outcomes":dict(sorted(outcomes.items())), "violations":violations, "ok":not violations,
+    }
+    if a.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{a.workers} workers · {len(seed_ids)} assignments · {report['submits']} submits in {report['wall_s']} s ({report['submits_per_s']}/s)")
+        print(f"{'op':<8}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for op,s in report["ops"].items(): print(f"{op:<8}{s['count']:>8}{s['p50_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+        print("outcomes:", ", ".join(f"{k}={v}" for k,v in report["outcomes"].items()))
+        if violations:
+            print("VIOLATIONS:")
+            for k,x in violations.items(): print(f"  {k}: {x if isinstance(x,(bool,int)) else (len(x), x[:5])}")
+        else:
+            print("consistency: OK")
+    if not a.keep: shutil.rmtree(tmp, ignore_errors=True)
+    sys.exit(0 if not violations else 1)
+
+if __name__=="__main__":
+    main()
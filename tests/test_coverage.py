@@ -0,0 +1,34 @@
+# Coverage report on a site that has no inventory loaded yet.
+import importlib, os, sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def core(tmp_path, monkeypatch):
+    monkeypatch.setenv("CYCLE_COUNT_LOG_DIR", str(tmp_path))
+    for k in ("CC_SITES","CC_WRITEBACK_DIR","BIN_HELPER_LOG_DIR"): monkeypatch.delenv(k, raising=False)
+    import cc_core
+    return importlib.reload(cc_core)
+
+def _check_empty(core):
+    since=core.coverage_since(6)
+    assert core.coverage_locations(since).empty
+    assert list(core.coverage_locations(since).columns)==core.COVERAGE_COLS
+    assert core.coverage_summary(since).empty
+    assert core.coverage_pallets(since).empty
+    assert core.uncounted_locations(since).empty
+    assert (core.coverage_by_day(7)["counted"]==0).all()
+
+def test_coverage_without_inventory(core):
+    core.submit_count({"assignee":"Eric", "location":"11100101", "counted_qty":3, "expected_qty":3})
+    _check_empty(core)
+
+def test_coverage_with_empty_inventory(core):
+    core.save_inventory_cache(pd.DataFrame(columns=core.INV_COLS))
+    _check_empty(core)
+
+def test_warmup_ok_without_inventory(core):
+    core.start_warmup(force=True); core.warm_wait()
+    assert [w["error"] for w in core.warm_status()]==[""]